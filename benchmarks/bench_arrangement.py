@@ -0,0 +1,73 @@
+import gc  # Keeping the garbage collector out of the timings, like timeit does
+import time  # Measuring the arrangements
+import argparse  # Getting the arguments from the user
+from concurrent.futures import ProcessPoolExecutor  # Rendering the parts on all of the cores
+
+from random_melody_module import arrangement
+
+"""
+
+        Arrangement Benchmark
+
+Measures the arrangement of many tracks against the sum of its parts - every part rendered alone, with the same
+progression and seed as in the arrangement - so the overhead of putting the tracks together (which should be
+close to nothing) is the difference between them. With workers, the parts are also rendered in parallel.
+
+    python benchmarks/bench_arrangement.py -t 16 -l 1024 -w 4
+
+"""
+
+# Functions:
+
+
+def best_time(function, repeats):
+    """
+    :return: the best time of calling the function, in seconds.
+    """
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    times = []
+    try:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start_time)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures multi-track arrangements against the sum of their parts.")
+    parser.add_argument('-t', '--tracks', type=int, default=16, help="number of tracks in the arrangement")
+    parser.add_argument('-l', '--melody_length', type=int, default=1024, help="the length, in beats")
+    parser.add_argument('-r', '--repeats', type=int, default=5, help="number of runs, the best is shown")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes to measure too")
+
+    args = parser.parse_args()
+
+    parts = [arrangement.DEFAULT_PARTS[track % len(arrangement.DEFAULT_PARTS)] for track in range(args.tracks)]
+    options = dict(scale_type='major', scale_key='C', chords_atmosphere='pop', melody_length=args.melody_length,
+                   seed=0)
+
+    # The same context, channels and seeds as the arrangement, so every part renders the same notes as in it:
+    context, channels, parts_seeds = arrangement.plan_arrangement(parts, **options)
+
+    parts_time = sum(best_time(lambda: arrangement.render_part(part, context, channel, part_seed), args.repeats)
+                     for part, channel, part_seed in zip(parts, channels, parts_seeds))
+    whole_time = best_time(lambda: arrangement.compose_arrangement(parts, **options), args.repeats)
+
+    print("{tracks} tracks of {length} beats: sum of the parts {parts:.2f} ms, arrangement {whole:.2f} ms "
+          "({ratio:.2f}x)".format(tracks=args.tracks, length=args.melody_length, parts=parts_time * 1000,
+                                  whole=whole_time * 1000, ratio=whole_time / parts_time))
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            arrangement.compose_arrangement(parts, executor=executor, **options)  # Starting the workers
+            parallel_time = best_time(lambda: arrangement.compose_arrangement(parts, executor=executor, **options),
+                                      args.repeats)
+        print("arrangement on {workers} workers: {parallel:.2f} ms".format(workers=args.workers,
+                                                                          parallel=parallel_time * 1000))
@@ -0,0 +1,88 @@
+import time  # Measuring the renderings
+import argparse  # Getting the arguments from the user
+from concurrent.futures import ProcessPoolExecutor  # Rendering the tracks on all of the cores
+
+from random_melody_module import random_melody_generator
+from random_melody_module import arrangement
+from random_melody_module import audio_renderer
+
+"""
+
+        Audio Rendering Benchmark
+
+Measures the real-time factor of the audio renderer - the seconds of audio rendered in a second - for a melody
+with its chords and for an arrangement of all the parts. The WAV file is written to a stream that drops it, so
+only the rendering and the PCM conversion are measured.
+
+    python benchmarks/bench_audio_render.py -l 512 -w 4
+
+"""
+
+# Classes:
+
+
+class NullStream(object):
+    """
+    A binary stream that drops everything written to it.
+    """
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+# Functions:
+
+
+def best_time(function, repeats):
+    """
+    :return: the best time of calling the function, in seconds.
+    """
+
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    return min(times)
+
+
+def measure_rendering(name, note_events, args, executor=None):
+    """
+    Prints the real-time factor of rendering the notes.
+    """
+
+    samples_count = audio_renderer.write_wav(note_events, NullStream(), args.sample_rate, executor=executor)
+    render_time = best_time(lambda: audio_renderer.write_wav(note_events, NullStream(), args.sample_rate,
+                                                             executor=executor), args.repeats)
+    audio_seconds = samples_count / float(args.sample_rate)
+
+    print("{name}: {audio:.1f} s of audio in {render:.2f} s - {factor:.1f}x real time".format(
+        name=name, audio=audio_seconds, render=render_time, factor=audio_seconds / render_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the real-time factor of the audio renderer.")
+    parser.add_argument('-l', '--melody_length', type=int, default=512, help="the length, in beats")
+    parser.add_argument('-r', '--repeats', type=int, default=3, help="number of runs, the best is shown")
+    parser.add_argument('--sample_rate', type=int, default=audio_renderer.DEFAULT_SAMPLE_RATE,
+                        help="the samples per second")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes to measure too")
+
+    args = parser.parse_args()
+
+    melody_note_events = random_melody_generator.compose_note_events(melody_length=args.melody_length, seed=0)
+    arrangement_note_events = random_melody_generator.read_midi_file(arrangement.compose_arrangement(
+        arrangement.DEFAULT_PARTS, scale_type='major', scale_key='C', chords_atmosphere='pop',
+        melody_length=args.melody_length, seed=0))
+
+    measure_rendering("melody and chords", melody_note_events, args)
+    measure_rendering("arrangement", arrangement_note_events, args)
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            measure_rendering("arrangement on {workers} workers".format(workers=args.workers),
+                              arrangement_note_events, args, executor)
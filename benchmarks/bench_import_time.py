@@ -0,0 +1,70 @@
+import sys  # Running the measurements with the same interpreter
+import json  # Reading the measurement of every process
+import argparse  # Getting the arguments from the user
+import subprocess  # Measuring every import in a new process, with nothing imported before it
+from statistics import median  # Summarizing the runs
+
+"""
+
+        Import Time Benchmark
+
+Measures the cold start of the generator - importing the module in a new process, and the first generation
+after it - and lists the heavy modules that were imported by the import alone.
+Every run is a new interpreter, so nothing is cached in memory between the runs.
+
+    python benchmarks/bench_import_time.py -n 20
+    python benchmarks/bench_import_time.py -m random_melody_module.batch_generator
+
+"""
+
+# Constants:
+
+HEAVY_MODULES = ('argparse', 'midiutil', 're', 'concurrent.futures', 'json')
+
+# Only the modules of the interpreter's startup are imported before the measured import:
+MEASURE_CODE = '''
+import sys, time
+start_time = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start_time
+heavy_modules = [name for name in {heavy_modules!r} if name in sys.modules]
+from random_melody_module import random_melody_generator
+start_time = time.perf_counter()
+random_melody_generator.generate_bytes(seed=0)
+first_generation_time = time.perf_counter() - start_time
+import json
+print(json.dumps([import_time, first_generation_time, heavy_modules]))
+'''
+
+
+# Functions:
+
+
+def measure_cold_start(module):
+    """
+    :return: the import time and the first generation time in seconds, and the heavy modules the import loaded,
+             measured in a new interpreter.
+    """
+
+    output = subprocess.check_output([sys.executable, '-c', MEASURE_CODE.format(module=module,
+                                                                                 heavy_modules=HEAVY_MODULES)])
+    return json.loads(output.decode())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the cold start of the random melody generator.")
+    parser.add_argument('-n', '--runs', type=int, default=20, help="number of new processes to measure")
+    parser.add_argument('-m', '--module', default='random_melody_module.random_melody_generator',
+                        help="the module to import")
+
+    args = parser.parse_args()
+
+    measurements = [measure_cold_start(args.module) for _ in range(args.runs)]
+    import_times = [import_time for import_time, _, _ in measurements]
+    first_generation_times = [first_generation_time for _, first_generation_time, _ in measurements]
+
+    print("import {module}: median {median:.2f} ms, best {best:.2f} ms".format(
+        module=args.module, median=median(import_times) * 1000, best=min(import_times) * 1000))
+    print("first generation: median {median:.2f} ms, best {best:.2f} ms".format(
+        median=median(first_generation_times) * 1000, best=min(first_generation_times) * 1000))
+    print("heavy modules loaded by the import: {modules}".format(modules=', '.join(measurements[0][2]) or 'none'))
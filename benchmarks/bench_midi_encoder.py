@@ -0,0 +1,72 @@
+import io  # Writing the MIDI files to memory
+import time  # Timing the backends
+import argparse  # Getting the arguments from the user
+
+from random_melody_module import random_melody_generator
+
+"""
+
+        MIDI Encoder Benchmark
+
+Checks that the 'smf' backend writes exactly the same bytes as the 'midiutil' backend,
+and measures how long every backend takes to build and write a single file.
+
+    python benchmarks/bench_midi_encoder.py -n 200 -l 16 1000
+
+"""
+
+
+def encode(midi_backend, seed, melody_length):
+    """
+    :return: the bytes of the MIDI file of the seed, built by the given backend.
+    """
+
+    midi_file = random_melody_generator.compose_midi_file(melody_length=melody_length, seed=seed,
+                                                          midi_backend=midi_backend)
+    output_file = io.BytesIO()
+    midi_file.writeFile(output_file)
+
+    return output_file.getvalue()
+
+
+def check_equivalence(seeds, melody_length):
+    """
+    Raises AssertionError if the backends write different bytes for any of the seeds.
+    """
+
+    for seed in seeds:
+        midiutil_bytes = encode('midiutil', seed, melody_length)
+        smf_bytes = encode('smf', seed, melody_length)
+        assert midiutil_bytes == smf_bytes, "The backends differ for seed {seed}, length {length}".format(
+            seed=seed, length=melody_length)
+
+
+def time_backend(midi_backend, seeds, melody_length):
+    """
+    :return: the average time, in seconds, of composing and writing a single file.
+    """
+
+    start_time = time.perf_counter()
+    for seed in seeds:
+        encode(midi_backend, seed, melody_length)
+
+    return (time.perf_counter() - start_time) / len(seeds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compares the MIDI backends of the random melody generator.")
+    parser.add_argument('-n', '--files', type=int, default=200, help="number of files for every length")
+    parser.add_argument('-l', '--lengths', type=int, nargs='+', default=[16, 128, 1000],
+                        help="the lengths of the melodies, in beats")
+
+    args = parser.parse_args()
+    benchmark_seeds = range(args.files)
+
+    for length in args.lengths:
+        check_equivalence(benchmark_seeds, length)
+
+        midiutil_time = time_backend('midiutil', benchmark_seeds, length)
+        smf_time = time_backend('smf', benchmark_seeds, length)
+
+        print("length {length:>6} beats: midiutil {midiutil:8.3f} ms, smf {smf:8.3f} ms, speedup x{speedup:.2f}".format(
+            length=length, midiutil=midiutil_time * 1000, smf=smf_time * 1000, speedup=midiutil_time / smf_time))
@@ -0,0 +1,78 @@
+import time  # Measuring the latency of every request
+import random  # Choosing the requests of the clients
+import asyncio  # Running the concurrent clients
+import argparse  # Getting the arguments from the user
+from concurrent.futures import ProcessPoolExecutor  # Generating on all of the cores
+
+from random_melody_module.async_service import AsyncMelodyService, ServiceOverloadedError
+
+"""
+
+        Async Service Load Test
+
+Runs many concurrent clients against an AsyncMelodyService, and prints the p50/p99 latency of the requests.
+Some of the requests repeat the seeds of other clients, so the coalescing of identical requests shows too.
+
+    python benchmarks/load_test_async_service.py -c 200 -r 20 -w 4
+
+"""
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    :return: the value at the given percentile (0-100) of an already sorted list.
+    """
+
+    index = min(int(len(sorted_values) * percentile / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run_client(service, requests_count, seeds_count, melody_length, latencies, client_random):
+    for _ in range(requests_count):
+        start_time = time.perf_counter()
+        try:
+            await service.generate(seed=client_random.randrange(seeds_count), melody_length=melody_length)
+        except ServiceOverloadedError:
+            continue
+        latencies.append(time.perf_counter() - start_time)
+
+
+async def run_load_test(clients, requests_count, seeds_count, melody_length, workers, max_queue):
+    executor = ProcessPoolExecutor(workers) if workers else None
+    service = AsyncMelodyService(executor, max_concurrency=workers or None, max_queue=max_queue)
+    latencies = []
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(run_client(service, requests_count, seeds_count, melody_length, latencies,
+                                      random.Random(client)) for client in range(clients)))
+    total_time = time.perf_counter() - start_time
+
+    if executor is not None:
+        executor.shutdown()
+
+    return latencies, total_time, service.stats()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load tests the async generation service.")
+    parser.add_argument('-c', '--clients', type=int, default=100, help="number of concurrent clients")
+    parser.add_argument('-r', '--requests', type=int, default=20, help="number of requests of every client")
+    parser.add_argument('-s', '--seeds', type=int, default=500, help="number of distinct seeds the clients ask for")
+    parser.add_argument('-l', '--melody_length', type=int, default=64, help="the length of the melodies")
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help="number of worker processes, 0 - the default thread executor")
+    parser.add_argument('-q', '--max_queue', type=int, default=100, help="the maximal queue of the service")
+
+    args = parser.parse_args()
+
+    request_latencies, elapsed_time, service_stats = asyncio.run(run_load_test(
+        args.clients, args.requests, args.seeds, args.melody_length, args.workers, args.max_queue))
+    request_latencies.sort()
+
+    print("{count} requests in {seconds:.2f} s ({rate:.0f} requests/s)".format(
+        count=len(request_latencies), seconds=elapsed_time, rate=len(request_latencies) / elapsed_time))
+    if request_latencies:
+        print("latency p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max:.2f} ms".format(
+            p50=get_percentile(request_latencies, 50) * 1000, p99=get_percentile(request_latencies, 99) * 1000,
+            max=request_latencies[-1] * 1000))
+    print(service_stats)
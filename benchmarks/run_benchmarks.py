@@ -0,0 +1,288 @@
+import os  # Getting and checking paths
+import gc  # Keeping the garbage collector out of the timings, like timeit does
+import sys  # Failing the run on regressions
+import json  # Writing the results and reading the baseline
+import time  # Timing the benchmarks
+import random  # Seeding the generation of every benchmark
+import argparse  # Getting the arguments from the user
+import platform  # Recording where the results were measured
+import tempfile  # A folder for the files of the end to end benchmark
+
+from random_melody_module import random_melody_generator, melody_models
+
+"""
+
+        Random Melody Benchmark Suite
+
+Times every stage of the generation - scale lookup, chord progression, melody generation (by every engine and
+melody model), MIDI encoding and the end to end 'main' - over all the scale types, all the atmospheres and
+melody lengths from 16 to 100k beats.
+
+The results are written as JSON, and compared with the stored baseline: any benchmark that got slower than
+the tolerance fails the run, with a non-zero exit code. Every benchmark is compared relative to a fixed
+calibration workload timed right before it, so a machine that is slower (or busier) than the one that stored
+the baseline doesn't fail the run by itself.
+
+    python benchmarks/run_benchmarks.py                    # run and compare with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py -o results.json    # also write the results
+    python benchmarks/run_benchmarks.py --save-baseline    # store the results as the new baseline
+    python benchmarks/run_benchmarks.py -k melody          # run only the benchmarks whose name contains 'melody'
+
+"""
+
+# Constants:
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIRECTORY, 'baseline.json')
+DEFAULT_TOLERANCE = 1.0  # A benchmark that is twice as slow as the baseline is a regression
+
+MELODY_LENGTHS = (16, 256, 4096, 100000)
+ENCODING_LENGTHS = (16, 256, 4096)
+MAIN_LENGTHS = (16, 1024)
+
+REPEATS = 5
+MIN_TIME_PER_REPEAT = 0.05  # Seconds, short benchmarks are run many times in every repeat
+
+
+# Functions:
+
+
+def measure(function, repeats=REPEATS):
+    """
+    Times a function, calling it enough times in every repeat for the timer to be accurate.
+
+    :return: the time of a single call in seconds, the best of the repeats.
+    """
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return measure_calls(function, repeats)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def measure_calls(function, repeats):
+    number = 1
+    while True:
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed_time = time.perf_counter() - start_time
+        if elapsed_time >= MIN_TIME_PER_REPEAT or number >= 1 << 20:
+            break
+        number *= 2
+
+    best_time = elapsed_time / number
+    for _ in range(repeats - 1):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        best_time = min(best_time, (time.perf_counter() - start_time) / number)
+
+    return best_time
+
+
+def calibration_workload():
+    """
+    A fixed pure Python workload - random draws, list building and sorting, like the generators do.
+    """
+
+    calibration_random = random.Random(0)
+    sorted([calibration_random.choice((0.5, 1, 2)) * calibration_random.random() for _ in range(2000)])
+
+
+def get_benchmarks(output_path):
+    """
+    :param output_path: a temporary folder for the files of the end to end benchmarks.
+
+    :return: a list of (name, function) of all of the benchmarks.
+    """
+
+    benchmarks = []
+    scale_types = list(random_melody_generator.SCALES_DICT)
+    atmospheres = list(random_melody_generator.ATMOSPHERE_DICT)
+
+    def scale_lookup(scale_type):
+        for scale_key in random_melody_generator.CHROMATIC_KEYS:
+            random_melody_generator.get_scale_notes(scale_key, scale_type)
+
+    def chord_progressions(scale_types_to_run, atmospheres_to_run):
+        midi_file = random_melody_generator.SMFWriter(2)
+        for scale_type in scale_types_to_run:
+            scale_notes = random_melody_generator.get_scale_notes('C', scale_type)
+            for chords_atmosphere in atmospheres_to_run:
+                random_melody_generator.generate_chord_progression(16, midi_file, 1, scale_notes, chords_atmosphere)
+
+    def melody(melody_engine, melody_length):
+        scale_notes = random_melody_generator.get_scale_notes('C', 'major')
+        random_melody_generator.get_melody_engine(melody_engine)(
+            melody_length, random_melody_generator.SMFWriter(2), 0, scale_notes, random.Random(melody_length))
+
+    def encoding(midi_backend, calls):
+        midi_file = random_melody_generator.MIDI_BACKENDS_DICT[midi_backend](2)
+        for method_name, arguments in calls:
+            getattr(midi_file, method_name)(*arguments)
+        midi_file.writeFile(NullFile())
+
+    def end_to_end(midi_backend, melody_length, output_file=None):
+        random_melody_generator.main(output_path, 'benchmark.mid', 'major', 'C', 'pop', melody_length,
+                                     seed=melody_length, midi_backend=midi_backend, output=output_file)
+
+    for scale_type in scale_types:
+        benchmarks.append(('scale_lookup/{scale_type}'.format(scale_type=scale_type),
+                           lambda scale_type=scale_type: scale_lookup(scale_type)))
+
+    for scale_type in scale_types:
+        benchmarks.append(('chord_progression/scale/{scale_type}'.format(scale_type=scale_type),
+                           lambda scale_type=scale_type: chord_progressions([scale_type], atmospheres)))
+    for chords_atmosphere in atmospheres:
+        benchmarks.append(('chord_progression/atmosphere/{atmosphere}'.format(atmosphere=chords_atmosphere),
+                           lambda chords_atmosphere=chords_atmosphere: chord_progressions(scale_types,
+                                                                                          [chords_atmosphere])))
+
+    for melody_engine in random_melody_generator.MELODY_ENGINES_DICT:
+        for melody_length in MELODY_LENGTHS:
+            benchmarks.append(('melody/{engine}/{length}'.format(engine=melody_engine, length=melody_length),
+                               lambda melody_engine=melody_engine, melody_length=melody_length:
+                               melody(melody_engine, melody_length)))
+
+    for order in melody_models.MARKOV_ORDERS:
+        markov_model = melody_models.MarkovMelodyModel(order)
+        for melody_length in MELODY_LENGTHS:
+            benchmarks.append(('melody/markov{order}/{length}'.format(order=order, length=melody_length),
+                               lambda markov_model=markov_model, melody_length=melody_length:
+                               melody(markov_model, melody_length)))
+
+    # A MIDI file object caches what it wrote, so every call adds the same recorded events to a new one:
+    for melody_length in ENCODING_LENGTHS:
+        recorder = CallsRecorder()
+        recorder.addTrackName(0, 0, "melody")
+        recorder.addTempo(0, 0, random_melody_generator.DEFAULT_BPM)
+        recorder.addTrackName(1, 0, "chords")
+        recorder.addTempo(1, 0, random_melody_generator.DEFAULT_BPM)
+        scale_notes = random_melody_generator.get_scale_notes('C', 'major')
+        random_melody_generator.generate_chord_progression(melody_length, recorder, 1, scale_notes, 'pop')
+        random_melody_generator.generate_random_melody(melody_length, recorder, 0, scale_notes,
+                                                       random.Random(melody_length))
+
+        for midi_backend in random_melody_generator.MIDI_BACKENDS_DICT:
+            benchmarks.append(('encode/{backend}/{length}'.format(backend=midi_backend, length=melody_length),
+                               lambda midi_backend=midi_backend, calls=recorder.calls: encoding(midi_backend, calls)))
+
+    # Writing to the disk is timed once, the disk is too noisy to compare every backend and length on it:
+    for midi_backend in random_melody_generator.MIDI_BACKENDS_DICT:
+        for melody_length in MAIN_LENGTHS:
+            benchmarks.append(('main/{backend}/{length}'.format(backend=midi_backend, length=melody_length),
+                               lambda midi_backend=midi_backend, melody_length=melody_length:
+                               end_to_end(midi_backend, melody_length, NullFile())))
+    benchmarks.append(('main/smf/{length}/disk'.format(length=MAIN_LENGTHS[0]),
+                       lambda: end_to_end('smf', MAIN_LENGTHS[0])))
+
+    return benchmarks
+
+
+class CallsRecorder(object):
+    """
+    Records the calls the generators make to a MIDI file object, to replay them into any backend.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, method_name):
+        return lambda *arguments: self.calls.append((method_name, arguments))
+
+
+class NullFile(object):
+    """
+    A binary file that drops everything written to it, so encoding is timed without the disk.
+    """
+
+    def write(self, data):
+        return len(data)
+
+
+def run_benchmarks(name_filter=None):
+    """
+    :param name_filter: run only the benchmarks whose name contains this string.
+
+    :return: two dicts - benchmark name -> seconds per call,
+             and benchmark name -> seconds per call relative to the calibration workload.
+    """
+
+    results = {}
+    relative_results = {}
+
+    with tempfile.TemporaryDirectory() as output_path:
+        for name, function in get_benchmarks(output_path):
+            if name_filter and name_filter not in name:
+                continue
+            calibration_time = measure(calibration_workload, repeats=3)
+            results[name] = measure(function)
+            relative_results[name] = results[name] / calibration_time
+            print("{name:<45} {milliseconds:12.4f} ms {relative:12.4f} x calibration".format(
+                name=name, milliseconds=results[name] * 1000, relative=relative_results[name]))
+
+    return results, relative_results
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    :param results: benchmark name -> relative time of the current run.
+    :param baseline: benchmark name -> relative time of the baseline.
+    :param tolerance: the allowed slowdown, 1.0 = twice as slow.
+
+    :return: a list of (name, baseline relative time, current relative time) of the benchmarks that regressed.
+    """
+
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        baseline_seconds = baseline.get(name)
+        if baseline_seconds is not None and seconds > baseline_seconds * (1 + tolerance):
+            regressions.append((name, baseline_seconds, seconds))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks every stage of the random melody generator.")
+    parser.add_argument('-o', '--output', help="a path to write the results to, as JSON")
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE_PATH, help="the baseline to compare with")
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="the allowed slowdown before failing, 1.0 = twice as slow")
+    parser.add_argument('-k', '--filter', help="run only the benchmarks whose name contains this string")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+
+    args = parser.parse_args()
+
+    benchmark_results, relative_benchmark_results = run_benchmarks(args.filter)
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'results': benchmark_results,
+              'relative_results': relative_benchmark_results}
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+        print("The baseline was saved to {path}".format(path=args.baseline))
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("There is no baseline at {path}, run with --save-baseline to create one".format(path=args.baseline))
+        sys.exit(0)
+
+    with open(args.baseline) as baseline_file:
+        baseline_results = json.load(baseline_file)['relative_results']
+
+    found_regressions = compare_with_baseline(relative_benchmark_results, baseline_results, args.tolerance)
+    for regression_name, before, after in found_regressions:
+        print("REGRESSION {name}: {before:.4f} -> {after:.4f} x calibration (x{ratio:.2f} slower)".format(
+            name=regression_name, before=before, after=after, ratio=after / before))
+
+    if found_regressions:
+        sys.exit(1)
+    print("No regressions against {path}".format(path=args.baseline))
@@ -0,0 +1,388 @@
+import os  # Getting and checking paths
+import random  # The random generator of every part
+from collections import namedtuple  # The shared context of the parts
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Arrangement
+
+Arranges a chord progression for many parts at once - a melody, block chords, a bass line on the roots of
+the chords, arpeggios, a counter-melody and a drum pattern - every part on its own track and channel.
+
+The progression is chosen once, and then the parts don't depend on each other: every part gets its own random
+generator (drawn from the seed), is rendered to its own track chunk, and the file is the chunks one after the
+other. So the parts can be rendered in parallel by any executor, the file is the same either way, and a file
+of many tracks costs the sum of its parts - there is no merge of all the events.
+
+    midi_bytes = compose_arrangement(('melody', 'bass', 'arpeggio', 'drums'), scale_key='A', seed=7)
+
+    python -m random_melody_module.arrangement -k A -s 7 --parts melody chords bass arpeggio drums -w 4
+
+"""
+
+# Constants:
+
+DEFAULT_PARTS = ('melody', 'chords', 'bass', 'arpeggio', 'counter_melody', 'drums')
+
+MELODY_CHANNEL = 0  # The channel the melody engines write to
+DRUMS_CHANNEL = 9  # The percussion channel of General MIDI
+MIDI_CHANNELS_COUNT = 16
+
+BASS_REGISTER = random_melody_generator.REGISTERS_DICT['bass']
+ARPEGGIO_OCTAVES_UP = 1
+COUNTER_MELODY_OCTAVES_UP = 1
+ARPEGGIO_NOTE_DURATION = 0.5  # Beats
+DRUMS_NOTE_DURATION = 0.25  # Beats
+BEATS_PER_BAR = 4
+
+BASS_VOLUME = 100
+ARPEGGIO_VOLUME = 70
+COUNTER_MELODY_VOLUME = 75
+DRUMS_VOLUME = 90
+
+# General MIDI percussion notes:
+KICK_DRUM = 36
+SNARE_DRUM = 38
+CLOSED_HI_HAT = 42
+OPEN_HI_HAT = 46
+CRASH_CYMBAL = 49
+
+CHANCE_FOR_EXTRA_KICK = 0.3  # 30%
+CHANCE_FOR_OPEN_HI_HAT = 0.2  # 20%
+
+BASS_PATTERNS = ('held', 'beats', 'root_fifth')
+ARPEGGIO_PATTERNS = ('up', 'down', 'up_down')
+
+ArrangementContext = namedtuple('ArrangementContext', ['scale_notes', 'chord_tone_index', 'chord_duration',
+                                                       'melody_length', 'melody_engine', 'chords_voicings',
+                                                       'chord_aware', 'melody_register'])
+
+
+# Functions:
+
+
+def iter_chords(context, chords):
+    """
+    :param chords: the pitches of every chord of the progression (the chords_voicings), or its notes.
+
+    :return: a generator of the (time, duration, chord) of the chords, in order - the last chord takes the beats
+             that are left, and the chords of no beats (of an arrangement shorter than its progression) are skipped.
+    """
+
+    last_chord_position = len(chords) - 1
+    for chord_position, chord in enumerate(chords):
+        if chord_position == last_chord_position:
+            chord_duration = context.chord_tone_index.last_chord_duration
+        else:
+            chord_duration = context.chord_duration
+        if chord_duration > 0:
+            yield chord_position * context.chord_duration, chord_duration, chord
+
+
+def add_melody_part(context, midi_file, track, channel, rng):
+    """
+    The melody, written by a melody engine - the engines always write to the channel of the melody.
+    """
+
+    # Only the options that are used are given, so engines without them still work:
+    melody_options = {}
+    if context.chord_aware:
+        melody_options['chord_tone_index'] = context.chord_tone_index
+    if context.melody_register is not None:
+        melody_options['register'] = context.melody_register
+    random_melody_generator.get_melody_engine(context.melody_engine)(
+        context.melody_length, midi_file, track, context.scale_notes, rng, **melody_options)
+
+
+def add_chords_part(context, midi_file, track, channel, rng):
+    """
+    Block chords, every chord held for its whole duration - like 'generate_chord_progression' writes them.
+    """
+
+    for chord_time, chord_duration, chord_pitches in iter_chords(context, context.chords_voicings):
+        for pitch in chord_pitches:
+            midi_file.addNote(track, channel, pitch, chord_time, chord_duration,
+                              random_melody_generator.DEFAULT_VOLUME)
+
+
+def add_bass_part(context, midi_file, track, channel, rng):
+    """
+    A bass line on the roots of the chords, at the bottom of the bass register - every chord is held, played on
+    every beat, or alternates the root and the fifth, chosen randomly for every chord.
+    The root is the root of the chord even when its voicing is an inversion, and the fifth is above the root,
+    or below it when it is above the bass register.
+    """
+
+    for chord_time, chord_duration, chord_notes in iter_chords(context, context.chord_tone_index.chords):
+        root_pitch = random_melody_generator.get_register_pitches(
+            random_melody_generator.NOTES_PITCH_CLASSES_DICT[chord_notes[0]], BASS_REGISTER)[0]
+        fifth_pitch = root_pitch + 7 if root_pitch + 7 <= BASS_REGISTER[1] else root_pitch - 5
+        pattern = rng.choice(BASS_PATTERNS)
+
+        if pattern == 'held':
+            midi_file.addNote(track, channel, root_pitch, chord_time, chord_duration, BASS_VOLUME)
+            continue
+
+        for beat in range(int(chord_duration)):
+            pitch = fifth_pitch if pattern == 'root_fifth' and beat % 2 else root_pitch
+            midi_file.addNote(track, channel, pitch, chord_time + beat, 1, BASS_VOLUME)
+
+
+def add_arpeggio_part(context, midi_file, track, channel, rng):
+    """
+    The pitches of every voiced chord one after the other, going up, down or up and down - chosen randomly for
+    every chord. The chord is played ARPEGGIO_OCTAVES_UP octaves above its voicing, when it fits in the MIDI pitches.
+    """
+
+    for chord_time, chord_duration, chord_pitches in iter_chords(context, context.chords_voicings):
+        octaves_up = ARPEGGIO_OCTAVES_UP if max(chord_pitches) + 12 * ARPEGGIO_OCTAVES_UP < \
+            random_melody_generator.MIDI_PITCHES_COUNT else 0
+        pitches = sorted(pitch + 12 * octaves_up for pitch in chord_pitches)
+        pattern = rng.choice(ARPEGGIO_PATTERNS)
+        if pattern == 'down':
+            pitches.reverse()
+        elif pattern == 'up_down':
+            pitches = pitches + pitches[-2:0:-1]
+
+        for note_index in range(int(chord_duration / ARPEGGIO_NOTE_DURATION)):
+            midi_file.addNote(track, channel, pitches[note_index % len(pitches)],
+                              chord_time + note_index * ARPEGGIO_NOTE_DURATION, ARPEGGIO_NOTE_DURATION,
+                              ARPEGGIO_VOLUME)
+
+
+def add_counter_melody_part(context, midi_file, track, channel, rng):
+    """
+    A second, softer melody in the register of the melody moved COUNTER_MELODY_OCTAVES_UP octaves up (when it fits
+    in the MIDI pitches) - it plays the notes of the chords on the beats when the arrangement is chord aware.
+    """
+
+    lowest_pitch, highest_pitch = random_melody_generator.get_register(context.melody_register)
+    if highest_pitch + 12 * COUNTER_MELODY_OCTAVES_UP < random_melody_generator.MIDI_PITCHES_COUNT:
+        lowest_pitch += 12 * COUNTER_MELODY_OCTAVES_UP
+        highest_pitch += 12 * COUNTER_MELODY_OCTAVES_UP
+
+    for event in random_melody_generator.iter_random_melody(
+            context.scale_notes, context.melody_length, rng, channel, COUNTER_MELODY_VOLUME,
+            context.chord_tone_index if context.chord_aware else None, (lowest_pitch, highest_pitch)):
+        if event[1] == random_melody_generator.NOTE_EVENT:
+            note_time, _, _, pitch, duration, volume = event
+            midi_file.addNote(track, channel, pitch, note_time, duration, volume)
+
+
+def add_drums_part(context, midi_file, track, channel, rng):
+    """
+    A rock beat - a kick on 1 and 3, a snare on 2 and 4 and closed hi-hats on the eighths, with random extra
+    kicks and open hi-hats, and a crash on every change of chord.
+    """
+
+    total_beats = int(context.melody_length)
+    chords_times = {chord_time for chord_time, _, _ in iter_chords(context, context.chords_voicings)}
+
+    for beat in range(total_beats):
+        beat_in_bar = beat % BEATS_PER_BAR
+
+        if beat in chords_times:
+            midi_file.addNote(track, channel, CRASH_CYMBAL, beat, DRUMS_NOTE_DURATION, DRUMS_VOLUME)
+        midi_file.addNote(track, channel, KICK_DRUM if beat_in_bar % 2 == 0 else SNARE_DRUM, beat,
+                          DRUMS_NOTE_DURATION, DRUMS_VOLUME)
+
+        midi_file.addNote(track, channel, CLOSED_HI_HAT, beat, DRUMS_NOTE_DURATION, DRUMS_VOLUME)
+        if beat_in_bar == BEATS_PER_BAR - 1 and rng.random() < CHANCE_FOR_OPEN_HI_HAT:
+            midi_file.addNote(track, channel, OPEN_HI_HAT, beat + 0.5, DRUMS_NOTE_DURATION, DRUMS_VOLUME)
+        else:
+            midi_file.addNote(track, channel, CLOSED_HI_HAT, beat + 0.5, DRUMS_NOTE_DURATION, DRUMS_VOLUME)
+
+        if beat_in_bar == 1 and rng.random() < CHANCE_FOR_EXTRA_KICK:
+            midi_file.addNote(track, channel, KICK_DRUM, beat + 0.5, DRUMS_NOTE_DURATION, DRUMS_VOLUME)
+
+
+# The parts an arrangement can have - functions of (context, midi_file, track, channel, rng):
+PARTS_DICT = {'melody': add_melody_part,
+              'chords': add_chords_part,
+              'bass': add_bass_part,
+              'arpeggio': add_arpeggio_part,
+              'counter_melody': add_counter_melody_part,
+              'drums': add_drums_part}
+
+
+def get_parts_channels(parts):
+    """
+    :return: the MIDI channel of every part - the melody on the channel of the melody engines, the drums on the
+             percussion channel, and the other parts on the other channels in turn (shared when there are more
+             parts than channels).
+    """
+
+    free_channels = [channel for channel in range(MIDI_CHANNELS_COUNT) if channel not in (MELODY_CHANNEL,
+                                                                                          DRUMS_CHANNEL)]
+    channels = []
+    next_channel_index = 0
+    for part in parts:
+        if part == 'melody':
+            channels.append(MELODY_CHANNEL)
+        elif part == 'drums':
+            channels.append(DRUMS_CHANNEL)
+        else:
+            channels.append(free_channels[next_channel_index % len(free_channels)])
+            next_channel_index += 1
+
+    return channels
+
+
+def render_part(part, context, channel, part_seed):
+    """
+    Renders a single part to a track chunk, runs inside the executor:
+
+    :param part: a key of PARTS_DICT.
+    :param context: the ArrangementContext of the arrangement.
+    :param channel: the MIDI channel of the part.
+    :param part_seed: the seed of the random generator of the part.
+
+    :return: the bytes of the track chunk of the part.
+
+    """
+
+    midi_file = random_melody_generator.SMFWriter(1)
+    midi_file.addTrackName(0, 0, part)
+    PARTS_DICT[part](context, midi_file, 0, channel, random.Random(part_seed))
+
+    return midi_file.track_chunk(0)
+
+
+def plan_arrangement(parts=DEFAULT_PARTS, scale_type=None, scale_key=None, chords_atmosphere=None,
+                     melody_length=random_melody_generator.DEFAULT_MELODY_LENGTH, seed=None, rng=None,
+                     melody_engine='loop', chord_extension=None, voice_leading=False, chord_aware=False,
+                     melody_register=None, chords_register=None):
+    """
+    Chooses everything the parts share - the progression and the channel and the seed of every part:
+
+    The options are the same as the options of 'compose_arrangement'.
+
+    :return: the ArrangementContext, the channels of the parts and the seeds of the parts - rendering every part
+             with 'render_part' gives the track chunks of 'compose_arrangement'.
+
+    """
+
+    unknown_parts = set(parts) - set(PARTS_DICT)
+    if unknown_parts:
+        raise ValueError("Unknown parts: {parts}, please select from: {known_parts}".format(
+            parts=sorted(unknown_parts), known_parts=list(PARTS_DICT)))
+
+    rng = random_melody_generator.get_random_generator(seed, rng)
+
+    if scale_type is None:
+        scale_type = rng.choice(list(random_melody_generator.SCALES_DICT.keys()))
+    if scale_key is None:
+        scale_key = rng.choice(random_melody_generator.CHROMATIC_KEYS)
+    if chords_atmosphere is None:
+        chords_atmosphere = rng.choice(list(random_melody_generator.ATMOSPHERE_DICT.keys()))
+
+    scale_notes = random_melody_generator.get_scale_notes(scale_key, scale_type, rng)
+    chords_list = random_melody_generator.get_progression_chords(scale_notes, chords_atmosphere, rng,
+                                                                 chord_extension)
+    # Every chord gets the same whole number of beats, and the last chord takes the beats that are left:
+    chord_duration, beats_left = divmod(int(melody_length), len(chords_list))
+
+    chord_tone_index = random_melody_generator.ChordToneIndex(chords_list, chord_duration,
+                                                              last_chord_duration=chord_duration + beats_left)
+    # Every pitch once - the notes of an extended chord of a small scale can repeat:
+    chords_voicings = tuple([tuple(dict.fromkeys(chord_pitches)) for chord_pitches
+                             in random_melody_generator.get_progression_pitches(chords_list, voice_leading,
+                                                                                chords_register)])
+
+    context = ArrangementContext(scale_notes, chord_tone_index, chord_duration, melody_length, melody_engine,
+                                 chords_voicings, chord_aware, melody_register)
+
+    channels = get_parts_channels(parts)
+    parts_seeds = [rng.getrandbits(64) for _ in parts]
+
+    return context, channels, parts_seeds
+
+
+def compose_arrangement(parts=DEFAULT_PARTS, scale_type=None, scale_key=None, chords_atmosphere=None,
+                        melody_length=random_melody_generator.DEFAULT_MELODY_LENGTH,
+                        bpm=random_melody_generator.DEFAULT_BPM, seed=None, rng=None, melody_engine='loop',
+                        executor=None, chord_extension=None, voice_leading=False, chord_aware=False,
+                        melody_register=None, chords_register=None):
+    """
+    Arranges a chord progression for many parts, every part on its own track:
+
+    :param parts: the keys of PARTS_DICT of the tracks, in order - a part can repeat, for example 16 parts.
+    :param executor: a concurrent.futures executor to render the parts in parallel, for example a
+                     ProcessPoolExecutor. the parts are rendered one by one in this process by default.
+    The other options are the same as the options of 'random_melody_generator.compose_midi_file' - chord_aware
+    and melody_register are of the melody and the counter-melody parts, and chords_register, chord_extension and
+    voice_leading are of the chords and arpeggio parts (the bass plays the roots, in its own register).
+
+    :return: the bytes of the MIDI file. the same seed (and options) always gives the same bytes,
+             with or without an executor.
+
+    """
+
+    context, channels, parts_seeds = plan_arrangement(parts, scale_type, scale_key, chords_atmosphere, melody_length,
+                                                      seed, rng, melody_engine, chord_extension, voice_leading,
+                                                      chord_aware, melody_register, chords_register)
+
+    if executor is None:
+        track_chunks = [render_part(part, context, channel, part_seed)
+                        for part, channel, part_seed in zip(parts, channels, parts_seeds)]
+    else:
+        track_chunks = list(executor.map(render_part, parts, [context] * len(parts), channels, parts_seeds))
+
+    tempo_track = random_melody_generator.SMFWriter(0)
+    tempo_track.addTempo(0, 0, bpm)
+
+    return random_melody_generator.encode_midi_file([tempo_track.tempo_track_chunk()] + track_chunks)
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user, only the command line needs it
+    from concurrent.futures import ProcessPoolExecutor  # Rendering the parts on all of the cores
+
+    parser = argparse.ArgumentParser(description="Arranges a random chord progression for many parts.")
+    parser.add_argument('-p', "--midi_file_path", default=os.getcwd(), help="the folder to save the MIDI file in")
+    parser.add_argument('-n', '--file_name', default='RandoMArrangement.mid', help="the name of the MIDI file")
+    parser.add_argument('--parts', nargs='+', default=list(DEFAULT_PARTS), choices=list(PARTS_DICT),
+                        help="the parts of the arrangement, in order")
+    parser.add_argument('-k', '--scale_key', help="the key of the scale")
+    parser.add_argument('-t', '--scale_type', help="the type of the scale")
+    parser.add_argument('-a', '--chords_atmosphere', help="the atmosphere of the chord progression")
+    parser.add_argument('-l', '--melody_length', type=int, default=random_melody_generator.DEFAULT_MELODY_LENGTH,
+                        help="the length of the arrangement, in beats")
+    parser.add_argument('-b', '--bpm', type=int, default=random_melody_generator.DEFAULT_BPM, help="the bpm")
+    parser.add_argument('-s', '--seed', type=int, help="a seed, the same seed and options always create the same file")
+    parser.add_argument('-e', '--chord_extension', choices=list(random_melody_generator.CHORD_EXTENSIONS_DICT),
+                        help="extend the chords of the progression, for example 7th, 9th or sus4")
+    parser.add_argument('-v', '--voice_leading', action='store_true',
+                        help="play every chord in the inversion nearest to the chord before it")
+    parser.add_argument('-c', '--chord_aware', action='store_true',
+                        help="play the notes of the chords on the beats of the melody")
+    parser.add_argument('-m', '--melody_register', type=random_melody_generator.parse_register,
+                        help="the pitches of the melody - {registers}, or the lowest and highest pitch, "
+                             "for example 60-84".format(registers=', '.join(random_melody_generator.REGISTERS_DICT)))
+    parser.add_argument('-r', '--chords_register', type=random_melody_generator.parse_register,
+                        help="the pitches of the chords - like the melody register")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="number of worker processes to render the parts in, 1 renders in this process")
+
+    args = parser.parse_args()
+
+    arrangement_options = dict(parts=args.parts, scale_type=args.scale_type, scale_key=args.scale_key,
+                               chords_atmosphere=args.chords_atmosphere, melody_length=args.melody_length,
+                               bpm=args.bpm, seed=args.seed, chord_extension=args.chord_extension,
+                               voice_leading=args.voice_leading, chord_aware=args.chord_aware,
+                               melody_register=args.melody_register, chords_register=args.chords_register)
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as parts_executor:
+            arrangement_bytes = compose_arrangement(executor=parts_executor, **arrangement_options)
+    else:
+        arrangement_bytes = compose_arrangement(**arrangement_options)
+
+    arrangement_path = os.path.join(args.midi_file_path, args.file_name)
+    with open(arrangement_path, 'wb') as arrangement_file:
+        arrangement_file.write(arrangement_bytes)
+    print(arrangement_path)
@@ -0,0 +1,140 @@
+import os  # Getting the number of cores
+import asyncio  # Serving the generation from an event loop
+from functools import partial  # Passing the generation parameters to the executor
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Async Service
+
+An asyncio front end to the generator, for web servers like the RandomMelodySite.
+
+The generation runs in an executor, so the event loop is never blocked. Identical requests that have a seed
+share a single generation while it is in flight, at most 'max_concurrency' generations run at once, and when
+'max_queue' more requests are already waiting, new requests are rejected right away instead of piling up.
+
+    service = AsyncMelodyService()
+    midi_bytes = await service.generate(scale_key='C', chords_atmosphere='happy', seed=42)
+
+"""
+
+# Constants:
+
+DEFAULT_MAX_QUEUE = 100
+
+# The loop of the running coroutine - asyncio.get_running_loop is new in Python 3.7:
+get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+# Classes:
+
+
+class ServiceOverloadedError(RuntimeError):
+    """
+    Raised when the service already has as many requests as it can run and queue, the request should be
+    retried later (for example, answered with HTTP 503).
+    """
+
+
+class AsyncMelodyService(object):
+    """
+    Generates MIDI files for coroutines, with request coalescing, a concurrency limit and load shedding.
+
+    :param executor: the executor to generate in, the default executor of the loop by default.
+                     a ProcessPoolExecutor uses all of the cores.
+    :param max_concurrency: the maximal number of generations running at once, the number of cores by default.
+    :param max_queue: the maximal number of requests waiting for a free generation slot.
+    :param generate_function: the function that generates the bytes, for example a MelodyCache's 'generate_bytes'.
+    """
+
+    def __init__(self, executor=None, max_concurrency=None, max_queue=DEFAULT_MAX_QUEUE,
+                 generate_function=random_melody_generator.generate_bytes):
+        self.executor = executor
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.generate_function = generate_function
+
+        self.semaphore = None  # Created in the event loop, on the first request
+        self.in_flight = {}  # request key -> the task that generates it
+        self.pending = 0  # The requests that are running or waiting to run
+        self.counters = {'requests': 0, 'generated': 0, 'coalesced': 0, 'rejected': 0}
+
+    def stats(self):
+        """
+        :return: a dict of the request counters, and the number of the pending requests.
+        """
+
+        return dict(self.counters, pending=self.pending, in_flight=len(self.in_flight))
+
+    async def generate(self, **parameters):
+        """
+        Generates a MIDI file, the parameters are the parameters of 'random_melody_generator.generate_bytes'.
+
+        :return: the bytes of the MIDI file.
+        :raises ServiceOverloadedError: if the service is full.
+        """
+
+        self.counters['requests'] += 1
+        request_key = get_request_key(parameters)
+
+        if request_key is not None and request_key in self.in_flight:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(self.in_flight[request_key])
+
+        if self.pending >= self.max_concurrency + self.max_queue:
+            self.counters['rejected'] += 1
+            raise ServiceOverloadedError("There are already {pending} pending requests".format(pending=self.pending))
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.pending += 1
+        task = asyncio.ensure_future(self.run(parameters))
+
+        if request_key is not None:
+            self.in_flight[request_key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(request_key, None))
+
+        # Shielded, so a cancelled request doesn't cancel the generation other requests are waiting for:
+        return await asyncio.shield(task)
+
+    async def run(self, parameters):
+        try:
+            async with self.semaphore:
+                loop = get_running_loop()
+                midi_bytes = await loop.run_in_executor(self.executor, partial(self.generate_function, **parameters))
+                self.counters['generated'] += 1
+                return midi_bytes
+        finally:
+            self.pending -= 1
+
+
+# Functions:
+
+
+def get_request_key(parameters):
+    """
+    :return: a hashable key of the request parameters, or None if the request has no seed -
+             a request without a seed is random, so it can't share its result with other requests.
+    """
+
+    if parameters.get('seed') is None or parameters.get('rng') is not None:
+        return None
+
+    return tuple(sorted((name, get_hashable_value(value)) for name, value in parameters.items()))
+
+
+def get_hashable_value(value):
+    """
+    :return: the value, with its lists (and dicts) turned into tuples - the parameters of a JSON request have lists,
+             like a register of [60, 84], and the request key must be hashable.
+    """
+
+    if isinstance(value, (list, tuple)):
+        return tuple(get_hashable_value(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, get_hashable_value(item)) for key, item in value.items()))
+    return value
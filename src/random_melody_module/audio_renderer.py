@@ -0,0 +1,414 @@
+import wave  # Writing the PCM samples as a WAV file
+from collections import namedtuple  # The notes of the rendering
+
+import numpy as np  # Synthesizing all of the notes of a block at once
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Audio Renderer
+
+Renders the notes of a generated melody (or of any MIDI file) to audio, offline - without a synthesizer or a
+sound font. Every note is an oscillator with an envelope, the drums are noise bursts, and the pitch bends of the
+melody bend the notes they start on.
+
+The audio is rendered in blocks of samples: the samples of all the notes that sound in a block are computed
+together in NumPy arrays and summed with one bincount, so there is no loop over the samples or the notes.
+Every block is written to the WAV file as soon as it is rendered, so an hour long piece takes the memory of
+one block. With an executor, the tracks of every block are rendered in parallel and summed.
+
+Needs NumPy - pip install random_melody_generator[audio]
+
+    note_events = random_melody_generator.compose_note_events(scale_key='A', seed=7)
+    write_wav(note_events, 'melody.wav')
+
+    python -m random_melody_module.audio_renderer -k A -s 7 -o melody.wav
+    python -m random_melody_module.audio_renderer -i song.mid -o song.wav -w 4
+
+"""
+
+# Constants:
+
+DEFAULT_SAMPLE_RATE = 44100
+RENDER_BLOCK_SIZE = 2 ** 16  # Samples, about 1.5 seconds
+SAMPLE_WIDTH = 2  # Bytes, 16 bit PCM
+SAMPLE_MAX_VALUE = 2 ** 15 - 1
+
+MASTER_VOLUME = 0.2  # The amplitude of a note in full velocity, so a few notes together don't clip
+ATTACK_TIME = 0.005  # Seconds
+RELEASE_TIME = 0.08  # Seconds, the note keeps sounding after its end
+
+A4_PITCH = 69
+A4_FREQUENCY = 440.0
+PITCH_BEND_RANGE = 2  # Semitones, the default range of General MIDI
+PITCH_WHEEL_CENTER = 8192
+DRUMS_CHANNEL = 9
+
+WAVEFORMS = ('sine', 'triangle', 'square', 'sawtooth', 'noise')
+
+# The waveform and the decay (per second) of every channel - the rest are like the default:
+Instrument = namedtuple('Instrument', ['waveform', 'decay'])
+DEFAULT_INSTRUMENT = Instrument('triangle', 1.0)
+CHANNELS_INSTRUMENTS_DICT = {
+    0: Instrument('triangle', 1.5),  # The melody
+    1: Instrument('sine', 0.5),  # The chords
+    2: Instrument('sawtooth', 3.0),
+    3: Instrument('square', 2.0),
+    DRUMS_CHANNEL: Instrument('noise', 25.0),
+}
+
+# The notes of the rendering, in arrays sorted by the start - times in samples:
+AudioNotes = namedtuple('AudioNotes', ['starts', 'stops', 'durations', 'frequencies', 'amplitudes', 'waveforms',
+                                       'decays', 'tracks'])
+
+
+# Functions:
+
+
+def get_tempo_map(note_events, bpm=None):
+    """
+    :param note_events: the NoteEvents to render.
+    :param bpm: the tempo of the whole piece, or None to use the tempo events of the NoteEvents (or the default bpm
+                if it has none).
+
+    :return: the beats the tempo changes on, the seconds they are at and the seconds per beat from them - as arrays.
+    """
+
+    if bpm is None and note_events.tempo_events:
+        tempos = {}
+        for time, _, tempo, _ in sorted(note_events.tempo_events, key=lambda tempo_event: tempo_event[3]):
+            tempos[time] = tempo  # The last tempo of the same beat wins, like in a MIDI player
+        tempo_beats = np.array(sorted(tempos), dtype=np.float64)
+        beat_seconds = 60.0 / np.array([tempos[time] for time in sorted(tempos)], dtype=np.float64)
+        if tempo_beats[0] > 0:
+            tempo_beats = np.concatenate(([0.0], tempo_beats))
+            beat_seconds = np.concatenate(([60.0 / random_melody_generator.DEFAULT_BPM], beat_seconds))
+    else:
+        tempo_beats = np.zeros(1)
+        beat_seconds = np.array([60.0 / float(bpm or random_melody_generator.DEFAULT_BPM)])
+
+    tempo_seconds = np.concatenate(([0.0], np.cumsum(np.diff(tempo_beats) * beat_seconds[:-1])))
+    return tempo_beats, tempo_seconds, beat_seconds
+
+
+def beats_to_seconds(beats, tempo_map):
+    """
+    :param beats: an array of times in beats.
+    :param tempo_map: the tempo map from get_tempo_map.
+
+    :return: the times in seconds.
+    """
+
+    tempo_beats, tempo_seconds, beat_seconds = tempo_map
+    tempo_indexes = np.searchsorted(tempo_beats, beats, side='right') - 1
+    return tempo_seconds[tempo_indexes] + (beats - tempo_beats[tempo_indexes]) * beat_seconds[tempo_indexes]
+
+
+def get_notes_bends(note_events, starts):
+    """
+    :param note_events: the NoteEvents to render.
+    :param starts: the start of every note, in beats.
+
+    :return: the pitch bend of every note in semitones - the last pitch wheel event of its track and channel
+             before it starts (or at its start).
+    """
+
+    bends = np.zeros(len(starts))
+    if not note_events.bend_times:
+        return bends
+
+    bend_times = np.frombuffer(note_events.bend_times, dtype=np.float64)
+    bend_values = np.frombuffer(note_events.bend_values, dtype=np.int16)
+    bend_keys = (np.frombuffer(note_events.bend_tracks, dtype=np.uint16).astype(np.int64) * 16 +
+                 np.frombuffer(note_events.bend_channels, dtype=np.uint8))
+    note_keys = (np.frombuffer(note_events.tracks, dtype=np.uint16).astype(np.int64) * 16 +
+                 np.frombuffer(note_events.channels, dtype=np.uint8))
+
+    for key in np.unique(bend_keys):
+        key_bends = np.flatnonzero(bend_keys == key)
+        key_bends = key_bends[np.argsort(bend_times[key_bends], kind='stable')]
+        key_notes = np.flatnonzero(note_keys == key)
+        bend_indexes = np.searchsorted(bend_times[key_bends], starts[key_notes], side='right') - 1
+        bent = bend_indexes >= 0
+        bends[key_notes[bent]] = bend_values[key_bends[bend_indexes[bent]]] * PITCH_BEND_RANGE / PITCH_WHEEL_CENTER
+
+    return bends
+
+
+def get_audio_notes(note_events, sample_rate=DEFAULT_SAMPLE_RATE, bpm=None):
+    """
+    Converts the notes of a NoteEvents to the arrays the blocks are rendered from.
+
+    :param note_events: the NoteEvents to render - from compose_note_events, read_midi_file or any generator.
+    :param sample_rate: the samples per second.
+    :param bpm: the tempo, or None to use the tempo events of the NoteEvents.
+
+    :return: an AudioNotes sorted by the start of the notes.
+    """
+
+    starts = np.frombuffer(note_events.starts, dtype=np.float64)
+    durations = np.frombuffer(note_events.durations, dtype=np.float64)
+    pitches = np.frombuffer(note_events.pitches, dtype=np.uint8)
+    velocities = np.frombuffer(note_events.velocities, dtype=np.uint8)
+    channels = np.frombuffer(note_events.channels, dtype=np.uint8)
+    tracks = np.frombuffer(note_events.tracks, dtype=np.uint16)
+
+    tempo_map = get_tempo_map(note_events, bpm)
+    start_seconds = beats_to_seconds(starts, tempo_map)
+    end_seconds = beats_to_seconds(starts + durations, tempo_map)
+
+    instruments = [CHANNELS_INSTRUMENTS_DICT.get(channel, DEFAULT_INSTRUMENT) for channel in range(16)]
+    waveforms = np.array([WAVEFORMS.index(instrument.waveform) for instrument in instruments], dtype=np.int8)
+    decays = np.array([instrument.decay for instrument in instruments])
+
+    frequencies = A4_FREQUENCY * 2 ** ((pitches + get_notes_bends(note_events, starts) - A4_PITCH) / 12.0)
+
+    start_samples = np.round(start_seconds * sample_rate).astype(np.int64)
+    order = np.argsort(start_samples, kind='stable')
+
+    return AudioNotes(starts=start_samples[order],
+                      stops=np.round((end_seconds[order] + RELEASE_TIME) * sample_rate).astype(np.int64),
+                      durations=(end_seconds - start_seconds)[order],
+                      frequencies=frequencies[order],
+                      amplitudes=velocities[order] / 127.0 * MASTER_VOLUME,
+                      waveforms=waveforms[channels[order]],
+                      decays=decays[channels[order]],
+                      tracks=tracks[order])
+
+
+def get_waveform(waveform, phases, sample_indexes):
+    """
+    :param waveform: the index of the waveform in WAVEFORMS.
+    :param phases: the phases of the samples, in cycles.
+    :param sample_indexes: the indexes of the samples in the piece - the noise is a hash of them, so every block
+                           of the same piece gets the same noise.
+
+    :return: the samples of the waveform, between -1 and 1.
+    """
+
+    waveform_name = WAVEFORMS[waveform]
+    if waveform_name == 'sine':
+        return np.sin(2 * np.pi * phases)
+    if waveform_name == 'triangle':
+        return 4 * np.abs(phases - np.floor(phases + 0.5)) - 1
+    if waveform_name == 'square':
+        return np.where(phases - np.floor(phases) < 0.5, 1.0, -1.0)
+    if waveform_name == 'sawtooth':
+        return 2 * (phases - np.floor(phases + 0.5))
+
+    noise = np.sin(sample_indexes * 12.9898) * 43758.5453
+    return 2 * (noise - np.floor(noise)) - 1
+
+
+def render_block(audio_notes, block_start, block_size, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Renders the notes that sound in a block of samples - every sample of every note is computed in the same
+    arrays, and they are summed into the block with one bincount.
+
+    :param audio_notes: an AudioNotes - the notes that don't sound in the block are skipped.
+    :param block_start: the index of the first sample of the block in the piece.
+    :param block_size: the number of samples in the block.
+    :param sample_rate: the samples per second.
+
+    :return: the samples of the block, as an array of floats.
+    """
+
+    segment_starts = np.maximum(audio_notes.starts, block_start)
+    segment_lengths = np.minimum(audio_notes.stops, block_start + block_size) - segment_starts
+    sounding = np.flatnonzero(segment_lengths > 0)
+    if not len(sounding):
+        return np.zeros(block_size)
+
+    segment_starts = segment_starts[sounding]
+    segment_lengths = segment_lengths[sounding]
+    total_length = int(segment_lengths.sum())
+
+    # The note of every sample, and the index of the sample in the piece:
+    sample_notes = np.repeat(sounding, segment_lengths)
+    segment_offsets = np.repeat(segment_starts - (np.cumsum(segment_lengths) - segment_lengths), segment_lengths)
+    sample_indexes = np.arange(total_length) + segment_offsets
+
+    times = (sample_indexes - audio_notes.starts[sample_notes]) / float(sample_rate)  # Seconds from the note start
+    phases = audio_notes.frequencies[sample_notes] * times
+
+    samples = np.empty(total_length)
+    sample_waveforms = audio_notes.waveforms[sample_notes]
+    for waveform in np.unique(sample_waveforms):
+        waveform_samples = sample_waveforms == waveform
+        samples[waveform_samples] = get_waveform(waveform, phases[waveform_samples], sample_indexes[waveform_samples])
+
+    # Attack, decay and release:
+    envelopes = np.minimum(times / ATTACK_TIME, 1.0)
+    envelopes *= np.clip((audio_notes.durations[sample_notes] + RELEASE_TIME - times) / RELEASE_TIME, 0.0, 1.0)
+    envelopes *= np.exp(-audio_notes.decays[sample_notes] * times)
+
+    samples *= envelopes * audio_notes.amplitudes[sample_notes]
+    return np.bincount(sample_indexes - block_start, weights=samples, minlength=block_size)
+
+
+def select_notes(audio_notes, notes):
+    """
+    :return: an AudioNotes of the notes in the given indexes (or mask) only.
+    """
+
+    return AudioNotes(*(field[notes] for field in audio_notes))
+
+
+def index_blocks_notes(audio_notes, total_samples, block_size=RENDER_BLOCK_SIZE):
+    """
+    Indexes the notes by the blocks they sound in - a long note (like a chord of a quarter of the piece) is in
+    every block it spans, so a block never looks at the notes that ended before it.
+
+    :param audio_notes: an AudioNotes from get_audio_notes.
+    :param total_samples: the length of the piece in samples, from get_total_samples.
+    :param block_size: the number of samples in a block.
+
+    :return: the indexes of the notes of every block one after the other, sorted by the block and then by the
+             start of the note - and the offset of the notes of every block in them (one more than the blocks).
+    """
+
+    first_blocks = audio_notes.starts // block_size
+    blocks_spans = np.maximum((audio_notes.stops - 1) // block_size - first_blocks + 1, 0)
+    spans_offsets = np.cumsum(blocks_spans) - blocks_spans
+
+    notes = np.repeat(np.arange(len(blocks_spans)), blocks_spans)
+    blocks = np.repeat(first_blocks - spans_offsets, blocks_spans) + np.arange(len(notes))
+    order = np.argsort(blocks, kind='stable')  # The notes of every block stay sorted by the start
+
+    blocks_count = -(-total_samples // block_size)
+    return notes[order], np.searchsorted(blocks[order], np.arange(blocks_count + 1), side='left')
+
+
+def iter_audio_blocks(audio_notes, sample_rate=DEFAULT_SAMPLE_RATE, block_size=RENDER_BLOCK_SIZE, executor=None):
+    """
+    Renders the piece block by block - only the notes that sound in a block are sent to render it.
+
+    :param audio_notes: an AudioNotes from get_audio_notes.
+    :param sample_rate: the samples per second.
+    :param block_size: the number of samples in a block.
+    :param executor: a concurrent.futures executor to render the tracks of every block in parallel, or None to
+                     render them here. The blocks are the same either way.
+
+    :return: a generator of the blocks, arrays of floats - the last block is cut at the end of the last note.
+    """
+
+    total_samples = get_total_samples(audio_notes)
+    blocks_notes, blocks_offsets = index_blocks_notes(audio_notes, total_samples, block_size)
+    tracks = np.unique(audio_notes.tracks)
+
+    for block_index, block_start in enumerate(range(0, total_samples, block_size)):
+        current_block_size = min(block_size, total_samples - block_start)
+        block_notes = select_notes(
+            audio_notes, blocks_notes[blocks_offsets[block_index]:blocks_offsets[block_index + 1]])
+
+        # Every track is rendered alone and they are summed in order, so the blocks are the same with an executor:
+        tracks_notes = [select_notes(block_notes, block_notes.tracks == track) for track in tracks]
+        render_map = map if executor is None else executor.map
+        tracks_blocks = render_map(render_block, tracks_notes, [block_start] * len(tracks),
+                                   [current_block_size] * len(tracks), [sample_rate] * len(tracks))
+        yield sum(tracks_blocks)
+
+
+def get_total_samples(audio_notes):
+    """
+    :return: the length of the piece in samples - until the release of the last note ends.
+    """
+
+    return int(audio_notes.stops.max()) if len(audio_notes.stops) else 0
+
+
+def to_pcm(block):
+    """
+    :return: the bytes of the block as 16 bit little endian PCM - the samples out of -1 to 1 are clipped.
+    """
+
+    return (np.clip(block, -1.0, 1.0) * SAMPLE_MAX_VALUE).astype('<i2').tobytes()
+
+
+def write_wav(note_events, output, sample_rate=DEFAULT_SAMPLE_RATE, bpm=None, block_size=RENDER_BLOCK_SIZE,
+              executor=None):
+    """
+    Renders the notes to a mono 16 bit WAV file, block by block - only one block is in memory at a time.
+
+    :param note_events: the NoteEvents to render.
+    :param output: the path of the WAV file, or a binary stream to write it to (it doesn't have to be seekable).
+    :param sample_rate: the samples per second.
+    :param bpm: the tempo, or None to use the tempo events of the NoteEvents.
+    :param block_size: the number of samples rendered at once.
+    :param executor: a concurrent.futures executor to render the tracks in parallel, or None.
+
+    :return: the length of the audio, in samples.
+    """
+
+    audio_notes = get_audio_notes(note_events, sample_rate, bpm)
+    total_samples = get_total_samples(audio_notes)
+
+    wav_file = wave.open(output, 'wb')
+    try:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(SAMPLE_WIDTH)
+        wav_file.setframerate(sample_rate)
+        wav_file.setnframes(total_samples)  # The header is right before the first block, so a stream can be used
+        for block in iter_audio_blocks(audio_notes, sample_rate, block_size, executor):
+            wav_file.writeframesraw(to_pcm(block))
+    finally:
+        wav_file.close()
+
+    return total_samples
+
+
+def render_midi_file(midi_file_path, output, sample_rate=DEFAULT_SAMPLE_RATE, executor=None):
+    """
+    Renders a MIDI file to a WAV file, with the tempo of the MIDI file.
+
+    :param midi_file_path: the path of the MIDI file.
+    :param output: the path of the WAV file, or a binary stream to write it to.
+    :param sample_rate: the samples per second.
+    :param executor: a concurrent.futures executor to render the tracks in parallel, or None.
+
+    :return: the length of the audio, in samples.
+    """
+
+    with open(midi_file_path, 'rb') as midi_file:
+        note_events = random_melody_generator.read_midi_file(midi_file.read())
+
+    return write_wav(note_events, output, sample_rate, executor=executor)
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user
+    from concurrent.futures import ProcessPoolExecutor  # Rendering the tracks on all of the cores
+
+    parser = argparse.ArgumentParser(description="Renders a random melody, or a MIDI file, to a WAV file.")
+    parser.add_argument('-o', '--output', required=True, help="the path of the WAV file")
+    parser.add_argument('-i', '--input', help="a MIDI file to render instead of generating a melody")
+    parser.add_argument('-k', '--scale_key', help="the key of the scale", default=None)
+    parser.add_argument('-t', '--scale_type', help="the type of the scale", default=None)
+    parser.add_argument('-a', '--chords_atmosphere', help="the atmosphere of the chords", default=None)
+    parser.add_argument('-l', '--melody_length', type=int, help="the length of the melody, in beats",
+                        default=random_melody_generator.DEFAULT_MELODY_LENGTH)
+    parser.add_argument('-b', '--bpm', type=int, help="the bpm of the melody",
+                        default=random_melody_generator.DEFAULT_BPM)
+    parser.add_argument('-s', '--seed', type=int, help="the seed of the random generator", default=None)
+    parser.add_argument('-r', '--sample_rate', type=int, help="the samples per second", default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument('-w', '--workers', type=int, help="number of worker processes for the tracks", default=1)
+
+    args = parser.parse_args()
+
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        if args.input:
+            samples_count = render_midi_file(args.input, args.output, args.sample_rate, executor)
+        else:
+            generated_note_events = random_melody_generator.compose_note_events(
+                scale_type=args.scale_type, scale_key=args.scale_key, chords_atmosphere=args.chords_atmosphere,
+                melody_length=args.melody_length, bpm=args.bpm, seed=args.seed)
+            samples_count = write_wav(generated_note_events, args.output, args.sample_rate, executor=executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print("{output}: {seconds:.1f} seconds".format(output=args.output, seconds=samples_count / args.sample_rate))
@@ -0,0 +1,310 @@
+import os  # Getting and checking paths
+import sys  # Reading the specs from the standard input
+import json  # Parsing the specs (one JSON object per line)
+from functools import partial  # The rendering function of the batch, sent to the workers
+from collections import namedtuple  # The result of every rendered spec
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED  # Spreading the work over all cores
+
+from random_melody_module import random_melody_generator
+from random_melody_module import fingerprint_index
+from random_melody_module import output_sinks
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Batch Generator
+
+Renders many MIDI files at once, spreading the work over a pool of processes.
+
+Every spec is a dict with the arguments of 'random_melody_generator.main':
+scale_key, scale_type, chords_atmosphere, melody_length, bpm, file_name and seed.
+The options a spec doesn't set will be chosen randomly, separately for every spec.
+
+When you execute the program at the command line you can pass it as arguments:
+
+                        specs - a file with one JSON spec per line ('-' for the standard input).
+                        -n - Number of random specs to generate (instead of the specs file).
+                        -p - Path to save the midi files.
+                        -w - Number of Worker processes.
+                        -u - Unique names, the files are numbered after the files already in the folder,
+                             so batches (and processes) writing to the same folder never overwrite each other.
+                             the number of the next file is kept in a hidden file in the folder.
+                        -s - Shard size, the number of files in every subfolder (000000, 000001, ...).
+                        -f - Fingerprint index, a database of the melodies generated so far - a spec whose
+                             melody is a duplicate (exact or near) of one in the index is skipped.
+                        -d - Duplicate attempts, the number of times a duplicate melody is composed again
+                             (with a new seed) before its spec is skipped.
+                        -o - Output file, a .zip archive or a .shard file to pack all the MIDI files into,
+                             instead of a file for every melody (see 'output_sinks'). a name that is in the
+                             file already is an error, use -u to add a batch to a file.
+
+"""
+
+# Constants:
+
+DEFAULT_BASENAME = 'RandoMMelody'
+PENDING_TASKS_PER_WORKER = 4  # How many specs every worker may have waiting, bounds the memory of huge batches.
+
+SPEC_KEYS = ('scale_key', 'scale_type', 'chords_atmosphere', 'melody_length', 'bpm', 'file_name', 'seed',
+             'chord_aware', 'chord_extension', 'voice_leading', 'melody_register', 'chords_register')
+
+# path is the name of the file in a packed sink, and None for a skipped duplicate:
+BatchResult = namedtuple('BatchResult', ['index', 'spec', 'path'])
+
+
+# Functions:
+
+
+def render_spec(midi_file_path, spec, basename=DEFAULT_BASENAME, shard_size=None, fingerprint_index_path=None,
+                max_attempts=1):
+    """
+    Renders a single spec to a MIDI file, runs inside the worker processes:
+
+    :param midi_file_path: the folder to save the MIDI file in.
+    :param spec: a dict of the arguments of 'main', for example {'scale_key': 'C', 'bpm': 90, 'seed': 7}
+                 a 'file_name' can be in a subfolder, for example '000003/RandoMMelody_3017.mid'.
+    :param basename: the name of the file of a spec without a 'file_name' - it gets a new unique name from
+                     the OutputAllocator of the folder in this process.
+    :param shard_size: the number of files in every subfolder, for the unique names.
+    :param fingerprint_index_path: the path of a fingerprint index to check the melody against (and add it to),
+                                   None to not check for duplicates.
+    :param max_attempts: the number of times to compose a melody that isn't a duplicate.
+
+    :return: the path of the new MIDI file, or None if every attempt composed a duplicate.
+
+    """
+
+    check_spec_keys(spec)
+
+    if not spec.get('file_name'):
+        midi_file_path, file_name = os.path.split(random_melody_generator.get_output_allocator(
+            midi_file_path, basename, 'mid', shard_size).allocate())
+        spec = dict(spec, file_name=file_name)
+    elif os.path.dirname(spec['file_name']):
+        os.makedirs(os.path.join(midi_file_path, os.path.dirname(spec['file_name'])), exist_ok=True)
+
+    if fingerprint_index_path is None:
+        return random_melody_generator.main(midi_file_path, **spec)
+
+    new_midi_file_path = os.path.join(midi_file_path, spec['file_name'])
+    midi_bytes = compose_spec_bytes(spec, fingerprint_index_path, max_attempts, new_midi_file_path)
+
+    if midi_bytes is None:
+        if os.path.exists(new_midi_file_path) and not os.path.getsize(new_midi_file_path):
+            os.remove(new_midi_file_path)  # The name claimed by the OutputAllocator
+        return None
+
+    with open(new_midi_file_path, 'wb') as output_file:
+        output_file.write(midi_bytes)
+
+    return new_midi_file_path
+
+
+def compose_spec_bytes(spec, fingerprint_index_path=None, max_attempts=1, name=None):
+    """
+    Composes a single spec in memory, runs inside the worker processes - the parent writes it to the output sink:
+
+    :param spec: a dict of the arguments of 'main', its 'file_name' is only the name in the fingerprint index.
+    :param fingerprint_index_path: the path of a fingerprint index to check the melody against (and add it to),
+                                   None to not check for duplicates.
+    :param max_attempts: the number of times to compose a melody that isn't a duplicate.
+    :param name: the name of the melody in the fingerprint index, its 'file_name' by default.
+
+    :return: the bytes of the MIDI file, or None if every attempt composed a duplicate.
+
+    """
+
+    check_spec_keys(spec)
+    options = dict(spec)
+    file_name = options.pop('file_name', None)
+
+    if fingerprint_index_path is None:
+        return random_melody_generator.generate_bytes(**options)
+
+    try:
+        return fingerprint_index.generate_unique_bytes(fingerprint_index.get_fingerprint_index(fingerprint_index_path),
+                                                       max_attempts, name=name or file_name, **options)
+    except fingerprint_index.DuplicateMelodyError:
+        return None
+
+
+def check_spec_keys(spec):
+    """
+    :raises ValueError: if the spec has keys that aren't in SPEC_KEYS.
+    """
+
+    unknown_keys = set(spec) - set(SPEC_KEYS)
+    if unknown_keys:
+        raise ValueError("Unknown spec keys: {keys}".format(keys=sorted(unknown_keys)))
+
+
+def generate_batch(specs, midi_file_path=None, workers=None, basename=DEFAULT_BASENAME, unique_names=False,
+                   shard_size=None, fingerprint_index_path=None, max_attempts=1, output_sink=None):
+    """
+    Renders every spec to its own MIDI file, using a pool of processes:
+
+    :param specs: an iterable of spec dicts, it is consumed lazily so it can be a generator of any size.
+    :param midi_file_path: the folder to save the MIDI files in, the current working directory by default.
+    :param workers: the number of worker processes, all of the cores by default. 1 renders in this process.
+    :param basename: the name of the files of specs without a 'file_name', for example: RandoMMelody_17.mid
+    :param unique_names: False to name the files by the index of their spec (replacing the files of an earlier
+                         batch), True to number them after the files that are in the folder already - claimed
+                         atomically, so any number of batches can write to the same folder at once.
+    :param shard_size: the number of files in every subfolder (000000, 000001, ...), None for a flat folder.
+    :param fingerprint_index_path: the path of a fingerprint index (see 'fingerprint_index') shared by the workers,
+                                   to skip the specs whose melodies are duplicates of melodies generated before.
+    :param max_attempts: the number of times to compose the melody of a spec until it isn't a duplicate.
+    :param output_sink: an OutputSink (see 'output_sinks') to write all the files to, instead of midi_file_path -
+                        the workers compose the files in memory, and this process writes them to the sink in
+                        buffered batches. The sink isn't closed.
+
+    :return: a generator of BatchResult(index, spec, path), in the order the files are finished.
+             at most 'PENDING_TASKS_PER_WORKER' specs per worker are in flight at any moment.
+
+    """
+
+    if midi_file_path is None:
+        midi_file_path = os.getcwd()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if unique_names and output_sink is None:
+        named_specs = enumerate(specs)  # The workers name the files
+    else:
+        # Named before they are sent to the workers, so a name the sink has fails before its melody is composed:
+        named_specs = ((index, name_spec(index, spec, basename, unique_names, shard_size, output_sink))
+                       for index, spec in enumerate(specs))
+
+    # The workers write the files to the folder, or compose them for this process to write to the sink:
+    if output_sink is None:
+        render = partial(render_spec, midi_file_path, basename=basename, shard_size=shard_size,
+                         fingerprint_index_path=fingerprint_index_path, max_attempts=max_attempts)
+    else:
+        render = partial(compose_spec_bytes, fingerprint_index_path=fingerprint_index_path,
+                         max_attempts=max_attempts)
+
+    def finish(index, spec, result):
+        if output_sink is not None and result is not None:
+            result = output_sink.write(spec['file_name'], result)
+        return BatchResult(index, spec, result)
+
+    if workers == 1:
+        for index, spec in named_specs:
+            yield finish(index, spec, render(spec))
+        return
+
+    max_pending = workers * PENDING_TASKS_PER_WORKER
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}  # future -> (index, spec)
+
+        for index, spec in named_specs:
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    done_index, done_spec = pending.pop(future)
+                    yield finish(done_index, done_spec, future.result())
+
+            pending[executor.submit(render, spec)] = (index, spec)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                done_index, done_spec = pending.pop(future)
+                yield finish(done_index, done_spec, future.result())
+
+
+def name_spec(index, spec, basename=DEFAULT_BASENAME, unique_names=False, shard_size=None, output_sink=None):
+    """
+    :return: the spec with its file name - its own name, a unique name of the sink (with unique_names), or the name
+             of its index. the name is claimed in the sink, so it is never written twice.
+
+    :raises output_sinks.DuplicateNameError: if the sink has a file of the name.
+    """
+
+    file_name = spec.get('file_name')
+    if not file_name and unique_names:
+        return dict(spec, file_name=output_sink.get_unique_name(basename))
+    if not file_name:
+        file_name = get_index_file_name(basename, index, shard_size)
+    if output_sink is not None:
+        file_name = output_sink.claim_name(file_name)
+
+    return dict(spec, file_name=file_name)
+
+
+def get_index_file_name(basename, index, shard_size=None):
+    """
+    :return: the file name of the spec of the index, in the subfolder of its shard when there is a shard size.
+    """
+
+    file_name = "{basename}_{index}.mid".format(basename=basename, index=index)
+    if shard_size is None:
+        return file_name
+    return os.path.join('{shard:06d}'.format(shard=index // shard_size), file_name)
+
+
+def read_specs(specs_file):
+    """
+    Reads the specs from a file that has one JSON object per line, skipping empty lines:
+
+    :param specs_file: an opened text file.
+
+    :return: a generator of spec dicts.
+
+    """
+
+    for line in specs_file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user, only the command line needs it
+
+    parser = argparse.ArgumentParser(description="Renders many random melodies at once, on all of the cores.")
+    parser.add_argument('specs', nargs='?', help="a file with one JSON spec per line, '-' for the standard input")
+    parser.add_argument('-n', '--count', type=int, help="number of random specs to render instead of a specs file")
+    parser.add_argument('-p', "--midi_file_path", help="Path to save the midi files of the auto-generated music."
+                                                       "default path - your current working directory.",
+                        default=os.getcwd())
+    parser.add_argument('-w', '--workers', type=int, help="number of worker processes, default - all of the cores")
+    parser.add_argument('-u', '--unique_names', action='store_true',
+                        help="number the files after the files in the folder, instead of by their spec - the "
+                             "number of the next file is kept in a hidden file in the folder (.RandoMMelody.mid.next)")
+    parser.add_argument('-s', '--shard_size', type=int, help="number of files in every subfolder")
+    parser.add_argument('-f', '--fingerprint_index', help="path of a fingerprint index, to skip duplicate melodies")
+    parser.add_argument('-d', '--duplicate_attempts', type=int, default=1,
+                        help="number of times to compose a melody until it isn't a duplicate")
+    parser.add_argument('-o', '--output_file', help="a .zip or .shard file to pack the MIDI files into")
+
+    args = parser.parse_args()
+
+    if args.count is not None:
+        batch_specs = ({} for _ in range(args.count))
+    elif args.specs == '-':
+        batch_specs = read_specs(sys.stdin)
+    elif args.specs:
+        batch_specs = read_specs(open(args.specs))
+    else:
+        parser.error("either a specs file or -n is required")
+
+    if args.output_file is not None and output_sinks.get_sink_kind(args.output_file) == 'directory':
+        parser.error("the output file must be a .zip or a .shard file")
+    batch_output_sink = output_sinks.get_output_sink(args.output_file) if args.output_file else None
+
+    try:
+        for result in generate_batch(batch_specs, args.midi_file_path, args.workers, unique_names=args.unique_names,
+                                     shard_size=args.shard_size, fingerprint_index_path=args.fingerprint_index,
+                                     max_attempts=args.duplicate_attempts, output_sink=batch_output_sink):
+            if result.path is None:
+                print("spec {index} skipped, its melody is a duplicate".format(index=result.index), file=sys.stderr)
+            else:
+                print(result.path)
+    except output_sinks.DuplicateNameError as error:
+        parser.error("{error} - use -u to number the files after the files in it".format(error=error))
+    finally:
+        if batch_output_sink is not None:
+            batch_output_sink.close()
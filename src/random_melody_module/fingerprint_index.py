@@ -0,0 +1,393 @@
+import os  # Getting and checking paths
+import random  # The fixed permutations of the MinHash signatures
+import struct  # Packing the signatures and the hashed tokens
+import sqlite3  # The index on the disk
+import hashlib  # Stable hashes, the same in every process and Python version
+from collections import namedtuple  # The fingerprints and the results of the checks
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Fingerprint Index
+
+Finds the melodies that were generated before - exactly, or nearly (a few notes apart).
+
+The fingerprint of a melody doesn't depend on its key or tempo: the melody is read as tokens of
+(interval from the note before, time from the note before, duration), in beats, and its n-grams are hashed.
+The hash of all the tokens finds exact duplicates, and a MinHash signature of the n-grams estimates how many
+n-grams two melodies share (their Jaccard similarity) - so a melody moved to another key, or with a note
+changed, is still found.
+
+The fingerprints are kept in SQLite: the exact hashes and the bands of the signatures (locality-sensitive
+hashing) are indexed, so a check is a few index lookups and comparing the signatures of the few candidates,
+however many melodies are in the index. Worker processes can share an index file.
+
+    fingerprint_index = FingerprintIndex('melodies.db')
+    note_events, check = compose_unique_note_events(fingerprint_index, max_attempts=10, scale_key='C')
+
+    python -m random_melody_module.fingerprint_index melodies.db path/to/midi/files
+
+"""
+
+# Constants:
+
+DEFAULT_NGRAM_SIZE = 4  # Tokens, a token is a note and the note before it
+SIGNATURE_SIZE = 64  # MinHash values
+BAND_SIZE = 4  # MinHash values in every band of the index, SIGNATURE_SIZE / BAND_SIZE bands
+DEFAULT_SIMILARITY_THRESHOLD = 0.7  # The estimated Jaccard similarity of near duplicates
+DEFAULT_MAX_ATTEMPTS = 10  # Generations of a melody until it isn't a duplicate
+
+TICKS_PER_BEAT = 12  # The times of the tokens are rounded to 1/12 beat, so triplets are kept
+MIDI_FILE_MELODY_TRACK = 1  # In the files of the generator track 0 is the tempo track
+
+MERSENNE_PRIME = 2 ** 61 - 1
+HASH_SIZE = 8  # Bytes
+
+# The permutations (a * hash + b) % MERSENNE_PRIME of the signature - fixed, so every index can read every other:
+_permutations_generator = random.Random(0)
+SIGNATURE_PERMUTATIONS = tuple((_permutations_generator.randrange(1, MERSENNE_PRIME),
+                                _permutations_generator.randrange(0, MERSENNE_PRIME))
+                               for _ in range(SIGNATURE_SIZE))
+SIGNATURE_STRUCT = struct.Struct('<{size}Q'.format(size=SIGNATURE_SIZE))
+TOKEN_STRUCT = struct.Struct('<hII')  # interval, time from the note before, duration
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS melodies (
+    id INTEGER PRIMARY KEY,
+    exact_hash INTEGER NOT NULL,
+    signature BLOB NOT NULL,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS melodies_exact_hash ON melodies (exact_hash);
+CREATE TABLE IF NOT EXISTS bands (
+    band_hash INTEGER NOT NULL,
+    melody_id INTEGER NOT NULL,
+    PRIMARY KEY (band_hash, melody_id)
+) WITHOUT ROWID;
+'''
+
+# tokens_count is 0 for a melody of fewer than 2 notes - it has no intervals, so it is never a duplicate:
+Fingerprint = namedtuple('Fingerprint', ['exact_hash', 'signature', 'tokens_count'])
+
+# kind is None for a new melody, 'exact' or 'near' for a duplicate of the melody with the id:
+DuplicateCheck = namedtuple('DuplicateCheck', ['kind', 'melody_id', 'similarity'])
+NOT_DUPLICATE = DuplicateCheck(None, None, 0.0)
+
+fingerprint_indexes = {}  # path -> FingerprintIndex, the open indexes of this process
+
+
+# Classes:
+
+
+class DuplicateMelodyError(RuntimeError):
+    """
+    Raised when every attempt to generate a melody generated a duplicate of a melody in the index.
+    """
+
+
+class FingerprintIndex(object):
+    """
+    The fingerprints of the melodies generated so far, in an SQLite database.
+
+    Every check is atomic with adding the melody ('check_and_add'), so processes sharing the index file never
+    both add the same melody.
+    """
+
+    def __init__(self, path=':memory:', similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 ngram_size=DEFAULT_NGRAM_SIZE):
+        """
+        :param path: the path of the database file, ':memory:' for an index that isn't saved.
+        :param similarity_threshold: the estimated Jaccard similarity of the n-grams (0 to 1) from which
+                                     a melody is a near duplicate.
+        :param ngram_size: the number of tokens in every n-gram - an index should always use the same size.
+        """
+
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.ngram_size = ngram_size
+
+        # Autocommit, the transactions are explicit - and WAL, so readers don't wait for the writers:
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM melodies').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fingerprint(self, note_events, track=0):
+        """
+        :return: the Fingerprint of the melody in the track of the NoteEvents, with the n-grams of this index.
+        """
+
+        return get_melody_fingerprint(note_events, track, self.ngram_size)
+
+    def check(self, fingerprint):
+        """
+        Looks for a melody with the same fingerprint, or a similar one:
+
+        :param fingerprint: a Fingerprint, from 'fingerprint'.
+
+        :return: a DuplicateCheck - an exact duplicate first, or else the most similar near duplicate.
+        """
+
+        if not fingerprint.tokens_count:  # Every melody of fewer than 2 notes has the same (empty) tokens
+            return NOT_DUPLICATE
+
+        exact_match = self.connection.execute('SELECT id FROM melodies WHERE exact_hash = ? LIMIT 1',
+                                              (fingerprint.exact_hash,)).fetchone()
+        if exact_match is not None:
+            return DuplicateCheck('exact', exact_match[0], 1.0)
+
+        band_hashes = get_band_hashes(fingerprint.signature)
+        candidates = self.connection.execute(
+            'SELECT id, signature FROM melodies WHERE id IN '
+            '(SELECT DISTINCT melody_id FROM bands WHERE band_hash IN ({marks}))'.format(
+                marks=', '.join('?' * len(band_hashes))), band_hashes).fetchall()
+
+        best_check = NOT_DUPLICATE
+        for melody_id, signature in candidates:
+            similarity = get_similarity(fingerprint.signature, SIGNATURE_STRUCT.unpack(signature))
+            if similarity >= self.similarity_threshold and similarity > best_check.similarity:
+                best_check = DuplicateCheck('near', melody_id, similarity)
+
+        return best_check
+
+    def add(self, fingerprint, name=None):
+        """
+        Adds a melody to the index, even if it is a duplicate.
+
+        :return: the id of the melody in the index.
+        """
+
+        cursor = self.connection.execute('INSERT INTO melodies (exact_hash, signature, name) VALUES (?, ?, ?)',
+                                         (fingerprint.exact_hash, SIGNATURE_STRUCT.pack(*fingerprint.signature),
+                                          name))
+        melody_id = cursor.lastrowid
+        if not fingerprint.tokens_count:  # Never a candidate of a near duplicate
+            return melody_id
+        self.connection.executemany('INSERT OR IGNORE INTO bands (band_hash, melody_id) VALUES (?, ?)',
+                                    ((band_hash, melody_id) for band_hash in get_band_hashes(fingerprint.signature)))
+        return melody_id
+
+    def check_and_add(self, fingerprint, name=None):
+        """
+        Checks the melody, and adds it to the index if it isn't a duplicate - in one transaction.
+
+        :return: the DuplicateCheck, and the id of the melody in the index (of the melody it duplicates, if it does).
+        """
+
+        self.connection.execute('BEGIN IMMEDIATE')  # Locks the writers of other processes before the check
+        try:
+            duplicate_check = self.check(fingerprint)
+            melody_id = duplicate_check.melody_id if duplicate_check.kind else self.add(fingerprint, name)
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+
+        return duplicate_check, melody_id
+
+    def get_name(self, melody_id):
+        """
+        :return: the name the melody was added with, or None.
+        """
+
+        row = self.connection.execute('SELECT name FROM melodies WHERE id = ?', (melody_id,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.connection.close()
+        if fingerprint_indexes.get(self.path) is self:
+            del fingerprint_indexes[self.path]
+
+
+# Functions:
+
+
+def get_melody_tokens(note_events, track=0):
+    """
+    Reads a melody as tokens that don't depend on its key: (interval from the note before, time from the note
+    before, duration) - the times in TICKS_PER_BEAT of a beat.
+
+    :param note_events: a NoteEvents, for example from 'compose_note_events' or 'read_midi_file'.
+    :param track: the track of the melody.
+
+    :return: a list of tokens, one less than the notes of the track (the first note has no note before it).
+    """
+
+    notes = sorted((note_events.starts[note], note_events.pitches[note], note_events.durations[note])
+                   for note in range(len(note_events.starts)) if note_events.tracks[note] == track)
+
+    return [(pitch - previous_pitch, int(round((start - previous_start) * TICKS_PER_BEAT)),
+             int(round(duration * TICKS_PER_BEAT)))
+            for (previous_start, previous_pitch, _), (start, pitch, duration) in zip(notes, notes[1:])]
+
+
+def get_stable_hash(data):
+    """
+    :return: a 64 bit hash of the bytes, as a signed integer (the integers of SQLite are signed).
+    """
+
+    return struct.unpack('<q', hashlib.blake2b(data, digest_size=HASH_SIZE).digest())[0]
+
+
+def get_melody_fingerprint(note_events, track=0, ngram_size=DEFAULT_NGRAM_SIZE):
+    """
+    :param note_events: a NoteEvents, for example from 'compose_note_events' or 'read_midi_file'.
+    :param track: the track of the melody - 0 in a new NoteEvents, MIDI_FILE_MELODY_TRACK in a file that was read.
+    :param ngram_size: the number of tokens in every n-gram.
+
+    :return: the Fingerprint of the melody - the hash of all its tokens, and the MinHash signature of its n-grams.
+    """
+
+    packed_tokens = [TOKEN_STRUCT.pack(interval, time, duration) for interval, time, duration
+                     in get_melody_tokens(note_events, track)]
+
+    ngrams_count = max(len(packed_tokens) - ngram_size + 1, 1)  # A short melody is a single n-gram
+    ngram_hashes = {get_stable_hash(b''.join(packed_tokens[index:index + ngram_size])) % MERSENNE_PRIME
+                    for index in range(ngrams_count)}
+
+    signature = tuple(min((multiplier * ngram_hash + increment) % MERSENNE_PRIME for ngram_hash in ngram_hashes)
+                      for multiplier, increment in SIGNATURE_PERMUTATIONS)
+
+    return Fingerprint(get_stable_hash(b''.join(packed_tokens)), signature, len(packed_tokens))
+
+
+def get_band_hashes(signature):
+    """
+    :return: the hash of every band of the signature - melodies that have a band in common are the candidates
+             of a near duplicate.
+    """
+
+    return [get_stable_hash(struct.pack('<B{size}Q'.format(size=BAND_SIZE), band_start // BAND_SIZE,
+                                        *signature[band_start:band_start + BAND_SIZE]))
+            for band_start in range(0, SIGNATURE_SIZE, BAND_SIZE)]
+
+
+def get_similarity(signature, other_signature):
+    """
+    :return: the estimated Jaccard similarity of the n-grams of two melodies, from 0 to 1.
+    """
+
+    return sum(value == other_value for value, other_value in zip(signature, other_signature)) / float(SIGNATURE_SIZE)
+
+
+def get_fingerprint_index(path, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """
+    :return: the FingerprintIndex of the path in this process, opened on the first call.
+    """
+
+    path = os.path.abspath(path)
+    fingerprint_index = fingerprint_indexes.get(path)
+    if fingerprint_index is None:
+        fingerprint_index = fingerprint_indexes.setdefault(path, FingerprintIndex(path, similarity_threshold))
+    return fingerprint_index
+
+
+def compose_unique_note_events(fingerprint_index, max_attempts=DEFAULT_MAX_ATTEMPTS, seed=None, rng=None,
+                               note_events_factory=None, name=None, **options):
+    """
+    Composes a melody that isn't a duplicate of a melody in the index, and adds it to the index.
+
+    A duplicate is composed again with a new seed (drawn from the seed, so the same seed and index always give
+    the same melody) - the options that are None are chosen again too.
+
+    :param fingerprint_index: a FingerprintIndex.
+    :param max_attempts: the number of compositions until giving up, 1 to never compose again.
+    :param seed: the seed of the first attempt.
+    :param rng: a random generator to draw the seeds of all the attempts from, instead of the seed.
+    :param note_events_factory: a function that returns the NoteEvents to compose into (for example, an SMFWriter
+                                to encode), a new NoteEvents by default.
+    :param name: the name of the melody in the index, for example the path of its file.
+    :param options: the other options of 'random_melody_generator.compose_note_events'.
+
+    :return: the NoteEvents of the melody and the DuplicateCheck of its last attempt - when the check has a kind,
+             every attempt was a duplicate and the melody wasn't added.
+    """
+
+    seeds_generator = random_melody_generator.get_random_generator(seed, rng)
+    attempt_seed = seed if rng is None else seeds_generator.getrandbits(64)
+
+    for _ in range(max_attempts):
+        note_events = random_melody_generator.compose_note_events(
+            seed=attempt_seed, note_events=note_events_factory() if note_events_factory else None, **options)
+        duplicate_check, _ = fingerprint_index.check_and_add(fingerprint_index.fingerprint(note_events), name)
+        if duplicate_check.kind is None:
+            break
+        attempt_seed = seeds_generator.getrandbits(64)
+
+    return note_events, duplicate_check
+
+
+def generate_unique_bytes(fingerprint_index, max_attempts=DEFAULT_MAX_ATTEMPTS, seed=None, rng=None, name=None,
+                          **options):
+    """
+    Composes a melody that isn't a duplicate of a melody in the index, like 'compose_unique_note_events'.
+
+    :return: the bytes of the MIDI file.
+
+    :raises DuplicateMelodyError: if every attempt composed a duplicate.
+    """
+
+    midi_file, duplicate_check = compose_unique_note_events(
+        fingerprint_index, max_attempts, seed, rng, lambda: random_melody_generator.SMFWriter(2), name, **options)
+
+    if duplicate_check.kind is not None:
+        raise DuplicateMelodyError("{attempts} attempts composed duplicates, the last of melody {melody_id}".format(
+            attempts=max_attempts, melody_id=duplicate_check.melody_id))
+
+    return midi_file.to_bytes()
+
+
+def index_midi_files(fingerprint_index, midi_files_path, track=MIDI_FILE_MELODY_TRACK):
+    """
+    Adds the MIDI files of a folder (and its subfolders) to the index.
+
+    :return: a generator of (path, DuplicateCheck) for every file - the duplicates are not added.
+    """
+
+    for directory, _, file_names in os.walk(midi_files_path):
+        for file_name in sorted(file_names):
+            if not file_name.lower().endswith(('.mid', '.midi')):
+                continue
+
+            path = os.path.join(directory, file_name)
+            with open(path, 'rb') as midi_file:
+                note_events = random_melody_generator.read_midi_file(midi_file.read())
+
+            duplicate_check, _ = fingerprint_index.check_and_add(fingerprint_index.fingerprint(note_events, track),
+                                                                 path)
+            yield path, duplicate_check
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user
+
+    parser = argparse.ArgumentParser(description="Indexes folders of MIDI files, and lists the duplicate melodies.")
+    parser.add_argument('index', help="the path of the index database")
+    parser.add_argument('midi_files_paths', nargs='+', help="folders of MIDI files to index")
+    parser.add_argument('-t', '--track', type=int, default=MIDI_FILE_MELODY_TRACK, help="the track of the melody")
+    parser.add_argument('--similarity', type=float, default=DEFAULT_SIMILARITY_THRESHOLD,
+                        help="the similarity of near duplicates, from 0 to 1")
+
+    args = parser.parse_args()
+
+    with FingerprintIndex(args.index, args.similarity) as cli_fingerprint_index:
+        for midi_files_path in args.midi_files_paths:
+            for midi_path, midi_duplicate_check in index_midi_files(cli_fingerprint_index, midi_files_path,
+                                                                    args.track):
+                if midi_duplicate_check.kind is not None:
+                    print("{path}: {kind} duplicate of {original} ({similarity:.0%})".format(
+                        path=midi_path, kind=midi_duplicate_check.kind,
+                        original=cli_fingerprint_index.get_name(midi_duplicate_check.melody_id),
+                        similarity=midi_duplicate_check.similarity))
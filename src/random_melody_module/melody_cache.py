@@ -0,0 +1,280 @@
+import os  # Getting and checking paths
+import json  # Normalizing the generation parameters for hashing
+import hashlib  # Content addressing the cached MIDI files
+import tempfile  # Writing the disk store atomically
+import threading  # Sharing a cache between threads
+from collections import OrderedDict  # The least recently used order of the cached items
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Cache
+
+A cache in front of the generation of MIDI files.
+
+Every MIDI file that has a seed is kept in a bounded in-memory LRU, and optionally in a directory on the disk,
+keyed by a hash of its normalized parameters - the same parameters and seed always give the same bytes.
+
+The chords track depends only on the key, the scale type, the atmosphere, the length and the chord options, so it
+is cached separately: even without a seed, a cache hit only has to generate the melody and splice the cached chords
+to it.
+
+"""
+
+# Constants:
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+CACHE_FORMAT_VERSION = 1  # Change it when the generation changes, so old files on the disk are not used.
+
+
+# Classes:
+
+
+class MelodyCache(object):
+    """
+    A content-addressed LRU cache of rendered MIDI files, and of the chords tracks they share.
+
+    :param max_bytes: the maximal size of all the items in memory, the least recently used are evicted first.
+    :param directory: an optional folder to keep the MIDI files in, so they survive restarts and are shared
+                      between processes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.items = OrderedDict()  # key -> bytes, the least recently used first
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'chords_hits': 0, 'chords_misses': 0,
+                         'evictions': 0}
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def stats(self):
+        """
+        :return: a dict of the hit, miss and eviction counters, and the current size of the memory cache.
+        """
+
+        with self.lock:
+            return dict(self.counters, items=len(self.items), bytes=self.current_bytes)
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.items:
+                self.current_bytes -= len(self.items.pop(key))
+            self.items[key] = value
+            self.current_bytes += len(value)
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted_value = self.items.popitem(last=False)
+                self.current_bytes -= len(evicted_value)
+                self.counters['evictions'] += 1
+
+    def count(self, counter_name):
+        with self.lock:
+            self.counters[counter_name] += 1
+
+    def get_disk_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + '.mid')
+
+    def read_disk(self, digest):
+        try:
+            with open(self.get_disk_path(digest), 'rb') as cached_file:
+                return cached_file.read()
+        except FileNotFoundError:
+            return None
+
+    def write_disk(self, digest, midi_bytes):
+        disk_path = self.get_disk_path(digest)
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+
+        # Writing to a temporary file and renaming it, so other processes never read half a file:
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(disk_path), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as temporary_file:
+            temporary_file.write(midi_bytes)
+        os.replace(temporary_path, disk_path)
+
+    def get_chords_track_chunk(self, scale_key, scale_type, chords_atmosphere, melody_length, chord_extension=None,
+                               voice_leading=False, chords_register=None):
+        """
+        :return: the bytes of the chords track chunk, from the cache or generated and cached.
+        """
+
+        key = ('chords', scale_key, scale_type, chords_atmosphere, melody_length, chord_extension, voice_leading,
+               normalize_register(chords_register))
+        chords_chunk = self.get(key)
+
+        if chords_chunk is not None:
+            self.count('chords_hits')
+            return chords_chunk
+
+        self.count('chords_misses')
+        chords_chunk = render_chords_track_chunk(scale_key, scale_type, chords_atmosphere, melody_length,
+                                                 chord_extension, voice_leading, chords_register)
+        self.put(key, chords_chunk)
+
+        return chords_chunk
+
+    def generate_bytes(self, scale_type=None, scale_key=None, chords_atmosphere=None,
+                       melody_length=random_melody_generator.DEFAULT_MELODY_LENGTH,
+                       bpm=random_melody_generator.DEFAULT_BPM, seed=None, melody_engine='loop', chord_aware=False,
+                       chord_extension=None, voice_leading=False, melody_register=None, chords_register=None):
+        """
+        The same as 'random_melody_generator.generate_bytes', and returns the same bytes for the same seed.
+        A MIDI file is cached as a whole only when it has a seed.
+
+        :return: the bytes of the MIDI file.
+        """
+
+        # A name of a register and its pitches are the same register, and the same key:
+        melody_register = normalize_register(melody_register)
+        chords_register = normalize_register(chords_register)
+
+        rng = random_melody_generator.get_random_generator(seed)
+
+        # Choosing the missing options in the same order as 'compose_midi_file', to get the same melody:
+        if scale_type is None:
+            scale_type = rng.choice(list(random_melody_generator.SCALES_DICT.keys()))
+        if scale_key is None:
+            scale_key = rng.choice(random_melody_generator.CHROMATIC_KEYS)
+        if chords_atmosphere is None:
+            chords_atmosphere = rng.choice(list(random_melody_generator.ATMOSPHERE_DICT.keys()))
+
+        # Unknown options are chosen randomly by the generators, and an engine object has no stable name,
+        # so they can't be cached:
+        if (scale_type not in random_melody_generator.SCALES_DICT or
+                chords_atmosphere not in random_melody_generator.ATMOSPHERE_DICT or
+                not isinstance(melody_engine, str)):
+            return random_melody_generator.generate_bytes(scale_type, scale_key, chords_atmosphere, melody_length,
+                                                          bpm, rng=rng, melody_engine=melody_engine,
+                                                          chord_aware=chord_aware, chord_extension=chord_extension,
+                                                          voice_leading=voice_leading, melody_register=melody_register,
+                                                          chords_register=chords_register)
+
+        digest = None
+        if seed is not None:
+            digest = get_parameters_digest(scale_type, scale_key, chords_atmosphere, melody_length, bpm, seed,
+                                           melody_engine, chord_aware, chord_extension, voice_leading,
+                                           melody_register, chords_register)
+
+            midi_bytes = self.get(('file', digest))
+            if midi_bytes is not None:
+                self.count('hits')
+                return midi_bytes
+
+            if self.directory is not None:
+                midi_bytes = self.read_disk(digest)
+                if midi_bytes is not None:
+                    self.count('disk_hits')
+                    self.put(('file', digest), midi_bytes)
+                    return midi_bytes
+
+        self.count('misses')
+
+        chords_chunk = self.get_chords_track_chunk(scale_key, scale_type, chords_atmosphere, melody_length,
+                                                   chord_extension, voice_leading, chords_register)
+        midi_bytes = render_with_chords_track_chunk(scale_key, scale_type, melody_length, bpm, rng, melody_engine,
+                                                    chords_chunk, chords_atmosphere, chord_aware, chord_extension,
+                                                    melody_register)
+
+        if digest is not None:
+            self.put(('file', digest), midi_bytes)
+            if self.directory is not None:
+                self.write_disk(digest, midi_bytes)
+
+        return midi_bytes
+
+
+# Functions:
+
+
+def get_parameters_digest(scale_type, scale_key, chords_atmosphere, melody_length, bpm, seed, melody_engine,
+                          chord_aware=False, chord_extension=None, voice_leading=False, melody_register=None,
+                          chords_register=None):
+    """
+    :return: a hex digest of the normalized generation parameters - equal parameters always have the same digest.
+    """
+
+    parameters = {'version': CACHE_FORMAT_VERSION, 'scale_type': scale_type, 'scale_key': scale_key,
+                  'chords_atmosphere': chords_atmosphere, 'melody_length': melody_length, 'bpm': bpm,
+                  'seed': seed, 'melody_engine': melody_engine, 'chord_aware': chord_aware,
+                  'chord_extension': chord_extension, 'voice_leading': voice_leading,
+                  'melody_register': normalize_register(melody_register),
+                  'chords_register': normalize_register(chords_register)}
+
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+def normalize_register(register):
+    """
+    :return: the register as a (lowest pitch, highest pitch) tuple (see 'random_melody_generator.get_register'),
+             or None for no register.
+    """
+
+    return None if register is None else random_melody_generator.get_register(register)
+
+
+def render_chords_track_chunk(scale_key, scale_type, chords_atmosphere, melody_length, chord_extension=None,
+                              voice_leading=False, chords_register=None):
+    """
+    :return: the bytes of the chords track chunk of a MIDI file with these parameters.
+    """
+
+    chords_track = 1
+    midi_file = random_melody_generator.SMFWriter(2)
+    midi_file.addTrackName(chords_track, 0, "chords")
+
+    scale_notes = random_melody_generator.get_scale_notes(scale_key, scale_type)
+    random_melody_generator.generate_chord_progression(melody_length, midi_file, chords_track, scale_notes,
+                                                       chords_atmosphere, chord_extension=chord_extension,
+                                                       voice_leading=voice_leading, register=chords_register)
+
+    return midi_file.track_chunk(chords_track)
+
+
+def render_with_chords_track_chunk(scale_key, scale_type, melody_length, bpm, rng, melody_engine, chords_chunk,
+                                   chords_atmosphere=None, chord_aware=False, chord_extension=None,
+                                   melody_register=None):
+    """
+    Generates the melody and splices it with an already rendered chords track.
+    The tracks of a MIDI file are independent chunks, so the bytes are the same as of a whole new file.
+    A chord aware melody follows the chords of the atmosphere - only their ChordToneIndex is built, they are
+    not rendered again.
+
+    :return: the bytes of the MIDI file.
+    """
+
+    melody_track = 0
+    midi_file = random_melody_generator.SMFWriter(2)
+    midi_file.addTrackName(melody_track, 0, "melody")
+    midi_file.addTempo(melody_track, 0, bpm)
+
+    scale_notes = random_melody_generator.get_scale_notes(scale_key, scale_type)
+
+    melody_options = {}
+    if chord_aware:
+        chords_list = random_melody_generator.get_progression_chords(scale_notes, chords_atmosphere,
+                                                                     chord_extension=chord_extension)
+        melody_options['chord_tone_index'] = random_melody_generator.ChordToneIndex(
+            chords_list, random_melody_generator.get_chord_duration(melody_length))
+    if melody_register is not None:
+        melody_options['register'] = melody_register
+    random_melody_generator.get_melody_engine(melody_engine)(melody_length, midi_file, melody_track, scale_notes,
+                                                             rng, **melody_options)
+
+    return random_melody_generator.encode_midi_file([midi_file.tempo_track_chunk(),
+                                                     midi_file.track_chunk(melody_track), chords_chunk])
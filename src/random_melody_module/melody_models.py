@@ -0,0 +1,501 @@
+import os  # Walking the folders of MIDI files to fit
+import json  # Saving and loading the fitted models
+import logging  # Reporting the files that can't be fitted
+from abc import ABC, abstractmethod  # The interface of the models
+from bisect import bisect_right  # Sampling from the cumulative probabilities
+from functools import lru_cache  # The default transitions of the scales outside SCALES_DICT
+from itertools import accumulate  # Building the cumulative probabilities
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Models
+
+Pluggable melody models - a model is a melody engine of 'random_melody_generator', so it can be passed as
+the melody_engine of 'main' (or registered by a name, with 'register_melody_engine').
+
+The MarkovMelodyModel walks a first or second order Markov chain over the degrees of the scale, and a first
+order chain over the rhythm - the durations of the notes and the rests. The transitions of every scale type
+are precomputed as cumulative probabilities, so every step is a single random draw and a bisect.
+The transitions can be fitted from a folder of existing MIDI files:
+
+    model = fit_markov_model("path/to/midi/files", order=2)
+    model.save("model.json")
+    random_melody_generator.main(melody_engine=MarkovMelodyModel.load("model.json"))
+
+    python -m random_melody_module.melody_models path/to/midi/files -o model.json --order 2
+
+"""
+
+# Constants:
+
+MARKOV_MODEL_FORMAT_VERSION = 1
+MARKOV_ORDERS = (1, 2)
+
+# The rhythm states of the melody, sorted by duration - so the states that fit the time left are a prefix:
+RHYTHM_STATES = (('note', 0.5), ('rest', 0.5), ('note', 1), ('rest', 1), ('note', 2))
+RHYTHM_DURATIONS = tuple(duration for _, duration in RHYTHM_STATES)
+FIRST_RHYTHM_STATE = RHYTHM_STATES.index(('note', 1))  # The rhythm before the first note
+MIN_FITTED_REST = 0.25  # Beats, shorter gaps between the notes of a fitted file are not rests
+
+# The default weights of moving between two degrees, by the number of degrees between them (0 - repeating):
+DEGREE_STEP_WEIGHTS = (1.0, 6.0, 3.0, 1.5, 1.0)
+DEGREE_LEAP_WEIGHT = 0.5  # Farther than DEGREE_STEP_WEIGHTS
+TONIC_WEIGHT = 1.5  # Going back to the first degree
+LEAP_RECOVERY_WEIGHT = 2.0  # In a second order chain, stepping back against a leap of more than a step
+
+PRIOR_WEIGHT = 1.0  # The weight of the default transitions in a fitted row, as a number of observed transitions
+MIDI_FILE_EXTENSIONS = ('.mid', '.midi')
+DRUMS_CHANNEL = 9
+DEFAULT_DEGREE_TABLES_CACHE_SIZE = 32  # (scale size, order) pairs, there are at most 12 sizes of 2 orders
+
+logger = logging.getLogger(__name__)
+
+
+# Classes:
+
+
+class MelodyModel(ABC):
+    """
+    The interface of the melody models - a model yields the events of a melody in time order,
+    and calling it writes the melody to a MIDI file, like the functions of MELODY_ENGINES_DICT.
+    """
+
+    @abstractmethod
+    def iter_melody(self, scale_notes, requested_melody_length=None, rng=None, channel=0,
+                    volume=random_melody_generator.DEFAULT_VOLUME, chord_tone_index=None, register=None):
+        """
+        :return: a generator of the events of the melody, the same events as 'iter_random_melody' yields.
+        """
+
+        raise NotImplementedError
+
+    def __call__(self, requested_melody_length, midi_file, melody_track, scale_notes, rng=None,
+                 chord_tone_index=None, register=None):
+        channel = 0  # Because 1 is for the chords part.
+
+        for event in self.iter_melody(scale_notes, requested_melody_length, rng, channel,
+                                      chord_tone_index=chord_tone_index, register=register):
+            random_melody_generator.add_event_to_midi_file(midi_file, melody_track, event)
+
+
+class UniformMelodyModel(MelodyModel):
+    """
+    The original model - uniform notes of the scale, gated by the DEFAULT_CHANCE_FOR_* thresholds.
+    """
+
+    def iter_melody(self, scale_notes, requested_melody_length=None, rng=None, channel=0,
+                    volume=random_melody_generator.DEFAULT_VOLUME, chord_tone_index=None, register=None):
+        return random_melody_generator.iter_random_melody(scale_notes, requested_melody_length, rng, channel, volume,
+                                                          chord_tone_index, register)
+
+
+class MarkovMelodyModel(MelodyModel):
+    """
+    A Markov chain over the degrees of the scale and over the rhythm.
+
+    :param order: 1 - the next degree depends on the previous degree, 2 - on the previous two degrees.
+    :param degree_counts: scale type -> the observed transitions between its degrees, a row of counts for every
+                          previous state (the previous degree, or previous * scale size + last for order 2).
+                          the scale types without counts use the default transitions.
+    :param rhythm_counts: the observed transitions between the RHYTHM_STATES, a row for every state.
+    """
+
+    def __init__(self, order=1, degree_counts=None, rhythm_counts=None):
+        if order not in MARKOV_ORDERS:
+            raise ValueError("The order of the chain must be one of {orders}, not {order}".format(
+                orders=MARKOV_ORDERS, order=order))
+
+        self.order = order
+        self.degree_counts = degree_counts or {}
+        self.rhythm_counts = rhythm_counts
+
+        # Precomputed for every scale of SCALES_DICT - the scale intervals -> the cumulative rows. the scale types
+        # of the same intervals (like 'major' and 'ionian') are the same scale, so their counts are merged:
+        intervals_counts = {}
+        for scale_type, counts in self.degree_counts.items():
+            scale_intervals = random_melody_generator.SCALES_DICT.get(scale_type)
+            if scale_intervals is not None:
+                intervals_counts[scale_intervals] = merge_counts(intervals_counts.get(scale_intervals), counts)
+
+        self.degree_tables = {}
+        for scale_intervals in random_melody_generator.SCALES_DICT.values():
+            self.degree_tables[scale_intervals] = get_cumulative_rows(
+                get_default_degree_rows(len(scale_intervals), order), intervals_counts.get(scale_intervals))
+        self.rhythm_table = get_cumulative_rows(get_default_rhythm_rows(), rhythm_counts)
+
+    def get_degree_table(self, scale_notes):
+        """
+        :return: the cumulative degree transitions of the scale - the default transitions of its size for the
+                 scales that aren't in SCALES_DICT (they are never fitted).
+        """
+
+        notes_pitch_classes = random_melody_generator.NOTES_PITCH_CLASSES_DICT
+        scale_intervals = tuple((notes_pitch_classes[note] - notes_pitch_classes[scale_notes[0]]) % 12
+                                for note in scale_notes)
+
+        degree_table = self.degree_tables.get(scale_intervals)
+        if degree_table is None:
+            degree_table = get_default_degree_table(len(scale_notes), self.order)
+
+        return degree_table
+
+    def iter_melody(self, scale_notes, requested_melody_length=None, rng=None, channel=0,
+                    volume=random_melody_generator.DEFAULT_VOLUME, chord_tone_index=None, register=None):
+        """
+        Generate the melody lazily, event by event:
+
+        :param scale_notes: a list of the notes in a specific key.
+        :param requested_melody_length: the melody length requested, None for a melody that never ends.
+        :param rng: the random generator of the melody, a new one by default.
+        :param channel: the MIDI channel of the melody.
+        :param volume: the volume of the notes.
+        :param chord_tone_index: the ChordToneIndex of the chords, to play their notes on the beats - the chain
+                                 goes on from the degree of the chord note.
+        :param register: the register of the melody (see 'random_melody_generator.get_register') - every degree
+                         is played in its octave nearest to the previous note.
+
+        :return: a generator of the (time, NOTE_EVENT, channel, pitch, duration, volume) events of the melody.
+
+        """
+
+        rng = random_melody_generator.get_random_generator(rng=rng)
+        random = rng.random
+
+        if requested_melody_length is None:
+            requested_melody_length = float('inf')
+
+        degree_rows = self.get_degree_table(scale_notes)
+        rhythm_rows = self.rhythm_table
+        register = random_melody_generator.get_register(register)
+        fit_to_register = random_melody_generator.fit_to_register
+        scale_pitches = random_melody_generator.get_scale_pitches(scale_notes)  # A pitch of every degree
+        degrees_of_pitch_classes = {pitch % 12: degree for degree, pitch in enumerate(scale_pitches)}
+        choose_chord_tone = random_melody_generator.choose_chord_tone
+        scale_size = len(scale_notes)
+        last_degree_index = scale_size - 1
+        second_order = self.order == 2
+        note_event = random_melody_generator.NOTE_EVENT
+
+        degree_state = 0  # The melody starts after the tonic
+        previous_pitch = fit_to_register(scale_pitches[0], sum(register) // 2, register)
+        rhythm_state = FIRST_RHYTHM_STATE
+        current_melody_length = 0
+
+        while True:
+            # Only the states that fit the time left can be drawn - their probabilities are a prefix of the row:
+            fitting_states = bisect_right(RHYTHM_DURATIONS, requested_melody_length - current_melody_length)
+            if fitting_states == 0:
+                break
+
+            rhythm_row = rhythm_rows[rhythm_state]
+            rhythm_state = min(bisect_right(rhythm_row, random() * rhythm_row[fitting_states - 1], 0,
+                                            fitting_states), fitting_states - 1)
+            kind, duration = RHYTHM_STATES[rhythm_state]
+
+            if kind == 'note':
+                degree = min(bisect_right(degree_rows[degree_state], random()), last_degree_index)
+                # The degree in its octave nearest to the previous note:
+                pitch = fit_to_register(scale_pitches[degree], previous_pitch, register)
+                if chord_tone_index is not None:
+                    chord_tone = choose_chord_tone(pitch, current_melody_length, chord_tone_index, rng, register)
+                    if chord_tone % 12 in degrees_of_pitch_classes:
+                        degree = degrees_of_pitch_classes[chord_tone % 12]
+                        pitch = chord_tone
+                if second_order:
+                    degree_state = (degree_state % scale_size) * scale_size + degree
+                else:
+                    degree_state = degree
+
+                previous_pitch = pitch
+                yield current_melody_length, note_event, channel, pitch, duration, volume
+
+            current_melody_length += duration
+
+    def to_dict(self):
+        return {'version': MARKOV_MODEL_FORMAT_VERSION, 'order': self.order, 'degree_counts': self.degree_counts,
+                'rhythm_counts': self.rhythm_counts}
+
+    def save(self, path):
+        """
+        Saves the fitted transitions as JSON.
+        """
+
+        with open(path, 'w') as model_file:
+            json.dump(self.to_dict(), model_file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :return: the MarkovMelodyModel saved at the path.
+        """
+
+        with open(path) as model_file:
+            model_dict = json.load(model_file)
+
+        if model_dict.get('version') != MARKOV_MODEL_FORMAT_VERSION:
+            raise ValueError("{path} is not a saved Markov melody model of version {version}".format(
+                path=path, version=MARKOV_MODEL_FORMAT_VERSION))
+
+        return cls(model_dict['order'], model_dict['degree_counts'], model_dict['rhythm_counts'])
+
+
+# Functions:
+
+
+def get_default_degree_rows(scale_size, order=1):
+    """
+    The default transitions between the degrees of a scale - mostly steps, a few leaps, and a pull to the tonic.
+    In a second order chain, a leap of more than a step is usually followed by a step back.
+
+    :return: a row of weights for every previous state.
+    """
+
+    def get_step_weight(previous_degree, degree):
+        distance = abs(degree - previous_degree)
+        distance = min(distance, scale_size - distance)  # The scale wraps around, like the pitches of the notes do
+        weight = DEGREE_STEP_WEIGHTS[distance] if distance < len(DEGREE_STEP_WEIGHTS) else DEGREE_LEAP_WEIGHT
+        return weight * TONIC_WEIGHT if degree == 0 else weight
+
+    if order == 1:
+        return [[get_step_weight(previous_degree, degree) for degree in range(scale_size)]
+                for previous_degree in range(scale_size)]
+
+    rows = []
+    for before_previous_degree in range(scale_size):
+        for previous_degree in range(scale_size):
+            leap = previous_degree - before_previous_degree
+            row = []
+            for degree in range(scale_size):
+                weight = get_step_weight(previous_degree, degree)
+                if abs(leap) > 1 and (degree - previous_degree) * leap < 0:
+                    weight *= LEAP_RECOVERY_WEIGHT
+                row.append(weight)
+            rows.append(row)
+
+    return rows
+
+
+@lru_cache(maxsize=DEFAULT_DEGREE_TABLES_CACHE_SIZE)
+def get_default_degree_table(scale_size, order=1):
+    """
+    :return: the cumulative default transitions between the degrees of a scale of the size - shared by all the
+             models, so it must not be changed.
+    """
+
+    return get_cumulative_rows(get_default_degree_rows(scale_size, order))
+
+
+def get_default_rhythm_rows():
+    """
+    The default transitions between the rhythm states - every row has the chances of the original model,
+    a note for DEFAULT_CHANCE_FOR_NOTE - DEFAULT_CHANCE_FOR_REST and a rest for DEFAULT_CHANCE_FOR_REST -
+    DEFAULT_CHANCE_FOR_ADDING, split evenly between the durations.
+
+    :return: a row of weights for every rhythm state.
+    """
+
+    note_chance = random_melody_generator.DEFAULT_CHANCE_FOR_NOTE - random_melody_generator.DEFAULT_CHANCE_FOR_REST
+    rest_chance = random_melody_generator.DEFAULT_CHANCE_FOR_REST - random_melody_generator.DEFAULT_CHANCE_FOR_ADDING
+    notes_count = sum(1 for kind, _ in RHYTHM_STATES if kind == 'note')
+    rests_count = len(RHYTHM_STATES) - notes_count
+
+    row = [note_chance / notes_count if kind == 'note' else rest_chance / rests_count for kind, _ in RHYTHM_STATES]
+    return [list(row) for _ in RHYTHM_STATES]
+
+
+def get_cumulative_rows(default_rows, counts=None):
+    """
+    Converts rows of weights to rows of cumulative probabilities, that end at exactly 1.0.
+    The observed counts are added to the default weights, normalized to PRIOR_WEIGHT observations -
+    so a row without observations is the default, and a row with many is what was observed.
+
+    :return: a list of the cumulative rows.
+    """
+
+    cumulative_rows = []
+    for row_index, default_row in enumerate(default_rows):
+        default_total = sum(default_row)
+        row = [weight * PRIOR_WEIGHT / default_total for weight in default_row]
+        if counts is not None:
+            row = [weight + count for weight, count in zip(row, counts[row_index])]
+
+        total = sum(row)
+        cumulative_row = [weight / total for weight in accumulate(row)]
+        cumulative_row[-1] = 1.0
+        cumulative_rows.append(cumulative_row)
+
+    return cumulative_rows
+
+
+def merge_counts(counts, other_counts):
+    """
+    :return: the sum of two tables of transitions counts, of the same shape - or the other counts as is,
+             when the counts are None.
+    """
+
+    if counts is None:
+        return other_counts
+
+    return [[count + other_count for count, other_count in zip(row, other_row)]
+            for row, other_row in zip(counts, other_counts)]
+
+
+def get_melody_lines(note_events):
+    """
+    Splits the notes of a MIDI file to melodic lines - a line for every track and channel, without the drums.
+    Where notes start together (chords), the line keeps the highest.
+
+    :return: a list of the lines, every line is a list of (start, duration, pitch) in beats, in time order.
+    """
+
+    lines = {}  # (track, channel) -> {start -> (start, duration, pitch)}
+    for note in note_events:
+        if note.channel == DRUMS_CHANNEL:
+            continue
+        line = lines.setdefault((note.track, note.channel), {})
+        highest_note = line.get(note.start)
+        if highest_note is None or note.pitch > highest_note[2]:
+            line[note.start] = (note.start, note.duration, note.pitch)
+
+    return [sorted(line.values()) for line in lines.values()]
+
+
+def get_best_scale_key(pitch_classes_count, scale_intervals):
+    """
+    :param pitch_classes_count: the number of the notes of every pitch class, 0 for C to 11 for B.
+
+    :return: the pitch class of the key whose scale (of these intervals) has most of the notes.
+    """
+
+    return max(range(12), key=lambda key_pitch_class: sum(pitch_classes_count[(key_pitch_class + interval) % 12]
+                                                          for interval in scale_intervals))
+
+
+def get_rhythm_state(kind, duration):
+    """
+    :return: the index of the rhythm state of the kind ('note' or 'rest') with the closest duration.
+    """
+
+    return min((state_index for state_index, (state_kind, _) in enumerate(RHYTHM_STATES) if state_kind == kind),
+               key=lambda state_index: abs(RHYTHM_DURATIONS[state_index] - duration))
+
+
+def count_line_transitions(line, order, degree_counts, rhythm_counts, scale_types):
+    """
+    Adds the transitions of a melodic line to the counts - the degrees are counted in every scale type,
+    in the key of that type that fits the line best. Notes outside the scale break the chain.
+    The scale types of the same intervals are the same scale - the line is counted only in the first of them,
+    and the model merges their counts.
+    """
+
+    pitch_classes_count = [0] * 12
+    for _, _, pitch in line:
+        pitch_classes_count[pitch % 12] += 1
+
+    counted_scales_intervals = set()
+    for scale_type in scale_types:
+        scale_intervals = random_melody_generator.SCALES_DICT[scale_type]
+        if scale_intervals in counted_scales_intervals:
+            continue
+        counted_scales_intervals.add(scale_intervals)
+        scale_size = len(scale_intervals)
+        key_pitch_class = get_best_scale_key(pitch_classes_count, scale_intervals)
+        degrees_of_pitch_classes = {(key_pitch_class + interval) % 12: degree
+                                    for degree, interval in enumerate(scale_intervals)}
+
+        counts = degree_counts.get(scale_type)
+        if counts is None:
+            counts = degree_counts[scale_type] = [[0] * scale_size for _ in range(scale_size ** order)]
+
+        previous_degrees = []
+        for _, _, pitch in line:
+            degree = degrees_of_pitch_classes.get(pitch % 12)
+            if degree is None:
+                previous_degrees = []
+                continue
+            if len(previous_degrees) == order:
+                state = previous_degrees[0] if order == 1 else previous_degrees[0] * scale_size + previous_degrees[1]
+                counts[state][degree] += 1
+            previous_degrees = (previous_degrees + [degree])[-order:]
+
+    previous_state = None
+    for index, (start, duration, _) in enumerate(line):
+        states = []
+        if index + 1 < len(line):
+            next_start = line[index + 1][0]
+            duration = min(duration, next_start - start)
+            gap = next_start - start - duration
+        else:
+            gap = 0
+        states.append(get_rhythm_state('note', duration))
+        if gap >= MIN_FITTED_REST:
+            states.append(get_rhythm_state('rest', gap))
+
+        for state in states:
+            if previous_state is not None:
+                rhythm_counts[previous_state][state] += 1
+            previous_state = state
+
+
+def iter_midi_file_paths(directory):
+    """
+    :return: a generator of the paths of the MIDI files in the folder and its sub-folders, in a stable order.
+    """
+
+    for folder_path, folder_names, file_names in os.walk(directory):
+        folder_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.lower().endswith(MIDI_FILE_EXTENSIONS):
+                yield os.path.join(folder_path, file_name)
+
+
+def fit_markov_model(midi_file_paths, order=1, scale_types=None):
+    """
+    Fits the transitions of a MarkovMelodyModel to existing MIDI files:
+
+    :param midi_file_paths: a folder of MIDI files (searched with its sub-folders), or a list of MIDI file paths.
+    :param order: the order of the degrees chain, 1 or 2.
+    :param scale_types: the scale types to fit, all of SCALES_DICT by default.
+
+    :return: the fitted MarkovMelodyModel.
+
+    """
+
+    if isinstance(midi_file_paths, str):
+        midi_file_paths = iter_midi_file_paths(midi_file_paths)
+    if scale_types is None:
+        scale_types = list(random_melody_generator.SCALES_DICT)
+
+    degree_counts = {}
+    rhythm_counts = [[0] * len(RHYTHM_STATES) for _ in RHYTHM_STATES]
+
+    for midi_file_path in midi_file_paths:
+        with open(midi_file_path, 'rb') as midi_file:
+            try:
+                note_events = random_melody_generator.read_midi_file(midi_file.read())
+            except ValueError as error:
+                logger.warning("Skipping %s: %s", midi_file_path, error)
+                continue
+
+        for line in get_melody_lines(note_events):
+            count_line_transitions(line, order, degree_counts, rhythm_counts, scale_types)
+
+    return MarkovMelodyModel(order, degree_counts, rhythm_counts)
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user
+
+    parser = argparse.ArgumentParser(description="Fits a Markov melody model to a folder of MIDI files.")
+    parser.add_argument('directory', help="a folder of MIDI files, searched with its sub-folders")
+    parser.add_argument('-o', '--output', default='markov_model.json', help="the path to save the model to")
+    parser.add_argument('--order', type=int, default=1, choices=MARKOV_ORDERS, help="the order of the chain")
+
+    args = parser.parse_args()
+
+    fit_markov_model(args.directory, args.order).save(args.output)
+    print(args.output)
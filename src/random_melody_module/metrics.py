@@ -0,0 +1,166 @@
+import threading  # Sharing the metrics between the generating threads and the HTTP server
+from bisect import bisect_left  # Finding the bucket of a timing
+from http.server import BaseHTTPRequestHandler, HTTPServer  # Serving the metrics to the scraper
+from socketserver import ThreadingMixIn  # Answering scrapes while another one is slow
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Metrics
+
+Prometheus style metrics of the generation: a histogram of the time of every stage, and counters of the
+generated notes, rests, triplets, pitch bends, duration retries, random draws and written bytes.
+
+    metrics = enable_metrics()
+    serve_metrics(metrics, 9464)  # http://127.0.0.1:9464/metrics
+
+The instrumentation is off until it is enabled, and then costs a few counter updates per generated file.
+
+"""
+
+# Constants:
+
+METRICS_PREFIX = 'random_melody'
+DEFAULT_METRICS_PORT = 9464
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                 2.5, 5.0, 10.0)  # Seconds
+COUNTERS_HELP_DICT = {
+    'files': "Generated MIDI files.",
+    'notes': "Generated melody notes, including the notes of triplets.",
+    'rests': "Generated melody rests.",
+    'triplets': "Generated melody triplets.",
+    'pitch_bends': "Generated pitch wheel events.",
+    'duration_retries': "Note and rest durations drawn again because they were longer than the time left.",
+    'rng_draws': "Draws from the random generators created by the generation.",
+    'bytes_written': "Bytes of the written MIDI files.",
+}
+
+
+# Classes:
+
+
+class PrometheusMetrics(random_melody_generator.InstrumentationHook):
+    """
+    Collects the instrumentation of the generation as Prometheus counters and histograms, safe to share between
+    threads.
+
+    :param buckets: the upper bounds, in seconds, of the buckets of the stage histograms.
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTERS_HELP_DICT, 0)
+        self.stages = {}  # stage -> [bucket counts..., +Inf count, sum of the seconds]
+
+    def stage_finished(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def stats(self):
+        """
+        :return: a dict of the counters, and stage -> (number of times it ran, total seconds).
+        """
+
+        with self.lock:
+            return dict(self.counters, stages={stage: (sum(histogram[:-1]), histogram[-1])
+                                               for stage, histogram in self.stages.items()})
+
+    def render(self):
+        """
+        :return: the metrics in the Prometheus text exposition format.
+        """
+
+        with self.lock:
+            counters = dict(self.counters)
+            stages = {stage: list(histogram) for stage, histogram in self.stages.items()}
+
+        lines = []
+        for counter, value in sorted(counters.items()):
+            name = '{prefix}_{counter}_total'.format(prefix=METRICS_PREFIX, counter=counter)
+            lines.append('# HELP {name} {help}'.format(name=name, help=COUNTERS_HELP_DICT.get(counter, counter)))
+            lines.append('# TYPE {name} counter'.format(name=name))
+            lines.append('{name} {value}'.format(name=name, value=value))
+
+        name = '{prefix}_stage_seconds'.format(prefix=METRICS_PREFIX)
+        lines.append('# HELP {name} Time spent in every stage of the generation.'.format(name=name))
+        lines.append('# TYPE {name} histogram'.format(name=name))
+        for stage, histogram in sorted(stages.items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets + (float('inf'),), histogram):
+                cumulative_count += bucket_count
+                lines.append('{name}_bucket{{stage="{stage}",le="{bound}"}} {count}'.format(
+                    name=name, stage=stage, bound='+Inf' if upper_bound == float('inf') else repr(upper_bound),
+                    count=cumulative_count))
+            lines.append('{name}_sum{{stage="{stage}"}} {seconds!r}'.format(name=name, stage=stage,
+                                                                             seconds=histogram[-1]))
+            lines.append('{name}_count{{stage="{stage}"}} {count}'.format(name=name, stage=stage,
+                                                                           count=cumulative_count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+# Functions:
+
+
+def enable_metrics(metrics=None):
+    """
+    Enables the instrumentation of the generation, collected into the given metrics or new ones.
+
+    :return: the PrometheusMetrics that collect the instrumentation.
+    """
+
+    if metrics is None:
+        metrics = PrometheusMetrics()
+    random_melody_generator.set_instrumentation_hook(metrics)
+
+    return metrics
+
+
+def disable_metrics():
+    random_melody_generator.set_instrumentation_hook(None)
+
+
+def serve_metrics(metrics, port=DEFAULT_METRICS_PORT, host='127.0.0.1'):
+    """
+    Serves the metrics at http://host:port/metrics, from a daemon thread.
+
+    :return: the HTTP server, call its 'shutdown' to stop serving.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes are too frequent to log
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server_thread = threading.Thread(target=server.serve_forever, name='random-melody-metrics', daemon=True)
+    server_thread.start()
+
+    return server
@@ -0,0 +1,529 @@
+import os  # Getting and checking paths
+import mmap  # Reading the packed files without copying them
+import struct  # The headers of the records of the shard files
+import zipfile  # Packing the files into a zip archive
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Random Melody Output Sinks
+
+Where the generated MIDI files are written - a folder with a file for every melody, or a single packed file
+for all of them: a zip archive, or a shard file. A million melodies in a packed file are one file on the disk
+instead of a million, and the writes are buffered and written together.
+
+A shard file is the records one after the other - a header with the lengths of the name and the data, the name
+and the data - and an index file next to it ('.idx') with the offset of every record, so a melody is found without
+reading the others. The readers map the packed files to memory, and every melody they return is a memoryview
+of the mapping - nothing is copied until it is used (for the zip archive, only the files that aren't compressed).
+
+    with get_output_sink('melodies.shard') as output_sink:
+        output_sink.write('RandoMMelody.mid', random_melody_generator.generate_bytes(seed=7))
+
+    with open_sink_reader('melodies.shard') as sink_reader:
+        midi_bytes = sink_reader['RandoMMelody.mid']
+
+    python -m random_melody_module.output_sinks melodies.shard
+    python -m random_melody_module.output_sinks melodies.shard -x RandoMMelody.mid -o RandoMMelody.mid
+
+"""
+
+# Constants:
+
+WRITE_BUFFER_SIZE = 1024 * 1024  # Bytes, the writes of a packed sink are written together
+
+SHARD_MAGIC = b'RMSHARD1'
+SHARD_INDEX_EXT = '.idx'
+RECORD_HEADER = struct.Struct('<HI')  # The lengths of the name and of the data
+INDEX_ENTRY_HEADER = struct.Struct('<QIH')  # The offset and the length of the data, and the length of the name
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')  # The local file header of a member of a zip archive
+ZIP_LOCAL_HEADER_MAGIC = b'PK\x03\x04'
+
+
+# Classes:
+
+
+class DuplicateNameError(ValueError):
+    """
+    Raised when a file is written to a packed file (or its name is claimed) with the name of a file it has.
+    """
+
+
+class OutputSink(object):
+    """
+    The base of the sinks - a sink writes the bytes of MIDI files by their names.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, name, data):
+        """
+        Writes the bytes of a file.
+
+        :param name: the name of the file, it can be in a subfolder, for example '000003/RandoMMelody_3017.mid'.
+        :param data: the bytes of the file.
+
+        :return: where the file was written - its path for a folder, its name in a packed file.
+        """
+
+        raise NotImplementedError
+
+    def get_unique_name(self, basename='RandoMMelody', ext='mid'):
+        """
+        :return: a name that no file in the sink has, numbered after the files written before - claimed, so the
+                 next call returns another name even if the file wasn't written yet.
+        """
+
+        raise NotImplementedError
+
+    def claim_name(self, name):
+        """
+        Claims the name of a file that will be written later - so a batch finds a name that is taken before it
+        composes the file. A folder overwrites its files, so it takes any name.
+
+        :return: the name, as the sink writes it.
+
+        :raises DuplicateNameError: if the sink has a file of the name, or the name was claimed already.
+        """
+
+        return name
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class DirectorySink(OutputSink):
+    """
+    Writes every file to its own file in a folder - like 'random_melody_generator.main' does.
+    """
+
+    def __init__(self, directory, shard_size=None):
+        """
+        :param directory: the folder to write the files to, created if it doesn't exist.
+        :param shard_size: the number of files in every subfolder for the unique names, None for a flat folder.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.created_directories = set()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+
+        directory = os.path.dirname(name)
+        if directory and directory not in self.created_directories:
+            os.makedirs(os.path.join(self.directory, directory), exist_ok=True)
+            self.created_directories.add(directory)
+
+        with open(path, 'wb') as output_file:
+            output_file.write(data)
+        return path
+
+    def get_unique_name(self, basename='RandoMMelody', ext='mid'):
+        path = random_melody_generator.get_output_allocator(self.directory, basename, ext, self.shard_size).allocate()
+        return os.path.relpath(path, self.directory)
+
+
+class PackedSink(OutputSink):
+    """
+    The base of the sinks of a single packed file - they know the names of all the files in it, so a name is never
+    written twice.
+    """
+
+    def __init__(self, names):
+        """
+        :param names: the names of the files in the packed file already.
+        """
+
+        self.names = set(names)
+        self.claimed_names = set()  # Returned by 'get_unique_name' or 'claim_name', and not written yet
+        self.next_number = len(self.names) + 1
+
+    def add_name(self, name):
+        """
+        :return: the name, with the separators of a packed file.
+
+        :raises DuplicateNameError: if a file with the name was written before.
+        """
+
+        name = name.replace(os.sep, '/')
+        if name in self.names:
+            raise DuplicateNameError("{name} is in {path} already".format(name=name, path=self.path))
+        self.names.add(name)
+        self.claimed_names.discard(name)
+        return name
+
+    def claim_name(self, name):
+        name = name.replace(os.sep, '/')
+        if name in self.names or name in self.claimed_names:
+            raise DuplicateNameError("{name} is in {path} already".format(name=name, path=self.path))
+        self.claimed_names.add(name)
+        return name
+
+    def get_unique_name(self, basename='RandoMMelody', ext='mid'):
+        name = get_numbered_name(basename, ext, self.next_number)
+        while name in self.names or name in self.claimed_names:
+            self.next_number += 1
+            name = get_numbered_name(basename, ext, self.next_number)
+
+        self.claimed_names.add(name)
+        self.next_number += 1
+        return name
+
+
+class ZipSink(PackedSink):
+    """
+    Packs the files into a zip archive, written through a big buffer. The files are stored without compression
+    by default - MIDI files are small, and stored files can be read without copying them.
+    """
+
+    def __init__(self, path, compression=zipfile.ZIP_STORED):
+        """
+        :param path: the path of the zip archive, the files are added to it if it exists.
+        :param compression: the compression of the files, a constant of zipfile.
+        """
+
+        self.path = path
+        self.output_file = open(path, 'r+b' if os.path.exists(path) else 'w+b', buffering=WRITE_BUFFER_SIZE)
+        self.zip_file = zipfile.ZipFile(self.output_file, 'a', compression)
+        super(ZipSink, self).__init__(self.zip_file.namelist())
+
+    def write(self, name, data):
+        name = self.add_name(name)
+        self.zip_file.writestr(name, data)
+        return name
+
+    def flush(self):
+        self.output_file.flush()
+
+    def close(self):
+        if self.zip_file is not None:
+            self.zip_file.close()  # Writes the central directory
+            self.output_file.close()
+            self.zip_file = None
+
+
+class ShardSink(PackedSink):
+    """
+    Appends the files to a shard file as length-prefixed records, and their offsets to its index file.
+
+    The records are collected in a buffer and written together, the index entries after them - so the index never
+    points after the end of the shard. When the shard is opened again, records without an index entry (written
+    right before a crash) are indexed, and a record cut in the middle is removed.
+    """
+
+    def __init__(self, path, buffer_size=WRITE_BUFFER_SIZE):
+        """
+        :param path: the path of the shard file, the files are appended to it if it exists.
+        :param buffer_size: the bytes collected before they are written.
+        """
+
+        self.path = path
+        self.index_path = path + SHARD_INDEX_EXT
+        self.buffer_size = buffer_size
+
+        super(ShardSink, self).__init__(name for name, _, _ in repair_shard(path))
+        self.shard_file = open(path, 'ab')
+        self.index_file = open(self.index_path, 'ab')
+        self.offset = self.shard_file.tell()
+
+        self.buffer = bytearray()
+        self.index_buffer = bytearray()
+
+    def write(self, name, data):
+        name = self.add_name(name)
+        encoded_name = name.encode('utf-8')
+        self.buffer += RECORD_HEADER.pack(len(encoded_name), len(data))
+        self.buffer += encoded_name
+        data_offset = self.offset + len(self.buffer)
+        self.buffer += data
+        self.index_buffer += INDEX_ENTRY_HEADER.pack(data_offset, len(data), len(encoded_name))
+        self.index_buffer += encoded_name
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return name
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        self.shard_file.write(self.buffer)
+        self.shard_file.flush()
+        self.offset += len(self.buffer)
+        self.index_file.write(self.index_buffer)
+        self.index_file.flush()
+
+        self.buffer = bytearray()
+        self.index_buffer = bytearray()
+
+    def close(self):
+        if self.shard_file is not None:
+            self.flush()
+            self.shard_file.close()
+            self.index_file.close()
+            self.shard_file = None
+
+
+class PackedFileReader(object):
+    """
+    The base of the readers of the packed files - the file is mapped to memory, and the files in it are read by
+    their names as memoryviews of the mapping. The memoryviews must be released before the reader is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.input_file = open(path, 'rb')
+        self.mapping = mmap.mmap(self.input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = {}  # name -> (offset, length)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        """
+        :return: the bytes of the file, as a memoryview of the mapping - without copying them.
+        """
+
+        offset, length = self.entries[name]
+        return memoryview(self.mapping)[offset:offset + length]
+
+    def names(self):
+        return list(self.entries)
+
+    def close(self):
+        self.mapping.close()
+        self.input_file.close()
+
+
+class ShardReader(PackedFileReader):
+    """
+    Reads the files of a shard file, by the offsets of its index file (or of the records, if there is no index).
+    A name that was written more than once is the last file written with it.
+    """
+
+    def __init__(self, path):
+        super(ShardReader, self).__init__(path)
+        self.entries = dict((name, (offset, length)) for name, offset, length in read_shard_index(path))
+
+
+class ZipReader(PackedFileReader):
+    """
+    Reads the files of a zip archive - the stored files without copying them, the compressed files are
+    decompressed (and returned as bytes).
+    """
+
+    def __init__(self, path):
+        super(ZipReader, self).__init__(path)
+        self.zip_file = zipfile.ZipFile(self.input_file)
+        self.compressed_names = set()
+
+        for zip_info in self.zip_file.infolist():
+            if zip_info.compress_type != zipfile.ZIP_STORED:
+                self.compressed_names.add(zip_info.filename)
+                self.entries[zip_info.filename] = None
+                continue
+
+            local_header = ZIP_LOCAL_HEADER.unpack_from(self.mapping, zip_info.header_offset)
+            if local_header[0] != ZIP_LOCAL_HEADER_MAGIC:
+                raise ValueError("Bad local header of {name} in {path}".format(name=zip_info.filename, path=path))
+            name_length, extra_length = local_header[-2:]
+            self.entries[zip_info.filename] = (zip_info.header_offset + ZIP_LOCAL_HEADER.size + name_length +
+                                               extra_length, zip_info.file_size)
+
+    def __getitem__(self, name):
+        if name in self.compressed_names:
+            return self.zip_file.read(name)
+        return super(ZipReader, self).__getitem__(name)
+
+    def close(self):
+        self.zip_file.close()
+        super(ZipReader, self).close()
+
+
+OUTPUT_SINKS_DICT = {'directory': DirectorySink, 'zip': ZipSink, 'shard': ShardSink}
+PACKED_FILES_READERS_DICT = {'zip': ZipReader, 'shard': ShardReader}
+
+
+# Functions:
+
+
+def get_numbered_name(basename, ext, number):
+    """
+    :return: the name of the file of the number, named like the files of the OutputAllocator.
+    """
+
+    if number == 1:
+        return "{basename}.{ext}".format(basename=basename, ext=ext)
+    return "{basename}_{number}.{ext}".format(basename=basename, number=number, ext=ext)
+
+
+def get_sink_kind(path):
+    """
+    :return: the kind of the sink of the path - a key of OUTPUT_SINKS_DICT, by its extension.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.zip':
+        return 'zip'
+    if extension == '.shard':
+        return 'shard'
+    return 'directory'
+
+
+def get_output_sink(path, kind=None, **options):
+    """
+    :param path: a folder, a '.zip' archive or a '.shard' file.
+    :param kind: a key of OUTPUT_SINKS_DICT, by default by the extension of the path.
+    :param options: the options of the sink, like the shard_size of a DirectorySink.
+
+    :return: a new OutputSink - it should be closed (or used in a 'with') to write all the files.
+    """
+
+    return OUTPUT_SINKS_DICT[kind or get_sink_kind(path)](path, **options)
+
+
+def open_sink_reader(path):
+    """
+    :param path: a '.zip' archive or a '.shard' file.
+
+    :return: a reader of the files in it, by their names.
+    """
+
+    kind = get_sink_kind(path)
+    if kind not in PACKED_FILES_READERS_DICT:
+        raise ValueError("Not a packed file: {path}".format(path=path))
+    return PACKED_FILES_READERS_DICT[kind](path)
+
+
+def iter_shard_records(shard_file, offset, end):
+    """
+    Reads the records of a shard file by their headers, skipping the data.
+
+    :param shard_file: the shard file, opened for reading.
+    :param offset: the offset of the first record.
+    :param end: the size of the shard file.
+
+    :return: a generator of (name, data offset, data length) - it stops at a record cut in the middle.
+    """
+
+    while offset + RECORD_HEADER.size <= end:
+        shard_file.seek(offset)
+        name_length, data_length = RECORD_HEADER.unpack(shard_file.read(RECORD_HEADER.size))
+        data_offset = offset + RECORD_HEADER.size + name_length
+        if data_offset + data_length > end:
+            return
+        yield shard_file.read(name_length).decode('utf-8'), data_offset, data_length
+        offset = data_offset + data_length
+
+
+def read_shard_index(path):
+    """
+    :return: a list of (name, data offset, data length) of the records of the shard - from its index file, and from
+             the records after the last indexed one.
+    """
+
+    entries = []
+    try:
+        with open(path + SHARD_INDEX_EXT, 'rb') as index_file:
+            index_data = index_file.read()
+    except FileNotFoundError:
+        index_data = b''
+
+    position = 0
+    while position + INDEX_ENTRY_HEADER.size <= len(index_data):
+        data_offset, data_length, name_length = INDEX_ENTRY_HEADER.unpack_from(index_data, position)
+        position += INDEX_ENTRY_HEADER.size
+        if position + name_length > len(index_data):
+            break
+        entries.append((index_data[position:position + name_length].decode('utf-8'), data_offset, data_length))
+        position += name_length
+
+    with open(path, 'rb') as shard_file:
+        if shard_file.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            raise ValueError("Not a shard file: {path}".format(path=path))
+        shard_size = os.fstat(shard_file.fileno()).st_size
+
+        indexed_end = entries[-1][1] + entries[-1][2] if entries else len(SHARD_MAGIC)
+        if indexed_end > shard_size:
+            raise ValueError("The index of {path} doesn't match its records".format(path=path))
+        entries.extend(iter_shard_records(shard_file, indexed_end, shard_size))
+
+    return entries
+
+
+def repair_shard(path):
+    """
+    Prepares a shard file for appending - creates it, indexes the records that have no index entry and removes
+    a record cut in the middle (the index is rewritten if it has an entry cut in the middle).
+
+    :return: the entries of the records, like 'read_shard_index'.
+    """
+
+    if not os.path.exists(path) or not os.path.getsize(path):
+        with open(path, 'wb') as shard_file:
+            shard_file.write(SHARD_MAGIC)
+        open(path + SHARD_INDEX_EXT, 'wb').close()
+        return []
+
+    entries = read_shard_index(path)
+
+    records_end = entries[-1][1] + entries[-1][2] if entries else len(SHARD_MAGIC)
+    if os.path.getsize(path) > records_end:
+        with open(path, 'r+b') as shard_file:
+            shard_file.truncate(records_end)
+
+    index_data = bytearray()
+    for name, data_offset, data_length in entries:
+        encoded_name = name.encode('utf-8')
+        index_data += INDEX_ENTRY_HEADER.pack(data_offset, data_length, len(encoded_name))
+        index_data += encoded_name
+    index_path = path + SHARD_INDEX_EXT
+    if not os.path.exists(index_path) or os.path.getsize(index_path) != len(index_data):
+        with open(index_path, 'wb') as index_file:
+            index_file.write(index_data)
+
+    return entries
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user
+
+    parser = argparse.ArgumentParser(description="Lists the MIDI files in a packed file, or extracts one of them.")
+    parser.add_argument('path', help="a .zip archive or a .shard file")
+    parser.add_argument('-x', '--extract', help="the name of a file to extract")
+    parser.add_argument('-o', '--output', help="the path to extract the file to, its name by default")
+
+    args = parser.parse_args()
+
+    with open_sink_reader(args.path) as cli_sink_reader:
+        if args.extract is None:
+            for packed_name in cli_sink_reader:
+                print(packed_name)
+        else:
+            with open(args.output or os.path.basename(args.extract), 'wb') as extracted_file:
+                extracted_file.write(cli_sink_reader[args.extract])
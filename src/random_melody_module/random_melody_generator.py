@@ -1,9 +1,19 @@
 import os  # Getting and checking paths
-import argparse  # Getting the arguments from the user
 import random  # Generate random values and choices from lists
-from itertools import count, cycle  # Naming unique name to the midi file, and iterating over list many times.
-from collections import deque  # Rotating lists
-from midiutil.MidiFile import MIDIFile  # Creating midi file
+import heapq  # Merging the streams of events in time order
+import struct  # Packing the chunks headers of the MIDI file
+import time  # Timing the stages of the generation, when instrumentation is enabled
+import atexit  # Saving the high-water marks of the output directories when the process ends
+from array import array  # Compact arrays of the note events
+from io import BytesIO  # Writing MIDI files to memory
+from bisect import bisect_right  # Finding where the unconstrained part of a melody ends
+from itertools import accumulate, count, cycle, repeat  # Summing note times, numbering events, repeating chords
+from operator import itemgetter  # Sorting the events of the MIDI tracks
+from collections import namedtuple  # The precomputed theory tables
+from types import MappingProxyType  # Read-only views of the precomputed theory tables
+
+# argparse, midiutil and threading are imported only where they are used - by the command line, by the 'midiutil'
+# backend and by the OutputAllocator - so importing the module (in every worker process, for example) stays fast.
 
 __author__ = 'Dvir Alafi'
 
@@ -28,6 +38,12 @@ When you execute the program at the command line you can pass it as arguments:
                         -a - the emotional Atmosphere of the chords progressions.
                         -l - the Length of the melody - Number of Beats.
                         -b the Bpm of the melody - in numbers.
+                        -s - a Seed, the same seed and options always create the same melody.
+                        -c - Chord aware, the melody plays the notes of the chords on the beats.
+                        -e - the Extension of the chords - 7th, 9th, 11th, 13th, sus2, sus4, sus7, add2, add9.
+                        -v - Voice leading, the chords move to the nearest inversion of the next chord.
+                        -m - the register of the Melody - bass, chords, melody... or the pitches, like 60-84.
+                        -r - the Register of the chords.
 
 When the program is executed by the RandomMelodySite that I created also, it will get it arguments by calling
 the 'main' function with the appropriate arguments.
@@ -42,6 +58,8 @@ DEFAULT_VOLUME = 100
 DEFAULT_CHANCE_FOR_NOTE = 0.99  # 60%
 DEFAULT_CHANCE_FOR_REST = 0.29  # 20%
 DEFAULT_CHANCE_FOR_ADDING = 0.09  # 10%
+TICKS_PER_QUARTERNOTE = 960  # The time resolution of the MIDI file, the same as MidiUtil's
+NOTE_COLUMNS_TYPECODES = ('d', 'd', 'B', 'B', 'B', 'H', 'I')  # Start, duration, pitch, velocity, channel, track, order
 
 # 'building2': "i-v-VI-VII....i-v-VI-VI"
 ATMOSPHERE_DICT = {'happy': 'vi-IV-I-V',
@@ -125,6 +143,19 @@ SCALES_TYPE_LIST = ['aeolian', 'blues', 'bachian', 'chromatic', 'dorian', 'harmo
 SILENCE_DURATIONS_LIST = [0.5, 1]
 NOTE_DURATIONS_LIST = [0.5, 1, 2]
 ADDINGS_DURATIONS_LIST = [0.25, 0.5]
+PITCH_BEND_VALUES = range(3000, 9000, 1000)  # range 3000 - 8000 in a 1000 jumps.
+CHANCE_FOR_CHORD_TONE = 0.8  # 80% - a chord aware melody plays a note of the chord on the beat
+
+# The kinds of events of the melody, and the maximal number of events the bulk engine draws at once:
+MELODY_NOTE, MELODY_REST, MELODY_TRIPLET, MELODY_PITCH_BEND = range(4)
+BULK_MELODY_BLOCK_SIZE = 8192
+
+# The events of the streaming API - (time, NOTE_EVENT, channel, pitch, duration, volume)
+#                                 and (time, PITCH_BEND_EVENT, channel, pitch wheel value):
+NOTE_EVENT = 'note'
+PITCH_BEND_EVENT = 'pitch_bend'
+STREAM_CHUNK_SIZE = 4096  # The encoded MIDI stream is yielded in chunks of about this number of bytes
+HIGH_WATER_MARK_INTERVAL = 64  # The OutputAllocator saves the number of the next file once in this many files
 
 ROMAN_LETTERS_VALUE_DICT = {'I': 1, 'II': 2, 'III': 3, 'IV': 4, 'V': 5, 'VI': 6, 'VII': 7}
 ROMAN_LETTERS_VALUE_LIST = ['Roman Letter:', 'I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
@@ -134,15 +165,24 @@ MAJOR_CHORDS_TYPES = ["major", "minor", "minor", "major", "major", "minor", "dim
 MINOR_CHORDS_TYPES = ["minor", "dim", "major", "minor", "minor", "major", "major"]
 
 HARMONIC_MINOR_CHORDS_TYPES = ["min","dim","aug","min","maj","maj","dim"]
-HARMONIC_MINOR_EXT_CHORDS_TYPES = ["min/maj7","min-7th-flat-5","major-7th-flat-5","minor-7th","dom-7th","maj-7th","dim-7th"]
+HARMONIC_MINOR_EXT_CHORDS_TYPES = ["min/maj7","min-7th-flat-5","aug-maj-7th","min-7th","dom-7th","maj-7th","dim-7th"]
 
 MELODIC_MINOR_CHORDS_TYPES = ["minor","minor","aug","major","major","dim","dim"]
-MELODIC_MINOR_EXT_CHORDS_TYPES = ["min/maj7","min-7th","maj-7th-flat-5","dom-7th","dom-7th","min-7th-flat-5","min-7th-flat-5"]
+MELODIC_MINOR_EXT_CHORDS_TYPES = ["min/maj7","min-7th","aug-maj-7th","dom-7th","dom-7th","min-7th-flat-5","min-7th-flat-5"]
 
 MAJOR_EXT_CHORDS_TYPES = ["maj-7th","min-7th","min-7th","maj-7th","dom-7th","min-7th","min-7th-flat-5"]
 
-MINOR_EXT_CHORDS_TYPES = ["min-7th-flat-5","maj-7th","min-7th","min-7th","maj-7th","dom-7th"]
+MINOR_EXT_CHORDS_TYPES = ["min-7th","min-7th-flat-5","maj-7th","min-7th","min-7th","maj-7th","dom-7th"]
 
+# The 7th chords of the scales that have a table - the 'melodicminor' of SCALES_DICT has 9 notes,
+# the ascending melodic minor is the 'bachian':
+SCALES_EXT_CHORDS_TYPES_DICT = {'major': MAJOR_EXT_CHORDS_TYPES,
+                                'ionian': MAJOR_EXT_CHORDS_TYPES,
+                                'minor': MINOR_EXT_CHORDS_TYPES,
+                                'naturalminor': MINOR_EXT_CHORDS_TYPES,
+                                'aeolian': MINOR_EXT_CHORDS_TYPES,
+                                'harmonicminor': HARMONIC_MINOR_EXT_CHORDS_TYPES,
+                                'bachian': MELODIC_MINOR_EXT_CHORDS_TYPES}
 
 
 CHORDS_SEQUENCE_DICT = {'major': (0, 4, 7),
@@ -150,6 +190,7 @@ CHORDS_SEQUENCE_DICT = {'major': (0, 4, 7),
 
                         'maj-7th': (0, 4, 7 ,11),
                         'min-7th': (0, 3, 7, 10),
+                        'min/maj7': (0, 3, 7, 11),
 
                         'min-7th-flat-5': (0, 3, 6, 10),
                         'maj-7th-flat-5': (0, 4, 6, 11),
@@ -159,37 +200,64 @@ CHORDS_SEQUENCE_DICT = {'major': (0, 4, 7),
 
                         'aug':(0, 4, 8),
                         "aug-7th":(0, 4, 8, 10),
+                        "aug-maj-7th":(0, 4, 8, 11),
 
                         "maj-6th":(0, 4, 7, 9),
                         "maj-9th":(0, 4, 7, 11, 14),
                         "min-6th":(0, 3, 7, 9),
                         "min-9th":(0, 3, 7, 10, 14),
-                        "min-11th":(),
-                        "maj-11th":(),
-                        "min-13th":(),
-                        "maj-13th":(),
+                        "min-11th":(0, 3, 7, 10, 14, 17),
+                        "maj-11th":(0, 4, 7, 11, 14, 17),
+                        "min-13th":(0, 3, 7, 10, 14, 17, 21),
+                        "maj-13th":(0, 4, 7, 11, 14, 17, 21),
 
 
                         "dom-7th":(0, 4, 7, 10),
-                        "dom-7th-sharp-9":(),
-                        "dom-9th":(),
-                        "dom-11th":(),
-                        "dom-13th":(),
+                        "dom-7th-sharp-9":(0, 4, 7, 10, 15),
+                        "dom-9th":(0, 4, 7, 10, 14),
+                        "dom-11th":(0, 4, 7, 10, 14, 17),
+                        "dom-13th":(0, 4, 7, 10, 14, 17, 21),
 
                         "sus2":(0,2,7),        
                         "sus4":(0,5,7),
-                        "sus7":(),
-                        "sus9":(),
-                        "add2":(),
-                        "add9":(),
+                        "sus7":(0, 5, 7, 10),
+                        "sus9":(0, 5, 7, 10, 14),
+                        "add2":(0, 2, 4, 7),
+                        "add9":(0, 4, 7, 14),
                         }
 
+# The chords that can be stacked on every degree of a scale - the steps of their notes in the scale, above the
+# root - 'triad' is the progression of the atmospheres as is:
+CHORD_EXTENSIONS_DICT = {'triad': (0, 2, 4),
+                         '7th': (0, 2, 4, 6),
+                         '9th': (0, 2, 4, 6, 8),
+                         '11th': (0, 2, 4, 6, 8, 10),
+                         '13th': (0, 2, 4, 6, 8, 10, 12),
+                         'sus2': (0, 1, 4),
+                         'sus4': (0, 3, 4),
+                         'sus7': (0, 3, 4, 6),
+                         'add2': (0, 1, 2, 4),
+                         'add9': (0, 2, 4, 8)}
+
+# The registers of the pitch model - the lowest and the highest MIDI pitch of a track, or of the voiced chords:
+REGISTERS_DICT = {'legacy': (59, 70),
+                  'bass': (36, 52),
+                  'chords': (48, 72),
+                  'voicing': (53, 76),
+                  'melody': (60, 84)}
+
+DEFAULT_REGISTER = REGISTERS_DICT['legacy']  # The pitches of CHROMATIC_KEYS_PITCH_DICT - every note once
+VOICING_REGISTER = REGISTERS_DICT['voicing']  # The voiced chords (voice_leading=True), around the melody
+MIDI_PITCHES_COUNT = 128
+
 CHROMATIC_KEYS = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
 
 CHROMATIC_KEYS_PITCH_DICT = {'Bb': 58, 'B': 59, 'B#': 60, 'Cb': 59, 'C': 60, 'C#': 61, 'Db': 61, 'D': 62, 'D#': 63,
                             'Eb': 63, 'E': 64, 'E#': 65, 'Fb': 64, 'F': 65, 'F#': 66, 'Gb': 66, 'G': 67, 'G#': 68,
                             'Ab': 68, 'A': 69, 'A#': 70}
 
+NOTES_PITCH_CLASSES_DICT = {note: pitch % 12 for note, pitch in CHROMATIC_KEYS_PITCH_DICT.items()}
+
 USER_INSTRUCTIONS_TEXT = "You can choose options for the automatic music you want" \
                          "to generate. the options you won't choose will be chosen randomly.\n\n" \
                          "-p - Path to save the midi files.\n" \
@@ -197,358 +265,2387 @@ USER_INSTRUCTIONS_TEXT = "You can choose options for the automatic music you wan
                          "-t - the Type of the scale.\n" \
                          "-a - the emotional Atmosphere of the chords progressions.\n" \
                          "-l - the Length of the melody - Number of Beats.\n" \
-                         "-b - the Bpm of the melody - in numbers.\n"
+                         "-b - the Bpm of the melody - in numbers.\n" \
+                         "-s - a Seed, the same seed and options always create the same melody.\n" \
+                         "-e - the Extension of the chords - 7th, 9th, 11th, 13th, sus2, sus4, sus7, add2, add9.\n" \
+                         "-v - Voice leading, the chords move to the nearest inversion of the next chord.\n" \
+                         "-m - the register of the Melody - bass, chords, melody... or the pitches, like 60-84.\n" \
+                         "-r - the Register of the chords.\n"
                          
 ITEM_NOT_FOUND_USER_MESSAGE = "There is no '{user_input}' in the repository.\nplease select from this list :\n" \
                             "{repository_list}\nUntil then, it'll be chosen randomly. this time it's: {random_decision}"
 
 
-# Functions:
+# Precomputed theory tables:
 
 
-def is_major(chord_notes):
+def stack_scale_chord(scale_size, chord_num, chord_size=3):
     """
-    Gets a chord by his notes.
-    Returns True if the chord is Major, False if its Minor
+    Stacks thirds on a degree of a scale:
+
+    :param scale_size: the number of notes in the scale, for example 7.
+    :param chord_num: the number of the chord, for example I - first, iii - third, etc.
+    :param chord_size: the number of notes in the chord, 3 for a triad.
+
+    :return: a tuple of the indexes of the chord notes in the scale, for example (5, 0, 2) for vi.
+
     """
-    interval = CHROMATIC_KEYS.index(chord_notes[2]) - CHROMATIC_KEYS.index(chord_notes[1])
-    
-    if interval  == 3 or interval == -3:
 
-        return True
-    else:
-        return False
-    
+    return tuple((chord_num - 1 + 2 * i) % scale_size for i in range(chord_size))
 
-def get_chord_notes_by_name(scale_notes,chord_name):
-    
-    scale_notes = scale_notes+scale_notes
 
-    intervals = CHORDS_SEQUENCE_DICT[chord_name] # for example - (0,4,6,10)
+def build_theory_tables():
+    """
+    Builds the lookup tables of every key, scale type, degree and chord type.
+    The pitches are stored as pitch classes - 0 for C, 1 for C#, ..., 11 for B.
 
-    chord_notes = []
-    for i in range(len(intervals)):
-        chord_notes.append(scale_notes[intervals[i]])
-        print(chord_notes)
-    return chord_notes
+    :return: a tuple of five dicts:
+             scale pitch classes - (key, scale type) -> (0, 2, 4, ...)
+             scale notes - (key, scale type) -> ('C', 'D', 'E', ...)
+             scale chords - scale notes -> a tuple of the notes of the chords of all the degrees, I to VII.
+             chord notes - (root note, chord type) -> ('C', 'E', 'G')
+             scale 7th chords - scale notes -> like the scale chords, with the 7th chords of the degrees.
 
+    """
 
-def get_chord_notes_by_note_and_type(note,type):
+    scale_pitch_classes_index = {}
+    scale_notes_index = {}
+    scale_chords_index = {}
+    chord_notes_index = {}
+    scale_seventh_chords_index = {}
+
+    doubled_chromatic_keys = CHROMATIC_KEYS + CHROMATIC_KEYS  # Going up from any key without a modulo
+
+    # The scales have only a few sizes, and the chords of all the scales of a size are at the same indexes:
+    chords_getters = {}  # scale size -> getters of the notes of the chords I to VII
+    seventh_chords_getters = {}
+    for scale_jumping_values in SCALES_DICT.values():
+        scale_size = len(scale_jumping_values)
+        if scale_size not in chords_getters:
+            chords_getters[scale_size] = [itemgetter(*stack_scale_chord(scale_size, chord_num))
+                                          for chord_num in ROMAN_LETTERS_VALUE_DICT.values()]
+            seventh_chords_getters[scale_size] = [itemgetter(*stack_scale_chord(scale_size, chord_num, 4))
+                                                  for chord_num in ROMAN_LETTERS_VALUE_DICT.values()]
+
+    for key_position, scale_key in enumerate(CHROMATIC_KEYS):
+        for scale_type, scale_jumping_values in SCALES_DICT.items():
+            pitch_classes = tuple([(key_position + jump_value) % 12 for jump_value in scale_jumping_values])
+            scale_notes = itemgetter(*pitch_classes)(CHROMATIC_KEYS)
+
+            scale_pitch_classes_index[(scale_key, scale_type)] = pitch_classes
+            scale_notes_index[(scale_key, scale_type)] = scale_notes
+            scale_chords_index[scale_notes] = tuple([chord_getter(scale_notes)
+                                                     for chord_getter in chords_getters[len(scale_notes)]])
+
+        for chord_type, intervals in CHORDS_SEQUENCE_DICT.items():
+            chord_notes_index[(scale_key, chord_type)] = (scale_key,) + tuple(
+                [doubled_chromatic_keys[key_position + interval % 12] for interval in intervals[1:]])
+
+    for (scale_key, scale_type), scale_notes in scale_notes_index.items():
+        if scale_notes in scale_seventh_chords_index:
+            continue
+        scale_seventh_chords_index[scale_notes] = tuple([chord_getter(scale_notes)
+                                                         for chord_getter in seventh_chords_getters[len(scale_notes)]])
 
-    cycle_list = CHROMATIC_KEYS+CHROMATIC_KEYS
+    # The tables of the 7th chords name the same chords that are stacked from the scales:
+    for scale_type, ext_chords_types in SCALES_EXT_CHORDS_TYPES_DICT.items():
+        for scale_key in CHROMATIC_KEYS:
+            scale_notes = scale_notes_index[(scale_key, scale_type)]
+            table_chords = tuple([chord_notes_index[(root_note, chord_type)]
+                                  for root_note, chord_type in zip(scale_notes, ext_chords_types)])
+            if table_chords != scale_seventh_chords_index[scale_notes]:
+                raise ValueError("The 7th chords of {scale_key} {scale_type} don't match its table: {chords}".format(
+                    scale_key=scale_key, scale_type=scale_type, chords=table_chords))
 
-    chord_notes= [note,]
-    c=1
-    root_note_position = CHROMATIC_KEYS.index(note)
+    return (scale_pitch_classes_index, scale_notes_index, scale_chords_index, chord_notes_index,
+            scale_seventh_chords_index)
 
-    while(len(chord_notes) < len(CHORDS_SEQUENCE_DICT[type])):
-        chord_notes.append(cycle_list[root_note_position + CHORDS_SEQUENCE_DICT[type][c]])
-        c += 1
-    
-    return chord_notes
+
+TheoryTables = namedtuple('TheoryTables', ['scale_pitch_classes', 'scale_notes', 'scale_chords', 'chord_notes',
+                                           'scale_seventh_chords'])
+
+theory_tables = None  # Built by 'get_theory_tables' on the first generation, not on import
 
 
-def get_chord_notes_by_num(scale_notes, chord_num):
+def get_theory_tables():
+    """
+    :return: the read-only TheoryTables of 'build_theory_tables', built once on the first call.
     """
-    Returns the notes of the required chord:
 
-    :param scale_notes: list of the notes in the scale of the chord , for example, ['C','D','E','F','G','A','B']
-    :param chord_num: the number of the chord, for example I - first, iii - third, etc.
+    global theory_tables
+    if theory_tables is None:
+        theory_tables = TheoryTables(*(MappingProxyType(table) for table in build_theory_tables()))
+    return theory_tables
 
-    :return: list of notes of the required chord
 
+# Chord tone index:
+
+
+class ChordToneIndex(object):
+    """
+    The chord that plays at every beat of a chord progression, in a beat-indexed array -
+    so finding the chord of a note is O(1), however long the piece is.
+
+    :param chords_list: the notes of the chords of the progression, in the order they are played.
+    :param chord_duration: the number of beats of every chord.
+    :param cyclic: True for a progression that repeats forever (like the streamed one) - the beats after its end
+                   are looked up from its start.
+    :param last_chord_duration: the number of beats of the last chord, when it is longer than the others
+                                (it takes the beats that are left) - chord_duration by default.
     """
-    cycle_list = cycle(scale_notes)
-    chord_notes = []
-    chord_num -= 1  # Because of the index in lists. if i want the first one it's in index 0 and not in 1.
 
-    for note in cycle_list:
-        if scale_notes.index(note) == chord_num or scale_notes.index(note) == chord_num - len(scale_notes):
-            chord_notes.append(note)
-            chord_num += 2
-        if len(chord_notes) == 3:
-            break
+    def __init__(self, chords_list, chord_duration, cyclic=False, last_chord_duration=None):
+        self.chords = tuple([tuple(chord_notes) for chord_notes in chords_list])
+        self.chords_pitches = tuple([tuple([CHROMATIC_KEYS_PITCH_DICT[note] for note in chord_notes])
+                                     for chord_notes in self.chords])
+        self.chord_duration = int(chord_duration)
+        self.last_chord_duration = self.chord_duration if last_chord_duration is None else int(last_chord_duration)
+        self.cyclic = cyclic and len(self) > 0
 
-    return chord_notes
+        # beat -> the position of its chord in the progression, built on the first lookup - most progressions
+        # are only written to the file, and never looked up:
+        self.beat_chords = None
 
+    def __len__(self):
+        if not self.chords:
+            return 0
+        return (len(self.chords) - 1) * self.chord_duration + self.last_chord_duration
 
-def get_chords_of_scale(scale_key,scale_type):
-    scale_notes = get_scale_notes(scale_key,scale_type)
-        
+    def build_beat_chords(self):
+        self.beat_chords = array('h')
+        for chord_position in range(len(self.chords) - 1):
+            self.beat_chords.extend(repeat(chord_position, self.chord_duration))
+        if self.chords:
+            self.beat_chords.extend(repeat(len(self.chords) - 1, self.last_chord_duration))
 
-    roman_letters = list(ROMAN_LETTERS_VALUE_DICT.keys())
-    chords_numbers = list(ROMAN_LETTERS_VALUE_DICT.values())
+    def get_chord_position(self, time):
+        """
+        :param time: the time in beats.
 
-    chords_dict = {}
+        :return: the position of the chord that plays at the time in the progression, -1 if none plays.
+        """
 
-    for counter in range(len(chords_numbers)):
-        chord_num = chords_numbers[counter]
-        roman_letter = roman_letters[counter]
-        chords_dict[roman_letter] = get_chord_notes_by_num(scale_notes,chord_num)
-        
-    return chords_dict
+        if self.beat_chords is None:
+            self.build_beat_chords()
 
+        beat = int(time)
+        if self.cyclic and beat >= 0:
+            beat %= len(self.beat_chords)
+        if 0 <= beat < len(self.beat_chords):
+            return self.beat_chords[beat]
+        return -1
 
-def get_unique_file_name(file_path, basename, ext):
+    def get_chord_notes(self, time):
+        """
+        :return: the notes of the chord that plays at the time (in beats), an empty tuple if none plays.
+        """
+
+        chord_position = self.get_chord_position(time)
+        return self.chords[chord_position] if chord_position >= 0 else ()
+
+    def get_chord_pitches(self, time):
+        """
+        :return: the pitches of the notes of the chord that plays at the time (in beats), like the melody's.
+        """
+
+        chord_position = self.get_chord_position(time)
+        return self.chords_pitches[chord_position] if chord_position >= 0 else ()
+
+
+# Compact note events:
+
+
+class NoteEvent(object):
+    """
+    A single note of a NoteEvents container - its start and duration are in beats.
     """
-    Returns a unique file path, with a new file name:
 
-    :param file_path: The path of the file
-    :param basename: the name of the file
-    :param ext: the extension of the file, for example '.txt', '.py', '.mid' .
+    __slots__ = ('start', 'duration', 'pitch', 'velocity', 'channel', 'track')
 
-    :return: a unique file path with a unique name that doesnt exists in the path of the given folder.
-             for example, if it has: Midis/RandoMMelody, then, it will return: Midis/RandoMMelody_2,
-              and that in the next process: Midis/RandoMMelody_3, etc.
+    def __init__(self, start, duration, pitch, velocity, channel=0, track=0):
+        self.start = start
+        self.duration = duration
+        self.pitch = pitch
+        self.velocity = velocity
+        self.channel = channel
+        self.track = track
+
+    def as_tuple(self):
+        return self.start, self.duration, self.pitch, self.velocity, self.channel, self.track
 
+    def __eq__(self, other):
+        return isinstance(other, NoteEvent) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        return 'NoteEvent(start={0!r}, duration={1!r}, pitch={2!r}, velocity={3!r}, channel={4!r}, ' \
+               'track={5!r})'.format(*self.as_tuple())
+
+
+class PitchBendEvent(object):
+    """
+    A single pitch wheel event of a NoteEvents container - its time is in beats.
     """
 
-    file_name = file_path + '\\' + "{basename}.{ext}".format(basename=basename, ext=ext)
-    available_numbers_counter = count(2)
+    __slots__ = ('time', 'value', 'channel', 'track')
 
-    while os.path.exists(file_name):
-        file_name = file_path + '\\' + "{basename}_{number}.{ext}".format(basename=basename,
-                                                                         number=next(available_numbers_counter),
-                                                                         ext=ext)
-    return file_name
+    def __init__(self, time, value, channel=0, track=0):
+        self.time = time
+        self.value = value
+        self.channel = channel
+        self.track = track
 
+    def as_tuple(self):
+        return self.time, self.value, self.channel, self.track
 
-def get_scale_notes(scale_key, scale_type):
+    def __eq__(self, other):
+        return isinstance(other, PitchBendEvent) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        return 'PitchBendEvent(time={0!r}, value={1!r}, channel={2!r}, track={3!r})'.format(*self.as_tuple())
+
+
+def get_note_column_property(column_index):
+    """
+    :return: a property of a column of the notes of NoteEvents, that moves the pending notes to the columns
+             before the column is used.
     """
-    Finds the notes of the given scale:
 
+    def get_column(note_events):
+        note_events.flush_notes()
+        return note_events.note_columns[column_index]
 
-    :param scale_key: the key of the scale, for example, 'C#'
-    :param scale_type: the type of the scale, for example 'minor'
+    def set_column(note_events, column):
+        note_events.flush_notes()
+        note_events.note_columns[column_index] = column
 
-    :return: a list of the notes in the specific key and type.
+    return property(get_column, set_column)
 
+
+class NoteEvents(object):
     """
+    The notes and pitch bends of a MIDI file, in parallel arrays - about 25 bytes for a note, instead of the
+    objects MidiUtil creates for every note.
 
-    if scale_type not in SCALES_DICT:
-        scale_type = random.choice(list(SCALES_DICT.keys()))
-        print(ITEM_NOT_FOUND_USER_MESSAGE.format(scale_type, list(SCALES_DICT.keys()), scale_type))
+    It has the methods of MidiUtil's MIDIFile that the generators use, so they write into it like into a
+    MIDI file. The encoders read it (SMFWriter is a NoteEvents that encodes itself), and 'write_to' adds
+    it to any other MIDI file object. Transposing, quantizing and changing the velocities of the notes are
+    bulk operations on the arrays, without generating the file again.
+
+    Every event keeps the order it was added in, so the files written from it are the same as if the events
+    were added to the MIDI file object directly.
+    """
 
-    scale_jumping_values = SCALES_DICT[scale_type]
-    diatonic_notes_deque = deque(CHROMATIC_KEYS)
+    def __init__(self, num_tracks=1):
+        self.num_tracks = num_tracks
+
+        # The notes, an index in all of the columns is a note - see NOTE_COLUMNS_TYPECODES:
+        self.note_columns = [array(typecode) for typecode in NOTE_COLUMNS_TYPECODES]
+        # The notes that were added and not moved to the columns yet, as tuples of the columns - appending a
+        # tuple is much cheaper than appending to seven arrays:
+        self.pending_notes = []
+
+        # The pitch wheel events:
+        self.bend_times = array('d')  # Beats
+        self.bend_values = array('h')
+        self.bend_channels = array('B')
+        self.bend_tracks = array('H')
+        self.bend_orders = array('I')
+
+        self.track_names = [[] for _ in range(num_tracks)]  # (time, name, order)
+        self.tempo_events = []  # (time, track, tempo, order)
+        self.event_counter = 0
+
+    def addTrackName(self, track, time, track_name):
+        self.track_names[track].append((time, track_name, self.event_counter))
+        self.event_counter += 1
+
+    def addTempo(self, track, time, tempo):
+        self.tempo_events.append((time, track, tempo, self.event_counter))
+        self.event_counter += 1
+
+    def addNote(self, track, channel, pitch, time, duration, volume, annotation=None):
+        self.pending_notes.append((time, duration, pitch, volume, channel, track, self.event_counter))
+        self.event_counter += 1
+
+    def addPitchWheelEvent(self, track, channel, time, pitch_wheel_value):
+        self.bend_times.append(time)
+        self.bend_values.append(pitch_wheel_value)
+        self.bend_channels.append(channel)
+        self.bend_tracks.append(track)
+        self.bend_orders.append(self.event_counter)
+        self.event_counter += 1
+
+    def add_notes(self, track, channel, notes):
+        """
+        Adds many notes at once, in their order.
+
+        :param notes: a list of (time, duration, pitch, volume) tuples, like the notes of the bulk engine.
+        """
+
+        self.pending_notes.extend([(time, duration, pitch, volume, channel, track, order)
+                                   for (time, duration, pitch, volume), order
+                                   in zip(notes, count(self.event_counter))])
+        self.event_counter += len(notes)
+
+    def flush_notes(self):
+        """
+        Moves the pending notes to the columns, a column at a time.
+        """
+
+        if not self.pending_notes:
+            return
+
+        for column, values in zip(self.note_columns, zip(*self.pending_notes)):
+            column.extend(values)
+        self.pending_notes.clear()
+
+    starts = get_note_column_property(0)  # Beats
+    durations = get_note_column_property(1)  # Beats
+    pitches = get_note_column_property(2)
+    velocities = get_note_column_property(3)
+    channels = get_note_column_property(4)
+    tracks = get_note_column_property(5)
+    orders = get_note_column_property(6)  # The order of insertion, for events at the same time
+
+    def __len__(self):
+        return len(self.note_columns[0]) + len(self.pending_notes)
+
+    def __getitem__(self, index):
+        return NoteEvent(self.starts[index], self.durations[index], self.pitches[index], self.velocities[index],
+                         self.channels[index], self.tracks[index])
+
+    def __iter__(self):
+        return map(NoteEvent, self.starts, self.durations, self.pitches, self.velocities, self.channels,
+                   self.tracks)
+
+    def pitch_bends(self):
+        """
+        :return: an iterator of the pitch wheel events, as PitchBendEvent objects.
+        """
+
+        return map(PitchBendEvent, self.bend_times, self.bend_values, self.bend_channels, self.bend_tracks)
+
+    def get_note_indexes(self, track=None):
+        """
+        :return: the indexes of the notes of the track, or of all of the notes when track is None.
+        """
+
+        if track is None:
+            return range(len(self.starts))
+        return [index for index, note_track in enumerate(self.tracks) if note_track == track]
+
+    def get_size_in_bytes(self):
+        """
+        :return: the memory the arrays of the events take, in bytes.
+        """
+
+        return sum(events_array.itemsize * len(events_array) for events_array in (
+            self.starts, self.durations, self.pitches, self.velocities, self.channels, self.tracks, self.orders,
+            self.bend_times, self.bend_values, self.bend_channels, self.bend_tracks, self.bend_orders))
+
+    def transpose(self, semitones, track=None):
+        """
+        Moves the pitch of the notes of the track (all of the tracks by default) by a number of semitones,
+        limited to the MIDI pitches 0 - 127.
+        """
+
+        pitches = self.pitches
+        if track is None:
+            self.pitches = array('B', [min(max(pitch + semitones, 0), 127) for pitch in pitches])
+        else:
+            for index in self.get_note_indexes(track):
+                pitches[index] = min(max(pitches[index] + semitones, 0), 127)
+
+    def quantize(self, grid=0.25, track=None):
+        """
+        Moves the start and the end of the notes of the track (all of the tracks by default) to the closest
+        multiple of the grid, in beats. A note is never shorter than the grid.
+        """
+
+        starts = self.starts
+        durations = self.durations
+        for index in self.get_note_indexes(track):
+            start = round(starts[index] / grid) * grid
+            end = round((starts[index] + durations[index]) / grid) * grid
+            starts[index] = start
+            durations[index] = max(end - start, grid)
+
+    def apply_velocity_curve(self, curve, track=None):
+        """
+        Sets the velocity of the notes of the track (all of the tracks by default) by a curve,
+        limited to the velocities 1 - 127.
+
+        :param curve: a function of (start in beats, velocity) that returns the new velocity,
+                      for example a crescendo - lambda start, velocity: velocity * (0.5 + start / 32).
+        """
+
+        starts = self.starts
+        velocities = self.velocities
+        for index in self.get_note_indexes(track):
+            velocities[index] = min(max(int(curve(starts[index], velocities[index])), 1), 127)
+
+    def iter_ordered_calls(self):
+        """
+        :return: an iterator of (method name, arguments) of the MIDIFile methods that add the events,
+                 in the order the events were added.
+        """
+
+        calls = [(order, 'addTrackName', (track, time, track_name))
+                 for track, names in enumerate(self.track_names) for time, track_name, order in names]
+        calls.extend((order, 'addTempo', (track, time, tempo)) for time, track, tempo, order in self.tempo_events)
+        calls.extend((order, 'addNote', (track, channel, pitch, start, duration, velocity))
+                     for start, duration, pitch, velocity, channel, track, order in zip(
+                         self.starts, self.durations, self.pitches, self.velocities, self.channels, self.tracks,
+                         self.orders))
+        calls.extend((order, 'addPitchWheelEvent', (track, channel, time, value))
+                     for time, value, channel, track, order in zip(
+                         self.bend_times, self.bend_values, self.bend_channels, self.bend_tracks, self.bend_orders))
+        calls.sort(key=itemgetter(0))
+
+        return ((method_name, arguments) for _, method_name, arguments in calls)
+
+    def write_to(self, midi_file):
+        """
+        Adds all of the events to a MIDI file object, for example MidiUtil's MIDIFile, in their order.
+
+        :return: the MIDI file object.
+        """
+
+        for method_name, arguments in self.iter_ordered_calls():
+            getattr(midi_file, method_name)(*arguments)
+
+        return midi_file
+
+
+# Standard MIDI File writer:
+
+# The order of the events at the same tick, the same as MidiUtil's 'sec_sort_order':
+TRACK_NAME_SORT_ORDER = 0
+PITCH_WHEEL_SORT_ORDER = 1
+NOTE_OFF_SORT_ORDER = 2
+NOTE_ON_SORT_ORDER = 3
+TEMPO_SORT_ORDER = 3
+
+END_OF_TRACK_EVENT = b'\x00\xff\x2f\x00'
+
+VARIABLE_LENGTH_CACHE = {}  # delta time -> its bytes, the same few delta times repeat in every file
+
+
+def encode_variable_length(value):
+    """
+    Encodes a number as a MIDI variable length quantity - 7 bits in every byte, most significant first,
+    with the high bit set on all the bytes but the last:
+
+    :param value: a non-negative integer, for example 8192
 
-    diatonic_notes_deque.rotate(12 - CHROMATIC_KEYS.index(scale_key))
-    scale_notes = ()
-    for jump_value in scale_jumping_values:
-        scale_notes += (diatonic_notes_deque[jump_value],)  # Using Tuple for memory saving
+    :return: the bytes of the quantity, for example b'\xc0\x00'
 
-    return scale_notes
+    """
 
+    encoded = VARIABLE_LENGTH_CACHE.get(value)
+
+    if encoded is None:
+        if value < 0:
+            raise ValueError("A variable length quantity can't be negative: {value}".format(value=value))
+
+        variable_length_bytes = [value & 0x7f]
+        remaining_value = value >> 7
+        while remaining_value:
+            variable_length_bytes.append((remaining_value & 0x7f) | 0x80)
+            remaining_value >>= 7
+        encoded = bytes(reversed(variable_length_bytes))
+
+        if len(VARIABLE_LENGTH_CACHE) < 65536:
+            VARIABLE_LENGTH_CACHE[value] = encoded
+
+    return encoded
 
-def generate_chord_progression(requested_melody_length, midi_file, chords_track,
-                               scale_notes, chords_atmosphere):
 
+class SMFWriter(NoteEvents):
     """
-    Generate the chord progression and write it to the MIDI file:
+    Writes a Standard MIDI File (format 1) straight from its compact note events.
 
+    It has the methods of MidiUtil's MIDIFile that the generators use, and writes exactly the same bytes
+    as MIDIFile(num_tracks) does: a tempo track first, duplicated events removed, and the same order of
+    the events at the same tick. It doesn't create an object for every event, so it is several times faster.
+    """
 
-    :param requested_melody_length: the melody length requested .
-    :param midi_file: the MIDI file Object, to manipulate and write to.
-    :param chords_track: the chords track of the MIDI file
-    :param scale_notes: a list of the notes in a specific key.
-    :param chords_atmosphere: the atmosphere of the chords. for example - sad, happy, pop, etc.
+    def __init__(self, num_tracks=1, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+        super(SMFWriter, self).__init__(num_tracks)
+        self.ticks_per_quarternote = ticks_per_quarternote
 
-    :return: None.
-             making a change in the given MIDI file.
+    def tempo_track_chunk(self):
+        """
+        :return: the bytes of the tempo track chunk, header included.
+        """
+
+        events = []
+        seen = set()
+        for time, _, tempo, order in self.tempo_events:
+            # Like in every format 1 file, the tempo goes to the tempo track, whatever the track is.
+            tick = int(time * self.ticks_per_quarternote)
+            microseconds_per_quarternote = int(60000000 / tempo)
+            if (tick, microseconds_per_quarternote) not in seen:
+                seen.add((tick, microseconds_per_quarternote))
+                events.append((tick, TEMPO_SORT_ORDER, order,
+                               b'\xff\x51\x03' + struct.pack('>L', microseconds_per_quarternote)[1:], None))
+        events.sort(key=itemgetter(0, 1, 2))
+
+        return encode_track_chunk(events)
+
+    def track_chunk(self, track):
+        """
+        :param track: the number of the track, 0 for the first track after the tempo track.
+
+        :return: the bytes of the track chunk, header included.
+        """
+
+        return encode_track_chunk(get_track_events(self, track, self.ticks_per_quarternote))
+
+    def to_bytes(self):
+        """
+        :return: the bytes of the whole MIDI file.
+        """
+
+        chunks = [self.tempo_track_chunk()] + [self.track_chunk(track) for track in range(self.num_tracks)]
+        return encode_midi_file(chunks, self.ticks_per_quarternote)
 
+    def writeFile(self, file_handle):
+        file_handle.write(self.to_bytes())
 
 
+def get_track_events(note_events, track, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
     """
+    Converts the events of a track to sorted (tick, sort order, insertion order, bytes, note key) tuples,
+    removing duplicates and fixing overlapping notes of the same pitch, like MidiUtil does.
 
-    channel = 1  # Because 0 is for the melody part.
-    current_melody_length = 0  # Initiate the time stamp for the track
-    volume = DEFAULT_VOLUME
+    :param note_events: the NoteEvents of the MIDI file.
+    :param track: the number of the track.
+    :param ticks_per_quarternote: the time resolution of the file.
 
-    #  chord_progression_values = for example I-V-vi-IV
-    if chords_atmosphere in ATMOSPHERE_DICT:
-        chord_progression_values = ATMOSPHERE_DICT[chords_atmosphere].split('-')
-    else:
-        chord_progression_values = random.choice(list(ATMOSPHERE_DICT.values())).split('-')
-        print(ITEM_NOT_FOUND_USER_MESSAGE.format(user_input=chords_atmosphere,
-                                                 repository_list=list(ATMOSPHERE_DICT.keys()),
-                                                 random_decision=chord_progression_values))
+    :return: a list of the events, in the order they are written to the track.
 
-    # chords_list = for example  [['E', 'G#', 'B'], ['B', 'D#', 'F#'], ['C#', 'E', 'G#'], ['A', 'C#', 'E']]
-    chords_list = [get_chord_notes_by_num(scale_notes,
-                                          ROMAN_LETTERS_VALUE_DICT[x.upper()]) for x in chord_progression_values]
+    """
 
-    duration = int(requested_melody_length / 4)
+    events = []
+
+    seen_names = set()
+    for time, track_name, order in note_events.track_names[track]:
+        tick = int(time * ticks_per_quarternote)
+        if (tick, track_name) not in seen_names:
+            seen_names.add((tick, track_name))
+            encoded_name = track_name.encode("ISO-8859-1")
+            events.append((tick, TRACK_NAME_SORT_ORDER, order,
+                           b'\xff\x03' + encode_variable_length(len(encoded_name)) + encoded_name, None))
+
+    for time, value, channel, bend_track, order in zip(note_events.bend_times, note_events.bend_values,
+                                                        note_events.bend_channels, note_events.bend_tracks,
+                                                        note_events.bend_orders):
+        if bend_track != track:
+            continue
+        value += 8192
+        events.append((int(time * ticks_per_quarternote), PITCH_WHEEL_SORT_ORDER, order,
+                       bytes((0xe0 | channel, value & 0x7f, value >> 7)), None))
+
+    # A note that starts (or stops) at the same tick as an earlier note of the same pitch is a duplicate:
+    seen_note_ons = set()
+    seen_note_offs = set()
+    for start, duration, pitch, volume, channel, note_track, order in zip(
+            note_events.starts, note_events.durations, note_events.pitches, note_events.velocities,
+            note_events.channels, note_events.tracks, note_events.orders):
+        if note_track != track:
+            continue
+        tick = int(start * ticks_per_quarternote)
+        off_tick = tick + int(duration * ticks_per_quarternote)
+        note_key = (pitch, channel)
+        if (tick, note_key) not in seen_note_ons:
+            seen_note_ons.add((tick, note_key))
+            events.append((tick, NOTE_ON_SORT_ORDER, order, bytes((0x90 | channel, pitch, volume)), note_key))
+        if (off_tick, note_key) not in seen_note_offs:
+            seen_note_offs.add((off_tick, note_key))
+            events.append((off_tick, NOTE_OFF_SORT_ORDER, order, bytes((0x80 | channel, pitch, volume)),
+                           note_key))
+
+    sort_key = itemgetter(0, 1, 2)
+    events.sort(key=sort_key)
+
+    # A note that starts before the previous note of the same pitch stopped, stops the newer one at the
+    # tick it starts (MidiUtil's 'deinterleave'):
+    open_notes = {}  # note key -> ticks of the notes that didn't stop yet
+    moved_note_offs = False
+    for index, event in enumerate(events):
+        note_key = event[4]
+        if note_key is None:
+            continue
+        if event[1] == NOTE_ON_SORT_ORDER:
+            open_notes.setdefault(note_key, []).append(event[0])
+        else:
+            note_ticks = open_notes.get(note_key)
+            if not note_ticks:
+                continue
+            if len(note_ticks) > 1:
+                events[index] = (note_ticks.pop(),) + event[1:]
+                moved_note_offs = True
+            else:
+                note_ticks.pop()
 
-    # Writing chords to the file
-    for chord_notes in chords_list:
-        for note in chord_notes:
-            pitch = CHROMATIC_KEYS_PITCH_DICT[note]
+    if moved_note_offs:
+        events.sort(key=sort_key)
 
-            midi_file.addNote(chords_track, channel, pitch, current_melody_length, duration, volume)
+    return events
 
-        current_melody_length += duration  # after adding one chord the next should be after him.
 
+def encode_track_chunk(events):
+    """
+    :param events: sorted (tick, sort order, insertion order, bytes, note key) tuples.
 
-def generate_random_melody(requested_melody_length, midi_file, melody_track, scale_notes):
+    :return: the bytes of a track chunk - its header, the events with their delta times, and the end of the track.
 
     """
-    Generate the melody and write it to the MIDI file:
 
+    parts = []
+    previous_tick = 0
+    for event in events:
+        tick = event[0]
+        parts.append(encode_variable_length(tick - previous_tick))
+        parts.append(event[3])
+        previous_tick = tick
+    parts.append(END_OF_TRACK_EVENT)
 
-    :param requested_melody_length: the melody length requested .
-    :param midi_file: the MIDI file Object, to manipulate and write to.
-    :param melody_track: the melody track of the MIDI file
-    :param scale_notes: a list of the notes in a specific key.
+    track_data = b''.join(parts)
+    return b'MTrk' + struct.pack('>L', len(track_data)) + track_data
 
-    :return: None.
-             making a change in the given MIDI file.
 
+def encode_midi_file(track_chunks, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
     """
+    Joins the track chunks to a format 1 MIDI file, in a buffer allocated once for the whole file:
 
-    channel = 0  # Because 1 is for the chords part.
-    current_melody_length = 0  # Initiate the time stamp for the track
-    volume = DEFAULT_VOLUME
+    :param track_chunks: a list of the bytes of the track chunks, the tempo track first.
+    :param ticks_per_quarternote: the time resolution of the file.
 
-    chance_for_note = DEFAULT_CHANCE_FOR_NOTE
-    chance_for_rest = DEFAULT_CHANCE_FOR_REST
-    chance_for_adding = DEFAULT_CHANCE_FOR_ADDING
+    :return: the bytes of the MIDI file.
 
-    while current_melody_length < requested_melody_length:
-        random_chance = random.random()
+    """
 
-        # if random_chance is between the 0.39 and 0.99 area its a
-        # 60% chance and a note is added to the file:
-        if chance_for_note > random_chance > chance_for_rest:
+    midi_bytes = bytearray(14 + sum(len(chunk) for chunk in track_chunks))
+    struct.pack_into('>4sLHHH', midi_bytes, 0, b'MThd', 6, 1, len(track_chunks), ticks_per_quarternote)
 
-            pitch_letter = random.choice(scale_notes)
-            pitch = CHROMATIC_KEYS_PITCH_DICT[pitch_letter]
+    midi_view = memoryview(midi_bytes)
+    position = 14
+    for chunk in track_chunks:
+        midi_view[position:position + len(chunk)] = chunk
+        position += len(chunk)
 
-            # continuing from the preview note:
-            note_time = current_melody_length
+    return bytes(midi_bytes)
 
-            duration = random.choice(NOTE_DURATIONS_LIST)
-            if requested_melody_length - current_melody_length < min(NOTE_DURATIONS_LIST):
-                break
-            while duration > requested_melody_length - current_melody_length:
-                duration = random.choice(NOTE_DURATIONS_LIST)
 
-            # Adding the note to the Midi file:
-            midi_file.addNote(melody_track, channel, pitch, note_time, duration, volume)
+# Standard MIDI File reader:
 
-            current_melody_length += duration
-            continue
 
-        # if random_chance is between the 0.09 and 0.39 area its a
-        # 30% chance and silence is added to the file:
-        elif chance_for_rest > random_chance > chance_for_adding:
-            # Adding rest (silence):
-            duration_of_rest = random.choice(SILENCE_DURATIONS_LIST)
-            if requested_melody_length - current_melody_length < min(SILENCE_DURATIONS_LIST):
-                break
+def read_variable_length(data, position):
+    """
+    Decodes a MIDI variable length quantity:
 
-            while duration_of_rest > requested_melody_length - current_melody_length:
-                duration_of_rest = random.choice(SILENCE_DURATIONS_LIST)
+    :param data: the bytes to read from.
+    :param position: the index of the first byte of the quantity.
 
-            current_melody_length += duration_of_rest
-            continue
+    :return: a tuple of the value, and the index of the byte after the quantity.
 
-        #  Here it Adds an Adding:
-        if random.choice([0, 1, 2, 3]) > 0:
-            #  triplets of notes
-            if requested_melody_length - current_melody_length < max(ADDINGS_DURATIONS_LIST):
-                # calculating the remaining time left.
+    """
+
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, position
+
+
+def read_track_chunk(data, position, end, track, ticks_per_quarternote, note_events):
+    """
+    Reads the events of a track chunk into the NoteEvents, the notes are added in the order they start.
+    Notes that never stop are dropped.
+    """
+
+    tick = 0
+    running_status = None
+    open_notes = {}  # (channel, pitch) -> [(tick, velocity), ...] of the notes that didn't stop yet
+    notes = []  # (tick, duration ticks, pitch, velocity, channel)
+
+    while position < end:
+        delta_time, position = read_variable_length(data, position)
+        tick += delta_time
+
+        status = data[position]
+        if status & 0x80:
+            position += 1
+        elif running_status is None:
+            raise ValueError("A data byte without a status at byte {position}".format(position=position))
+        else:
+            status = running_status
+
+        if status == 0xff:  # Meta event
+            meta_type = data[position]
+            length, position = read_variable_length(data, position + 1)
+            meta_data = data[position:position + length]
+            position += length
+            if meta_type == 0x03:
+                note_events.addTrackName(track, tick / ticks_per_quarternote, meta_data.decode("ISO-8859-1"))
+            elif meta_type == 0x51 and length == 3:
+                note_events.addTempo(track, tick / ticks_per_quarternote,
+                                     60000000 / int.from_bytes(meta_data, 'big'))
+            elif meta_type == 0x2f:
                 break
-            duration = random.choice(SILENCE_DURATIONS_LIST)
-            for i in range(3):
-                
-                
-                pitch_letter = random.choice(scale_notes)
-                pitch = CHROMATIC_KEYS_PITCH_DICT[pitch_letter]
+            continue
 
-                # continuing from the preview note:
-                note_time = current_melody_length
-                # Adding the note to the Midi file:
-                midi_file.addNote(melody_track, channel, pitch, note_time, duration, volume)
+        if status in (0xf0, 0xf7):  # System exclusive event
+            length, position = read_variable_length(data, position)
+            position += length
+            continue
 
-                current_melody_length += duration
+        running_status = status
+        message_type = status & 0xf0
+        channel = status & 0x0f
 
+        if message_type in (0xc0, 0xd0):  # Program change and channel pressure have a single data byte
+            position += 1
             continue
 
-        #  Pitch bend:
-        pitch_quantity = random.choice(range(3000, 9000, 1000))  # range 3000 - 8000 in a 1000 jumps.
-        MIDIFile.addPitchWheelEvent(midi_file, melody_track, channel, float(current_melody_length), pitch_quantity)
+        first_data_byte, second_data_byte = data[position], data[position + 1]
+        position += 2
 
+        if message_type == 0x90 and second_data_byte > 0:
+            open_notes.setdefault((channel, first_data_byte), []).append((tick, second_data_byte))
+        elif message_type in (0x80, 0x90):
+            started_notes = open_notes.get((channel, first_data_byte))
+            if started_notes:
+                start_tick, velocity = started_notes.pop(0)
+                notes.append((start_tick, tick - start_tick, first_data_byte, velocity, channel))
+        elif message_type == 0xe0:
+            note_events.addPitchWheelEvent(track, channel, tick / ticks_per_quarternote,
+                                           (first_data_byte | second_data_byte << 7) - 8192)
 
-def play_midi_file(midi_file_path):
+    notes.sort(key=itemgetter(0))
+    for start_tick, duration, pitch, velocity, channel in notes:
+        note_events.addNote(track, channel, pitch, start_tick / ticks_per_quarternote,
+                            duration / ticks_per_quarternote, velocity)
+
+
+def read_midi_file(midi_bytes):
     """
-    Playing a Midi file
+    Reads the notes, the pitch wheel events, the track names and the tempos of a Standard MIDI File.
 
-    :param midi_file_path: The path of the MIDI file
+    :param midi_bytes: the bytes of the MIDI file.
 
-    :return: None.
-             Playing the file.
+    :return: a NoteEvents with the times in beats - its track numbers are the indexes of the track chunks
+             in the file, so in a format 1 file track 0 is the tempo track.
+
+    :raises ValueError: if the bytes are not a Standard MIDI File, or its time is in SMPTE frames.
 
     """
 
-    
-    pass
+    if midi_bytes[:4] != b'MThd' or len(midi_bytes) < 14:
+        raise ValueError("Not a Standard MIDI File")
 
+    header_length, _, tracks_count, ticks_per_quarternote = struct.unpack_from('>LHHH', midi_bytes, 4)
+    if ticks_per_quarternote & 0x8000:
+        raise ValueError("MIDI files with SMPTE time are not supported")
 
-def main(
-    midi_file_path=os.getcwd(),file_name='',scale_type=random.choice(list(SCALES_DICT.keys())),
-    scale_key=random.choice(CHROMATIC_KEYS),chords_atmosphere=random.choice(list(ATMOSPHERE_DICT.keys())),
-    melody_length=DEFAULT_MELODY_LENGTH,bpm=DEFAULT_BPM):
-  
+    note_events = NoteEvents(tracks_count)
+    position = 8 + header_length
+    track = 0
+
+    try:
+        while position + 8 <= len(midi_bytes) and track < tracks_count:
+            chunk_type, chunk_length = struct.unpack_from('>4sL', midi_bytes, position)
+            position += 8
+            if chunk_type == b'MTrk':
+                read_track_chunk(midi_bytes, position, min(position + chunk_length, len(midi_bytes)), track,
+                                 ticks_per_quarternote, note_events)
+                track += 1
+            position += chunk_length
+    except IndexError:
+        raise ValueError("The MIDI file is cut in the middle of an event")
+
+    return note_events
+
+
+def create_midiutil_file(num_tracks=1):
     """
-    Main Function
-    :return: New Midi File Path (The file has been created by the program), and the bytes file of Class "MidiFile" from MidiUtil module
+    :return: a new MidiUtil MIDIFile - midiutil is imported on the first call, only this backend needs it.
     """
-    
-    midi_file = MIDIFile(2)  # 2 tracks - one for the Chords, and one for the Melody.
 
-    melody_track = 0
-    chords_track = 1
-    init_time = 0  # start at the beginning
+    from midiutil.MidiFile import MIDIFile  # Creating midi file
 
-    midi_file.addTrackName(melody_track, init_time, "melody")
-    midi_file.addTempo(melody_track, init_time, bpm)
+    return MIDIFile(num_tracks)
 
-    midi_file.addTrackName(chords_track, init_time, "chords")
-    midi_file.addTempo(chords_track, init_time, bpm)
 
-    scale_notes = get_scale_notes(scale_key, scale_type)
+# The functions that create the MIDI file object - both write the same bytes, 'smf' is much faster:
+MIDI_BACKENDS_DICT = {'smf': SMFWriter,
+                      'midiutil': create_midiutil_file}
 
-    generate_chord_progression(melody_length, midi_file, chords_track, scale_notes, chords_atmosphere)
 
-    generate_random_melody(melody_length, midi_file, melody_track, scale_notes)
+# Instrumentation:
 
-    # if the package is used locally
-    if file_name == '': 
-        new_midi_file_path = get_unique_file_name(midi_file_path, 'RandoMMelody', 'mid').replace("\\", "/")
+instrumentation_hook = None  # The hook that gets the metrics of the generation, None when it's disabled
 
-    # if the package is used in server, it ables the server to control the name of the file bein created:
-    else: 
-        new_midi_file_path = os.path.join(midi_file_path,file_name) 
 
-    with open(new_midi_file_path, 'wb') as output_file:
-        midi_file.writeFile(output_file)
-        
-    return new_midi_file_path
+class InstrumentationHook(object):
+    """
+    The interface of the instrumentation of the generation - subclass it and pass it to 'set_instrumentation_hook'.
 
+    The stages are: 'setup', 'scale_notes', 'chord_progression', 'melody', 'file_name' and 'write'.
+    The counters are: 'files', 'notes', 'rests', 'triplets', 'pitch_bends', 'duration_retries' (durations drawn
+    again because they were too long), 'rng_draws' and 'bytes_written'.
+    """
+
+    def stage_finished(self, stage, seconds):
+        pass
+
+    def count(self, counter, amount=1):
+        pass
+
+
+class StageTimer(object):
+    """
+    Times a stage of the generation and reports it to the instrumentation hook, used as a 'with' block.
+    """
+
+    __slots__ = ('hook', 'stage', 'start_time')
+
+    def __init__(self, hook, stage):
+        self.hook = hook
+        self.stage = stage
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hook.stage_finished(self.stage, time.perf_counter() - self.start_time)
+
+
+class NullStageTimer(object):
+    """
+    The timer of the stages when instrumentation is disabled - it does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_STAGE_TIMER = NullStageTimer()
+
+
+class CountingRandom(random.Random):
+    """
+    A random generator that counts its draws. It draws exactly the same values as random.Random.
+    """
+
+    def __init__(self, seed=None):
+        self.draws = 0
+        super(CountingRandom, self).__init__(seed)
+
+    def random(self):
+        self.draws += 1
+        return super(CountingRandom, self).random()
+
+    def getrandbits(self, k):
+        self.draws += 1
+        return super(CountingRandom, self).getrandbits(k)
+
+
+def set_instrumentation_hook(hook):
+    """
+    Enables the instrumentation of the generation, or disables it when hook is None.
+
+    :param hook: an InstrumentationHook, for example a 'metrics.PrometheusMetrics'.
+    """
+
+    global instrumentation_hook
+    instrumentation_hook = hook
+
+
+def measure_stage(stage):
+    """
+    :return: a timer of the stage for a 'with' block, that does nothing when instrumentation is disabled.
+    """
+
+    if instrumentation_hook is None:
+        return NULL_STAGE_TIMER
+    return StageTimer(instrumentation_hook, stage)
+
+
+# Output naming:
+
+
+class OutputAllocator(object):
+    """
+    Gives new file names in a directory - RandoMMelody.mid, RandoMMelody_2.mid, RandoMMelody_3.mid... -
+    to any number of threads and processes writing to it at the same time.
+
+    Every name is claimed by creating its file exclusively (O_EXCL), so two writers never get the same file.
+    The number of the next file is counted in memory, and saved in a high-water mark file once in save_interval
+    claims, after skipping taken names and on 'close' - so a new process starts near the last file, and every
+    name costs a single create, not a check of every name before it.
+    A writer that loses a name to another writer moves on to the saved mark or to the next number. The mark is
+    only a hint: a process that is killed before saving it costs the next writers a failed create for each of
+    its (at most save_interval - 1) unsaved names.
+
+    :param directory: the folder of the files.
+    :param basename: the name of the files, before the number.
+    :param ext: the extension of the files, without a dot.
+    :param shard_size: the number of files in every subdirectory (000000, 000001, ...), None to keep all of
+                       the files in the directory itself.
+    :param high_water_mark_path: the file of the high-water mark - a hidden file in the directory by default, of
+                                 the layout of the files (.RandoMMelody.mid.next, .RandoMMelody.mid.shards-1000.next
+                                 with a shard size of 1000). give another path to keep the directory clean of it.
+    :param save_interval: the number of claims between the saves of the mark, 1 saves it on every claim.
+    :param keep_high_water_mark: False to only read the mark and never create its file - for a few names, like
+                                 the single file of 'main'.
+    """
+
+    def __init__(self, directory, basename='RandoMMelody', ext='mid', shard_size=None, high_water_mark_path=None,
+                 save_interval=HIGH_WATER_MARK_INTERVAL, keep_high_water_mark=True):
+        import threading  # Only the allocator needs a lock
+
+        self.directory = directory
+        self.basename = basename
+        self.ext = ext
+        self.shard_size = shard_size
+        if high_water_mark_path is None:
+            # The flat and the sharded files of a directory are numbered apart, so every layout has its own mark:
+            layout = '' if shard_size is None else '.shards-{shard_size}'.format(shard_size=shard_size)
+            high_water_mark_path = os.path.join(directory, '.{basename}.{ext}{layout}.next'.format(
+                basename=basename, ext=ext, layout=layout))
+        self.high_water_mark_path = high_water_mark_path
+        self.save_interval = save_interval
+        self.keep_high_water_mark = keep_high_water_mark
+        self.lock = threading.Lock()
+        self.created_shards = set()
+        self.next_number = self.read_high_water_mark()
+        self.unsaved_count = 0
+
+    def read_high_water_mark(self):
+        """
+        :return: the saved number of the next file, 1 when nothing is saved.
+        """
+
+        try:
+            with open(self.high_water_mark_path) as high_water_mark_file:
+                return max(int(high_water_mark_file.read() or 1), 1)
+        except (OSError, ValueError):
+            return 1
+
+    def save_high_water_mark(self, next_number):
+        """
+        Saves the number of the next file atomically - it is only a hint, so writers don't wait for each other.
+        """
+
+        if not self.keep_high_water_mark:
+            return
+
+        import threading  # Every thread saves to its own temporary file
+
+        temporary_path = '{path}.{pid}.{thread}'.format(path=self.high_water_mark_path, pid=os.getpid(),
+                                                        thread=threading.get_ident())
+        try:
+            with open(temporary_path, 'w') as high_water_mark_file:
+                high_water_mark_file.write(str(next_number))
+            os.replace(temporary_path, self.high_water_mark_path)
+        except OSError:
+            pass
+
+    def get_path(self, number):
+        """
+        :return: the path of the file of the number.
+        """
+
+        if number == 1:
+            file_name = "{basename}.{ext}".format(basename=self.basename, ext=self.ext)
+        else:
+            file_name = "{basename}_{number}.{ext}".format(basename=self.basename, number=number, ext=self.ext)
+
+        if self.shard_size is None:
+            return os.path.join(self.directory, file_name)
+
+        shard = '{shard:06d}'.format(shard=(number - 1) // self.shard_size)
+        if shard not in self.created_shards:
+            os.makedirs(os.path.join(self.directory, shard), exist_ok=True)
+            self.created_shards.add(shard)
+        return os.path.join(self.directory, shard, file_name)
+
+    def allocate(self):
+        """
+        Claims a new file name, by creating an empty file with it.
+
+        :return: the path of the new (empty) file.
+        """
+
+        skipped_names = False
+        while True:
+            with self.lock:
+                number = self.next_number
+                self.next_number += 1
+
+            path = self.get_path(number)
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            except FileExistsError:
+                # Another writer has this name - going on from the mark it saved, if it is farther:
+                skipped_names = True
+                high_water_mark = self.read_high_water_mark()
+                with self.lock:
+                    self.next_number = max(self.next_number, high_water_mark)
+                continue
+
+            with self.lock:
+                self.unsaved_count += 1
+                save = self.unsaved_count >= self.save_interval or skipped_names
+                if save:
+                    self.unsaved_count = 0
+                    next_number = self.next_number
+            if save:
+                self.save_high_water_mark(next_number)
+
+            return path
+
+    def close(self):
+        """
+        Saves the number of the next file, so the next allocator of the directory starts from it.
+        """
+
+        with self.lock:
+            if not self.unsaved_count:
+                return
+            self.unsaved_count = 0
+            next_number = self.next_number
+        self.save_high_water_mark(next_number)
+
+
+# (directory, basename, ext, shard size, mark path, keep mark) -> the OutputAllocator of the process:
+output_allocators = {}
+
+# A forked process (a worker of a pool) starts without the allocators of its parent - their locks may be held, and
+# the finalizer that saves their marks isn't forked - so it registers its own on its first allocator:
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=output_allocators.clear)
+
+
+def get_output_allocator(directory, basename='RandoMMelody', ext='mid', shard_size=None, high_water_mark_path=None,
+                         keep_high_water_mark=True):
+    """
+    :return: the OutputAllocator of the directory in this process, created on the first call.
+    """
+
+    key = (os.path.abspath(directory), basename, ext, shard_size, high_water_mark_path, keep_high_water_mark)
+    output_allocator = output_allocators.get(key)
+    if output_allocator is None:
+        if not output_allocators:
+            # The workers of multiprocessing (and of ProcessPoolExecutor) end with os._exit, which skips atexit -
+            # but runs the finalizers of multiprocessing.util:
+            from multiprocessing.util import Finalize
+
+            atexit.register(close_output_allocators)
+            Finalize(None, close_output_allocators, exitpriority=0)
+        output_allocator = output_allocators.setdefault(key, OutputAllocator(
+            directory, basename, ext, shard_size, high_water_mark_path, keep_high_water_mark=keep_high_water_mark))
+    return output_allocator
+
+
+def close_output_allocators():
+    """
+    Saves the high-water marks of all the OutputAllocators of 'get_output_allocator', when the process ends -
+    normally, or as a multiprocessing worker.
+    """
+
+    for output_allocator in list(output_allocators.values()):
+        output_allocator.close()
+
+
+# Functions:
+
+
+def is_major(chord_notes):
+    """
+    Gets a chord by his notes.
+    Returns True if the chord is Major, False if its Minor
+    """
+    interval = CHROMATIC_KEYS.index(chord_notes[2]) - CHROMATIC_KEYS.index(chord_notes[1])
+    
+    if interval  == 3 or interval == -3:
+
+        return True
+    else:
+        return False
+    
+
+def get_chord_notes_by_name(scale_notes,chord_name):
+    """
+    Returns the notes of a chord type, on the first note of the scale:
+
+    :param scale_notes: list of the notes in the scale of the chord , for example, ['C','D','E','F','G','A','B']
+    :param chord_name: a key of CHORDS_SEQUENCE_DICT, for example 'dom-9th'.
+
+    :return: list of notes of the required chord, for example ['C', 'E', 'G', 'A#', 'D']
+
+    """
+
+    return get_chord_notes_by_note_and_type(scale_notes[0], chord_name)
+
+
+def get_chord_notes_by_note_and_type(note,type):
+
+    return list(get_theory_tables().chord_notes[(note, type)])
+
+
+def get_chord_notes_by_num(scale_notes, chord_num, chord_size=3):
+    """
+    Returns the notes of the required chord:
+
+    :param scale_notes: list of the notes in the scale of the chord , for example, ['C','D','E','F','G','A','B']
+    :param chord_num: the number of the chord, for example I - first, iii - third, etc.
+    :param chord_size: the number of stacked notes, 3 for a triad, 4 for a 7th chord, up to 7 for a 13th chord.
+
+    :return: list of notes of the required chord
+
+    """
+
+    if chord_size == 3:
+        scale_chords = get_theory_tables().scale_chords.get(tuple(scale_notes))
+    elif chord_size == 4:
+        scale_chords = get_theory_tables().scale_seventh_chords.get(tuple(scale_notes))
+    else:
+        scale_chords = None
+
+    if scale_chords is None:  # A scale that isn't in SCALES_DICT, or a bigger chord
+        return [scale_notes[i] for i in stack_scale_chord(len(scale_notes), chord_num, chord_size)]
+
+    return list(scale_chords[chord_num - 1])
+
+
+extended_scale_chords = {}  # (scale notes, chord extension) -> the chords of the degrees, filled on demand
+
+
+def get_scale_chords(scale_notes, chord_extension='triad'):
+    """
+    Returns the chords of all the degrees of a scale, with an extension - computed once for every scale:
+
+    :param scale_notes: list of the notes in the scale, for example, ['C','D','E','F','G','A','B']
+    :param chord_extension: a key of CHORD_EXTENSIONS_DICT, for example '9th'.
+
+    :return: a tuple of the notes of the chords I to VII.
+
+    """
+
+    if chord_extension not in CHORD_EXTENSIONS_DICT:
+        raise ValueError("Unknown chord extension: {chord_extension!r}, please select from: {extensions}".format(
+            chord_extension=chord_extension, extensions=list(CHORD_EXTENSIONS_DICT)))
+
+    scale_notes = tuple(scale_notes)
+    theory = get_theory_tables()
+    if chord_extension == 'triad' and scale_notes in theory.scale_chords:
+        return theory.scale_chords[scale_notes]
+    if chord_extension == '7th' and scale_notes in theory.scale_seventh_chords:
+        return theory.scale_seventh_chords[scale_notes]
+
+    scale_chords = extended_scale_chords.get((scale_notes, chord_extension))
+    if scale_chords is None:
+        scale_size = len(scale_notes)
+        scale_chords = tuple([tuple([scale_notes[(chord_num - 1 + step) % scale_size]
+                                     for step in CHORD_EXTENSIONS_DICT[chord_extension]])
+                              for chord_num in ROMAN_LETTERS_VALUE_DICT.values()])
+        # Only the scales of SCALES_DICT are kept, so the cache is bounded:
+        if scale_notes in theory.scale_chords:
+            extended_scale_chords[(scale_notes, chord_extension)] = scale_chords
+
+    return scale_chords
+
+
+def get_voicing_candidates(chord_notes, register=VOICING_REGISTER):
+    """
+    :return: all the inversions of the chord - its notes stacked up in their order, from every note of the chord -
+             at every octave that keeps them in the register (lowest pitch, highest pitch),
+             as tuples of pitches from the lowest.
+    """
+
+    lowest_pitch, highest_pitch = register
+
+    pitch_classes = []
+    for note in chord_notes:  # A chord bigger than its scale has repeated notes, they are voiced once
+        if NOTES_PITCH_CLASSES_DICT[note] not in pitch_classes:
+            pitch_classes.append(NOTES_PITCH_CLASSES_DICT[note])
+
+    candidates = []
+    for inversion in range(len(pitch_classes)):
+        inverted_pitch_classes = pitch_classes[inversion:] + pitch_classes[:inversion]
+        pitches = [inverted_pitch_classes[0]]
+        for pitch_class in inverted_pitch_classes[1:]:
+            pitch = pitches[-1] + (pitch_class - pitches[-1]) % 12
+            pitches.append(pitch if pitch > pitches[-1] else pitch + 12)
+
+        for octave_shift in range(0, highest_pitch + 1, 12):
+            if pitches[0] + octave_shift >= lowest_pitch and pitches[-1] + octave_shift <= highest_pitch:
+                candidates.append(tuple([pitch + octave_shift for pitch in pitches]))
+
+    return candidates
+
+
+def get_voice_leading_distance(previous_pitches, pitches):
+    """
+    :return: how far the voices move from a chord to the next, in semitones - every voice to the same voice of
+             the next chord, or when the chords have a different number of notes, every note to the nearest note
+             of the other chord, summed for both chords.
+    """
+
+    if len(previous_pitches) == len(pitches):
+        return sum(abs(pitch - previous_pitch) for previous_pitch, pitch in zip(previous_pitches, pitches))
+
+    return sum(min(abs(pitch - previous_pitch) for previous_pitch in previous_pitches) for pitch in pitches) + \
+        sum(min(abs(previous_pitch - pitch) for pitch in pitches) for previous_pitch in previous_pitches)
+
+
+chords_voicings = {}  # (progression, register) -> its voicings, computed once for every key, scale and progression
+
+
+def get_chords_voicings(chords_list, register=None):
+    """
+    Voices a chord progression - the first chord in root position, and every next chord in the inversion
+    and octave that moves the voices the least from the chord before it. Computed once for every progression.
+
+    :param chords_list: the notes of the chords of the progression, in the order they are played.
+    :param register: the register of the chords (see 'get_register'), VOICING_REGISTER by default.
+
+    :return: a tuple of the pitches of every chord, from the lowest.
+
+    """
+
+    register = VOICING_REGISTER if register is None else get_register(register)
+    progression = tuple(tuple(chord_notes) for chord_notes in chords_list)
+    voicings = chords_voicings.get((progression, register))
+    if voicings is not None:
+        return voicings
+
+    voicings = []
+    for chord_notes in progression:
+        candidates = get_voicing_candidates(chord_notes, register)
+        if not candidates:
+            raise ValueError("The register {register} is too narrow to voice the chord {chord} - every inversion of "
+                             "it spans more than {span} semitones".format(register=register, chord=list(chord_notes),
+                                                                         span=register[1] - register[0]))
+        if not voicings:
+            voicing = min((candidate for candidate in candidates
+                           if candidate[0] % 12 == NOTES_PITCH_CLASSES_DICT[chord_notes[0]]),
+                          key=lambda candidate: abs(candidate[0] - CHROMATIC_KEYS_PITCH_DICT[chord_notes[0]]),
+                          default=candidates[0])
+        else:
+            voicing = min(candidates, key=lambda candidate: get_voice_leading_distance(voicings[-1], candidate))
+        voicings.append(voicing)
+
+    voicings = tuple(voicings)
+    chords_voicings[(progression, register)] = voicings
+    return voicings
+
+
+def get_register(register=None):
+    """
+    Finds a register of the pitch model:
+
+    :param register: a key of REGISTERS_DICT, a (lowest pitch, highest pitch) pair, or None for DEFAULT_REGISTER.
+
+    :return: the register, as a (lowest pitch, highest pitch) tuple.
+
+    """
+
+    if register is None:
+        return DEFAULT_REGISTER
+
+    if isinstance(register, str):
+        if register not in REGISTERS_DICT:
+            raise ValueError("Unknown register: {register!r}, please select from: {registers}".format(
+                register=register, registers=list(REGISTERS_DICT)))
+        return REGISTERS_DICT[register]
+
+    lowest_pitch, highest_pitch = register
+    if not 0 <= lowest_pitch <= highest_pitch - 11 < MIDI_PITCHES_COUNT - 11:
+        raise ValueError("A register is a range of MIDI pitches of at least an octave, not {register}".format(
+            register=register))
+
+    return int(lowest_pitch), int(highest_pitch)
+
+
+def parse_register(register_text):
+    """
+    :param register_text: a key of REGISTERS_DICT, or the lowest and the highest pitch, for example '60-84'.
+
+    :return: the register, as the 'register' arguments take it.
+    """
+
+    if register_text in REGISTERS_DICT:
+        return register_text
+
+    lowest_pitch, _, highest_pitch = register_text.partition('-')
+    return get_register((int(lowest_pitch), int(highest_pitch)))
+
+
+def get_register_pitches(pitch_class, register):
+    """
+    :return: a range of the pitches of the pitch class in the register, from the lowest.
+    """
+
+    lowest_pitch, highest_pitch = register
+    return range(lowest_pitch + (pitch_class - lowest_pitch) % 12, highest_pitch + 1, 12)
+
+
+def fit_to_register(pitch, target_pitch, register):
+    """
+    Moves a pitch by octaves, to the nearest to the target pitch in the register:
+
+    :param pitch: a MIDI pitch.
+    :param target_pitch: the pitch to get close to, for example the previous note of the melody.
+    :param register: the (lowest pitch, highest pitch) of the track.
+
+    :return: the moved pitch.
+
+    """
+
+    lowest_pitch, highest_pitch = register
+    pitch = target_pitch + (pitch - target_pitch + 6) % 12 - 6
+    while pitch < lowest_pitch:
+        pitch += 12
+    while pitch > highest_pitch:
+        pitch -= 12
+
+    return pitch
+
+
+scales_pitches = {}  # (scale notes, register) -> the pitches of the scale in the register, filled on demand
+
+
+def get_scale_pitches(scale_notes, register=None):
+    """
+    Returns the pitches of a scale in a register - the MIDI numbers the generators work on, computed once
+    for every scale and register:
+
+    :param scale_notes: a list of the notes in a specific key, for example ['C','D','E','F','G','A','B']
+    :param register: a register of 'get_register', DEFAULT_REGISTER by default.
+
+    :return: a tuple of the pitches - every note of the scale in its order, in all of its octaves in the register.
+             in DEFAULT_REGISTER every note has one pitch, the pitch of CHROMATIC_KEYS_PITCH_DICT.
+
+    """
+
+    register = get_register(register)
+    scale_notes = tuple(scale_notes)
+
+    pitches = scales_pitches.get((scale_notes, register))
+    if pitches is None:
+        pitches = tuple([pitch for note in scale_notes
+                         for pitch in get_register_pitches(NOTES_PITCH_CLASSES_DICT[note], register)])
+        # Only the scales of SCALES_DICT are kept, so the cache is bounded by the registers in use:
+        if scale_notes in get_theory_tables().scale_chords:
+            scales_pitches[(scale_notes, register)] = pitches
+
+    return pitches
+
+
+def get_chord_pitches(chord_notes, register=None):
+    """
+    :param chord_notes: the notes of a chord, from its root.
+    :param register: a register of 'get_register', or None for the pitches of CHROMATIC_KEYS_PITCH_DICT.
+
+    :return: the pitches of the chord - its root at the bottom of the register, and every next note above
+             the note before it. the notes above the register are folded down by octaves into its top octave
+             (a pitch that is already in the chord is played once), so every pitch is in the register.
+             the chords in DEFAULT_REGISTER are not stacked, every note keeps its pitch.
+    """
+
+    if register is None:
+        return tuple([CHROMATIC_KEYS_PITCH_DICT[note] for note in chord_notes])
+
+    lowest_pitch, highest_pitch = get_register(register)
+    stacked_pitch = get_register_pitches(NOTES_PITCH_CLASSES_DICT[chord_notes[0]], (lowest_pitch, highest_pitch))[0]
+    pitches = [stacked_pitch]
+    for note in chord_notes[1:]:
+        stacked_pitch += (NOTES_PITCH_CLASSES_DICT[note] - stacked_pitch - 1) % 12 + 1
+        pitch = stacked_pitch
+        if pitch > highest_pitch:  # Into the top octave - a register is at least an octave, so it is in it
+            pitch -= (pitch - highest_pitch + 11) // 12 * 12
+        if pitch not in pitches:
+            pitches.append(pitch)
+
+    return tuple(pitches)
+
+
+def get_chords_of_scale(scale_key,scale_type):
+    scale_notes = get_scale_notes(scale_key,scale_type)
+
+    scale_chords = get_theory_tables().scale_chords[scale_notes]
+
+    return {roman_letter: list(chord_notes) for roman_letter, chord_notes in zip(ROMAN_LETTERS_VALUE_DICT, scale_chords)}
+
+
+def get_unique_file_name(file_path, basename, ext):
+    """
+    Returns a unique file path, with a new file name:
+
+    :param file_path: The path of the file
+    :param basename: the name of the file
+    :param ext: the extension of the file, for example 'txt', 'py', 'mid' .
+
+    :return: a unique file path with a unique name that doesnt exists in the path of the given folder.
+             for example, if it has: Midis/RandoMMelody, then, it will return: Midis/RandoMMelody_2,
+              and that in the next process: Midis/RandoMMelody_3, etc.
+             the file is created (empty), so no other process gets the same name - see 'OutputAllocator'.
+             the high-water mark of the folder is read, if a batch left one, but never created.
+
+    """
+
+    return get_output_allocator(file_path, basename, ext, keep_high_water_mark=False).allocate()
+
+
+def get_random_generator(seed=None, rng=None):
+    """
+    Returns the random generator of a single generation:
+
+    :param seed: a seed for a new generator, the same seed always gives the same melody.
+    :param rng: an existing 'random.Random' object, it is returned as is.
+
+    :return: a 'random.Random' object that is independent from the global 'random' module,
+             so concurrent generations don't share their random state.
+
+    """
+
+    if rng is not None:
+        return rng
+    if instrumentation_hook is not None:
+        return CountingRandom(seed)
+    return random.Random(seed)
+
+
+def get_scale_notes(scale_key, scale_type, rng=None):
+    """
+    Finds the notes of the given scale:
+
+
+    :param scale_key: the key of the scale, for example, 'C#'
+    :param scale_type: the type of the scale, for example 'minor'
+    :param rng: the random generator for choosing an unknown scale type, a new one by default.
+
+    :return: a list of the notes in the specific key and type.
+
+    """
+
+    if scale_type not in SCALES_DICT:
+        user_input = scale_type
+        scale_type = get_random_generator(rng=rng).choice(list(SCALES_DICT.keys()))
+        print(ITEM_NOT_FOUND_USER_MESSAGE.format(user_input=user_input,
+                                                 repository_list=list(SCALES_DICT.keys()),
+                                                 random_decision=scale_type))
+
+    # The tables have every key of every scale, so only a key that doesn't exist misses:
+    try:
+        return get_theory_tables().scale_notes[(scale_key, scale_type)]  # Using Tuple for memory saving
+    except KeyError:
+        raise ValueError("{scale_key!r} is not a key, please select from: {keys}".format(scale_key=scale_key,
+                                                                                         keys=CHROMATIC_KEYS))
+
+
+def get_progression_chords(scale_notes, chords_atmosphere, rng=None, chord_extension=None):
+    """
+    Finds the chords of the progression of an atmosphere:
+
+    :param scale_notes: a list of the notes in a specific key.
+    :param chords_atmosphere: the atmosphere of the chords. for example - sad, happy, pop, etc.
+    :param rng: the random generator for choosing an unknown atmosphere, a new one by default.
+    :param chord_extension: a key of CHORD_EXTENSIONS_DICT to extend the chords with, for example '7th',
+                            None for the triads.
+
+    :return: a list of the notes of every chord of the progression,
+             for example  [['E', 'G#', 'B'], ['B', 'D#', 'F#'], ['C#', 'E', 'G#'], ['A', 'C#', 'E']]
+
+    """
+
+    #  chord_progression_values = for example I-V-vi-IV
+    if chords_atmosphere in ATMOSPHERE_DICT:
+        chord_progression_values = ATMOSPHERE_DICT[chords_atmosphere].split('-')
+    else:
+        chord_progression_values = get_random_generator(rng=rng).choice(list(ATMOSPHERE_DICT.values())).split('-')
+        print(ITEM_NOT_FOUND_USER_MESSAGE.format(user_input=chords_atmosphere,
+                                                 repository_list=list(ATMOSPHERE_DICT.keys()),
+                                                 random_decision=chord_progression_values))
+
+    if chord_extension is not None:
+        scale_chords = get_scale_chords(scale_notes, chord_extension)
+        return [list(scale_chords[ROMAN_LETTERS_VALUE_DICT[x.upper()] - 1]) for x in chord_progression_values]
+
+    # The triads of the scale are looked up once for the whole progression:
+    scale_chords = get_theory_tables().scale_chords.get(tuple(scale_notes))
+    if scale_chords is not None:
+        return [list(scale_chords[ROMAN_LETTERS_VALUE_DICT[x.upper()] - 1]) for x in chord_progression_values]
+
+    return [get_chord_notes_by_num(scale_notes, ROMAN_LETTERS_VALUE_DICT[x.upper()]) for x in chord_progression_values]
+
+
+def get_progression_pitches(chords_list, voice_leading=False, register=None):
+    """
+    :param chords_list: the chords of the progression, from 'get_progression_chords'.
+    :param voice_leading: True to play every chord in the inversion nearest to the chord before it.
+    :param register: the register of the chords (see 'get_register') - None for the pitches of
+                     CHROMATIC_KEYS_PITCH_DICT, or VOICING_REGISTER with voice leading.
+
+    :return: the pitches of every chord of the progression.
+    """
+
+    if voice_leading:
+        return get_chords_voicings(chords_list, register)
+    return [get_chord_pitches(chord_notes, register) for chord_notes in chords_list]
+
+
+def get_chord_duration(requested_melody_length):
+    """
+    :return: the number of beats of every chord of a progression of 'generate_chord_progression'.
+    """
+
+    return int(requested_melody_length / 4)
+
+
+def generate_chord_progression(requested_melody_length, midi_file, chords_track,
+                               scale_notes, chords_atmosphere, rng=None, chord_extension=None, voice_leading=False,
+                               register=None, chord_aware=False):
+
+    """
+    Generate the chord progression and write it to the MIDI file:
+
+
+    :param requested_melody_length: the melody length requested .
+    :param midi_file: the MIDI file Object, to manipulate and write to.
+    :param chords_track: the chords track of the MIDI file
+    :param scale_notes: a list of the notes in a specific key.
+    :param chords_atmosphere: the atmosphere of the chords. for example - sad, happy, pop, etc.
+    :param rng: the random generator for choosing an unknown atmosphere, a new one by default.
+    :param chord_extension: a key of CHORD_EXTENSIONS_DICT to extend the chords with, None for the triads.
+    :param voice_leading: True to play every chord in the inversion nearest to the chord before it.
+    :param register: the register of the chords (see 'get_register') - None for the pitches of
+                     CHROMATIC_KEYS_PITCH_DICT, or VOICING_REGISTER with voice leading.
+    :param chord_aware: True to build the ChordToneIndex of the progression, for a chord aware melody.
+
+    :return: the ChordToneIndex of the progression when chord_aware - which chord plays at every beat,
+             None otherwise. making a change in the given MIDI file.
+
+
+
+    """
+
+    channel = 1  # Because 0 is for the melody part.
+    current_melody_length = 0  # Initiate the time stamp for the track
+    volume = DEFAULT_VOLUME
+
+    chords_list = get_progression_chords(scale_notes, chords_atmosphere, rng, chord_extension)
+
+    duration = get_chord_duration(requested_melody_length)
+
+    chord_tone_index = ChordToneIndex(chords_list, duration) if chord_aware else None
+
+    chords_pitches = get_progression_pitches(chords_list, voice_leading, register)
+
+    # Writing chords to the file
+    if isinstance(midi_file, NoteEvents):
+        midi_file.add_notes(chords_track, channel, [(chord_position * duration, duration, pitch, volume)
+                                                    for chord_position, chord_pitches in enumerate(chords_pitches)
+                                                    for pitch in chord_pitches])
+        return chord_tone_index
+
+    for chord_pitches in chords_pitches:
+        for pitch in chord_pitches:
+            midi_file.addNote(chords_track, channel, pitch, current_melody_length, duration, volume)
+
+        current_melody_length += duration  # after adding one chord the next should be after him.
+
+    return chord_tone_index
+
+
+def iter_random_melody(scale_notes, requested_melody_length=None, rng=None, channel=0, volume=DEFAULT_VOLUME,
+                       chord_tone_index=None, register=None):
+
+    """
+    Generate the melody lazily, event by event:
+
+
+    :param scale_notes: a list of the notes in a specific key.
+    :param requested_melody_length: the melody length requested, None for a melody that never ends.
+    :param rng: the random generator of the melody, a new one by default.
+    :param channel: the MIDI channel of the melody.
+    :param volume: the volume of the notes.
+    :param chord_tone_index: the ChordToneIndex of the chords, to play their notes on the beats - or None to
+                             ignore the chords.
+    :param register: the register of the melody (see 'get_register'), DEFAULT_REGISTER by default.
+
+    :return: a generator of the events of the melody, in time order -
+             (time, NOTE_EVENT, channel, pitch, duration, volume) and (time, PITCH_BEND_EVENT, channel, value).
+
+    """
+
+    rng = get_random_generator(rng=rng)
+    hook = instrumentation_hook
+    register = get_register(register)
+    scale_pitches = get_scale_pitches(scale_notes, register)
+
+    if requested_melody_length is None:
+        requested_melody_length = float('inf')
+
+    current_melody_length = 0  # Initiate the time stamp for the track
+
+    chance_for_note = DEFAULT_CHANCE_FOR_NOTE
+    chance_for_rest = DEFAULT_CHANCE_FOR_REST
+    chance_for_adding = DEFAULT_CHANCE_FOR_ADDING
+
+    while current_melody_length < requested_melody_length:
+        random_chance = rng.random()
+
+        # if random_chance is between the 0.39 and 0.99 area its a
+        # 60% chance and a note is added to the file:
+        if chance_for_note > random_chance > chance_for_rest:
+
+            pitch = rng.choice(scale_pitches)
+
+            # continuing from the preview note:
+            note_time = current_melody_length
+
+            duration = rng.choice(NOTE_DURATIONS_LIST)
+            if requested_melody_length - current_melody_length < min(NOTE_DURATIONS_LIST):
+                break
+            while duration > requested_melody_length - current_melody_length:
+                duration = rng.choice(NOTE_DURATIONS_LIST)
+                if hook is not None:
+                    hook.count('duration_retries')
+
+            if chord_tone_index is not None:
+                pitch = choose_chord_tone(pitch, note_time, chord_tone_index, rng, register)
+
+            if hook is not None:
+                hook.count('notes')
+
+            # Adding the note to the melody:
+            yield note_time, NOTE_EVENT, channel, pitch, duration, volume
+
+            current_melody_length += duration
+            continue
+
+        # if random_chance is between the 0.09 and 0.39 area its a
+        # 30% chance and silence is added to the file:
+        elif chance_for_rest > random_chance > chance_for_adding:
+            # Adding rest (silence):
+            duration_of_rest = rng.choice(SILENCE_DURATIONS_LIST)
+            if requested_melody_length - current_melody_length < min(SILENCE_DURATIONS_LIST):
+                break
+
+            while duration_of_rest > requested_melody_length - current_melody_length:
+                duration_of_rest = rng.choice(SILENCE_DURATIONS_LIST)
+                if hook is not None:
+                    hook.count('duration_retries')
+
+            if hook is not None:
+                hook.count('rests')
+
+            current_melody_length += duration_of_rest
+            continue
+
+        #  Here it Adds an Adding:
+        if rng.choice([0, 1, 2, 3]) > 0:
+            #  triplets of notes
+            if requested_melody_length - current_melody_length < max(ADDINGS_DURATIONS_LIST):
+                # calculating the remaining time left.
+                break
+            duration = rng.choice(SILENCE_DURATIONS_LIST)
+            if hook is not None:
+                hook.count('triplets')
+                hook.count('notes', 3)
+            for i in range(3):
+                
+                
+                pitch = rng.choice(scale_pitches)
+
+                # continuing from the preview note:
+                note_time = current_melody_length
+                if chord_tone_index is not None:
+                    pitch = choose_chord_tone(pitch, note_time, chord_tone_index, rng, register)
+                # Adding the note to the melody:
+                yield note_time, NOTE_EVENT, channel, pitch, duration, volume
+
+                current_melody_length += duration
+
+            continue
+
+        #  Pitch bend:
+        pitch_quantity = rng.choice(PITCH_BEND_VALUES)
+        if hook is not None:
+            hook.count('pitch_bends')
+        yield float(current_melody_length), PITCH_BEND_EVENT, channel, pitch_quantity
+
+
+def choose_chord_tone(pitch, note_time, chord_tone_index, rng, register=DEFAULT_REGISTER):
+    """
+    Replaces the pitch of a note that starts on a beat with a note of the chord that plays, most of the times
+    (CHANCE_FOR_CHORD_TONE), in the octave of the register nearest to the note.
+    Notes between the beats are passing notes, they keep their pitch.
+
+    :return: the pitch of the note.
+    """
+
+    if note_time % 1:
+        return pitch
+
+    chord_pitches = chord_tone_index.get_chord_pitches(note_time)
+    if chord_pitches and rng.random() < CHANCE_FOR_CHORD_TONE:
+        return fit_to_register(rng.choice(chord_pitches), pitch, register)
+
+    return pitch
+
+
+def add_event_to_midi_file(midi_file, track, event):
+    """
+    Adds an event of the streaming API to a MIDI file object, in the given track.
+    """
+
+    if event[1] == NOTE_EVENT:
+        note_time, _, channel, pitch, duration, volume = event
+        midi_file.addNote(track, channel, pitch, note_time, duration, volume)
+    else:
+        bend_time, _, channel, pitch_quantity = event
+        midi_file.addPitchWheelEvent(track, channel, bend_time, pitch_quantity)
+
+
+def generate_random_melody(requested_melody_length, midi_file, melody_track, scale_notes, rng=None,
+                           chord_tone_index=None, register=None):
+
+    """
+    Generate the melody and write it to the MIDI file:
+
+
+    :param requested_melody_length: the melody length requested .
+    :param midi_file: the MIDI file Object, to manipulate and write to.
+    :param melody_track: the melody track of the MIDI file
+    :param scale_notes: a list of the notes in a specific key.
+    :param rng: the random generator of the melody, a new one by default.
+    :param chord_tone_index: the ChordToneIndex of the chords, for a chord aware melody.
+    :param register: the register of the melody (see 'get_register'), DEFAULT_REGISTER by default.
+
+    :return: None.
+             making a change in the given MIDI file.
+
+    """
+
+    channel = 0  # Because 1 is for the chords part.
+
+    for event in iter_random_melody(scale_notes, requested_melody_length, rng, channel,
+                                    chord_tone_index=chord_tone_index, register=register):
+        add_event_to_midi_file(midi_file, melody_track, event)
+
+
+def get_melody_event_weights(chance_for_note=DEFAULT_CHANCE_FOR_NOTE, chance_for_rest=DEFAULT_CHANCE_FOR_REST,
+                             chance_for_adding=DEFAULT_CHANCE_FOR_ADDING):
+    """
+    Converts the chance thresholds of 'generate_random_melody' to the weight of every kind of event:
+
+    :return: the weights of a note, a rest, a triplet and a pitch bend, in the order of MELODY_NOTE...MELODY_PITCH_BEND.
+             for the default chances it's (0.7, 0.2, 0.075, 0.025) - an 'adding' is a triplet 3 times out of 4.
+
+    """
+
+    note_weight = chance_for_note - chance_for_rest
+    rest_weight = chance_for_rest - chance_for_adding
+    adding_weight = 1 - note_weight - rest_weight
+
+    return note_weight, rest_weight, adding_weight * 3 / 4, adding_weight / 4
+
+
+def generate_bulk_melody_events(requested_melody_length, scale_notes, rng=None, volume=DEFAULT_VOLUME,
+                                chord_tone_index=None, register=None):
+    """
+    Generates the events of a melody, drawing the random values of whole blocks of events at once.
+
+    It keeps the statistics of 'generate_random_melody': while the time left is longer than the longest
+    note, no duration is ever rejected, so the events are drawn in bulk and their times are the cumulative
+    sum of their durations. only the last few beats are completed event by event, with the same rules.
+
+    :param requested_melody_length: the melody length requested .
+    :param scale_notes: a list of the notes in a specific key.
+    :param rng: the random generator of the melody, a new one by default.
+    :param volume: the volume of the notes.
+    :param chord_tone_index: the ChordToneIndex of the chords, for a chord aware melody.
+    :param register: the register of the melody (see 'get_register'), DEFAULT_REGISTER by default.
+
+    :return: a tuple of two lists -
+             the notes, as (time, duration, pitch, volume) tuples, ordered by time.
+             the pitch bends, as (time, pitch wheel value) tuples.
+
+    """
+
+    rng = get_random_generator(rng=rng)
+
+    register = get_register(register)
+    scale_pitches = get_scale_pitches(scale_notes, register)
+    kinds = range(4)
+    kinds_weights = get_melody_event_weights()
+    kinds_cum_weights = list(accumulate(kinds_weights))
+
+    # Every outcome of a single draw - (kind, length of the event, duration of its notes, number of notes):
+    outcomes = ([(MELODY_NOTE, duration, duration, 1) for duration in NOTE_DURATIONS_LIST] +
+                [(MELODY_REST, duration, duration, 0) for duration in SILENCE_DURATIONS_LIST] +
+                [(MELODY_TRIPLET, 3 * duration, duration, 3) for duration in SILENCE_DURATIONS_LIST] +
+                [(MELODY_PITCH_BEND, 0, 0, 0)])
+    outcomes_weights = ([kinds_weights[MELODY_NOTE] / len(NOTE_DURATIONS_LIST)] * len(NOTE_DURATIONS_LIST) +
+                        [kinds_weights[MELODY_REST] / len(SILENCE_DURATIONS_LIST)] * len(SILENCE_DURATIONS_LIST) +
+                        [kinds_weights[MELODY_TRIPLET] / len(SILENCE_DURATIONS_LIST)] * len(SILENCE_DURATIONS_LIST) +
+                        [kinds_weights[MELODY_PITCH_BEND]])
+    outcomes_cum_weights = list(accumulate(outcomes_weights))
+    mean_event_length = sum(outcome[1] * weight for outcome, weight in zip(outcomes, outcomes_weights))
+
+    notes = []
+    pitch_bends = []
+    rests_count = 0
+    triplets_count = 0
+    current_melody_length = 0
+
+    # Until here, every note, rest and triplet fits in the time left:
+    unconstrained_length = requested_melody_length - max(NOTE_DURATIONS_LIST + SILENCE_DURATIONS_LIST)
+
+    while current_melody_length <= unconstrained_length:
+        block_size = min(int((requested_melody_length - current_melody_length) / mean_event_length) + 16,
+                         BULK_MELODY_BLOCK_SIZE)
+
+        block = rng.choices(outcomes, cum_weights=outcomes_cum_weights, k=block_size)
+        event_times = list(accumulate([current_melody_length] + [outcome[1] for outcome in block]))
+
+        # The events that start after the unconstrained part are drawn again, one by one:
+        block_end = min(bisect_right(event_times, unconstrained_length), block_size)
+
+        pitches = iter(rng.choices(scale_pitches, k=sum(outcome[3] for outcome in block[:block_end])))
+
+        if instrumentation_hook is not None:
+            block_kinds = [outcome[0] for outcome in block[:block_end]]
+            rests_count += block_kinds.count(MELODY_REST)
+            triplets_count += block_kinds.count(MELODY_TRIPLET)
+
+        for note_time, (kind, _, duration, notes_count) in zip(event_times, block[:block_end]):
+            if notes_count:
+                for i in range(notes_count):
+                    notes.append((note_time + i * duration, duration, next(pitches), volume))
+            elif kind == MELODY_PITCH_BEND:
+                pitch_bends.append((float(note_time), rng.choice(PITCH_BEND_VALUES)))
+
+        current_melody_length = event_times[block_end]
+
+    while current_melody_length < requested_melody_length:
+        kind = rng.choices(kinds, cum_weights=kinds_cum_weights)[0]
+        time_left = requested_melody_length - current_melody_length
+
+        if kind == MELODY_NOTE:
+            if time_left < min(NOTE_DURATIONS_LIST):
+                break
+            duration = rng.choice([duration for duration in NOTE_DURATIONS_LIST if duration <= time_left])
+            notes.append((current_melody_length, duration, rng.choice(scale_pitches), volume))
+            current_melody_length += duration
+
+        elif kind == MELODY_REST:
+            if time_left < min(SILENCE_DURATIONS_LIST):
+                break
+            current_melody_length += rng.choice([duration for duration in SILENCE_DURATIONS_LIST
+                                                 if duration <= time_left])
+            rests_count += 1
+
+        elif kind == MELODY_TRIPLET:
+            if time_left < max(ADDINGS_DURATIONS_LIST):
+                break
+            duration = rng.choice(SILENCE_DURATIONS_LIST)
+            for i in range(3):
+                notes.append((current_melody_length, duration, rng.choice(scale_pitches), volume))
+                current_melody_length += duration
+            triplets_count += 1
+
+        else:
+            pitch_bends.append((float(current_melody_length), rng.choice(PITCH_BEND_VALUES)))
+
+    if chord_tone_index is not None:
+        notes = [(note_time, duration, choose_chord_tone(pitch, note_time, chord_tone_index, rng, register),
+                  note_volume) for note_time, duration, pitch, note_volume in notes]
+
+    if instrumentation_hook is not None:
+        instrumentation_hook.count('notes', len(notes))
+        instrumentation_hook.count('rests', rests_count)
+        instrumentation_hook.count('triplets', triplets_count)
+        instrumentation_hook.count('pitch_bends', len(pitch_bends))
+
+    return notes, pitch_bends
+
+
+def generate_bulk_melody(requested_melody_length, midi_file, melody_track, scale_notes, rng=None,
+                         chord_tone_index=None, register=None):
+
+    """
+    Generate the melody with the bulk engine and write it to the MIDI file:
+
+
+    :param requested_melody_length: the melody length requested .
+    :param midi_file: the MIDI file Object, to manipulate and write to.
+    :param melody_track: the melody track of the MIDI file
+    :param scale_notes: a list of the notes in a specific key.
+    :param rng: the random generator of the melody, a new one by default.
+    :param chord_tone_index: the ChordToneIndex of the chords, for a chord aware melody.
+    :param register: the register of the melody (see 'get_register'), DEFAULT_REGISTER by default.
+
+    :return: None.
+             making a change in the given MIDI file.
+
+    """
+
+    channel = 0  # Because 1 is for the chords part.
+
+    notes, pitch_bends = generate_bulk_melody_events(requested_melody_length, scale_notes, rng,
+                                                     chord_tone_index=chord_tone_index, register=register)
+
+    if isinstance(midi_file, NoteEvents):
+        midi_file.add_notes(melody_track, channel, notes)
+    else:
+        for note_time, duration, pitch, volume in notes:
+            midi_file.addNote(melody_track, channel, pitch, note_time, duration, volume)
+
+    for bend_time, pitch_quantity in pitch_bends:
+        midi_file.addPitchWheelEvent(melody_track, channel, bend_time, pitch_quantity)
+
+
+# The engines that can write the melody - 'loop' draws event by event, 'bulk' draws blocks of events at once:
+MELODY_ENGINES_DICT = {'loop': generate_random_melody,
+                       'bulk': generate_bulk_melody}
+
+
+def register_melody_engine(name, melody_engine):
+    """
+    Adds a melody engine (or replaces one), so it can be chosen by its name like 'loop' and 'bulk' -
+    for example a model of 'melody_models'.
+
+    :param name: the name of the engine, for example 'markov'.
+    :param melody_engine: a function (or callable object) of (requested_melody_length, midi_file, melody_track,
+                          scale_notes, rng) that writes the melody to the MIDI file, like 'generate_random_melody'.
+                          to support chord aware melodies it takes a chord_tone_index keyword argument too,
+                          and to support registers a register keyword argument.
+    """
+
+    MELODY_ENGINES_DICT[name] = melody_engine
+
+
+def get_melody_engine(melody_engine):
+    """
+    :param melody_engine: a key of MELODY_ENGINES_DICT, or the engine itself.
+
+    :return: the melody engine.
+    """
+
+    if callable(melody_engine):
+        return melody_engine
+
+    if melody_engine not in MELODY_ENGINES_DICT:
+        raise ValueError("{engine!r} is not a melody engine, please select from: {engines}".format(
+            engine=melody_engine, engines=list(MELODY_ENGINES_DICT)))
+
+    return MELODY_ENGINES_DICT[melody_engine]
+
+
+def iter_chord_progression(scale_notes, chords_atmosphere, chord_duration=DEFAULT_MELODY_LENGTH // 4,
+                           requested_melody_length=None, rng=None, channel=1, volume=DEFAULT_VOLUME,
+                           chord_extension=None, voice_leading=False, register=None, chords_list=None):
+    """
+    Generate the chord progression lazily, repeating it until the requested length, or forever:
+
+    :param scale_notes: a list of the notes in a specific key.
+    :param chords_atmosphere: the atmosphere of the chords. for example - sad, happy, pop, etc.
+    :param chord_duration: the duration of every chord, in beats.
+    :param requested_melody_length: the length of the progression, None for a progression that never ends.
+    :param rng: the random generator for choosing an unknown atmosphere, a new one by default.
+    :param chord_extension: a key of CHORD_EXTENSIONS_DICT to extend the chords with, None for the triads.
+    :param voice_leading: True to play every chord in the inversion nearest to the chord before it.
+    :param register: the register of the chords, like in 'generate_chord_progression'.
+    :param chords_list: the chords of the progression, when they were already chosen - from
+                        'get_progression_chords'.
+
+    :return: a generator of (time, NOTE_EVENT, channel, pitch, duration, volume) events, in time order.
+
+    """
+
+    if chords_list is None:
+        chords_list = get_progression_chords(scale_notes, chords_atmosphere, rng, chord_extension)
+    chords_pitches = get_progression_pitches(chords_list, voice_leading, register)
+
+    current_melody_length = 0
+    for chord_pitches in cycle(chords_pitches):
+        if requested_melody_length is not None and current_melody_length >= requested_melody_length:
+            return
+        for pitch in chord_pitches:
+            yield current_melody_length, NOTE_EVENT, channel, pitch, chord_duration, volume
+        current_melody_length += chord_duration
+
+
+def iter_melody_events(scale_type=None, scale_key=None, chords_atmosphere=None, melody_length=None,
+                       chord_duration=DEFAULT_MELODY_LENGTH // 4, seed=None, rng=None, chord_aware=False,
+                       chord_extension=None, voice_leading=False, melody_register=None, chords_register=None):
+    """
+    Generate the chords and the melody together, lazily, in time order.
+    With no melody_length they never end - the consumer can stop at any point, in constant memory.
+
+    The options that are None are chosen randomly, like in 'compose_midi_file', and the chord and register
+    options are the same as its options. The progression repeats every 4 chords of chord_duration beats,
+    so the stream isn't the same file as 'compose_midi_file' composes, even with the same seed.
+
+    :return: a generator of the events of the chords (channel 1) and of the melody (channel 0), see 'iter_random_melody'.
+    """
+
+    rng = get_random_generator(seed, rng)
+
+    if scale_type is None:
+        scale_type = rng.choice(list(SCALES_DICT.keys()))
+    if scale_key is None:
+        scale_key = rng.choice(CHROMATIC_KEYS)
+    if chords_atmosphere is None:
+        chords_atmosphere = rng.choice(list(ATMOSPHERE_DICT.keys()))
+
+    scale_notes = get_scale_notes(scale_key, scale_type, rng)
+
+    chords_list = get_progression_chords(scale_notes, chords_atmosphere, rng, chord_extension)
+    chords_events = iter_chord_progression(scale_notes, chords_atmosphere, chord_duration, melody_length, rng,
+                                           chord_extension=chord_extension, voice_leading=voice_leading,
+                                           register=chords_register, chords_list=chords_list)
+
+    melody_options = {}
+    if chord_aware:
+        melody_options['chord_tone_index'] = ChordToneIndex(chords_list, chord_duration, cyclic=True)
+    if melody_register is not None:
+        melody_options['register'] = melody_register
+    melody_events = iter_random_melody(scale_notes, melody_length, rng, **melody_options)
+
+    return heapq.merge(chords_events, melody_events, key=itemgetter(0))
+
+
+def iter_midi_stream(events, bpm=DEFAULT_BPM, chunk_size=STREAM_CHUNK_SIZE,
+                     ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+    """
+    Encodes a stream of events to MIDI track data lazily - delta times followed by MIDI messages,
+    ready to be sent to a live MIDI output or written into a track chunk.
+
+    :param events: a time ordered iterable of events, for example from 'iter_melody_events'.
+    :param bpm: the tempo, written as the first event.
+    :param chunk_size: the approximate number of bytes in every yielded chunk, 1 yields every event on its own.
+    :param ticks_per_quarternote: the time resolution of the stream.
+
+    :return: a generator of bytes chunks. if the events end, the last chunk ends the track.
+
+    """
+
+    buffer = bytearray(b'\x00\xff\x51\x03' + struct.pack('>L', int(60000000 / bpm))[1:])
+    note_offs = []  # A heap of the (tick, pitch, channel, volume) of the notes that are still playing
+    previous_tick = 0
+
+    for event in events:
+        tick = int(event[0] * ticks_per_quarternote)
+
+        # The notes that stop until this event stop before it:
+        while note_offs and note_offs[0][0] <= tick:
+            off_tick, pitch, channel, volume = heapq.heappop(note_offs)
+            buffer += encode_variable_length(off_tick - previous_tick)
+            buffer += bytes((0x80 | channel, pitch, volume))
+            previous_tick = off_tick
+
+        buffer += encode_variable_length(tick - previous_tick)
+        previous_tick = tick
+
+        if event[1] == NOTE_EVENT:
+            _, _, channel, pitch, duration, volume = event
+            buffer += bytes((0x90 | channel, pitch, volume))
+            heapq.heappush(note_offs, (tick + int(duration * ticks_per_quarternote), pitch, channel, volume))
+        else:
+            _, _, channel, pitch_quantity = event
+            pitch_quantity += 8192
+            buffer += bytes((0xe0 | channel, pitch_quantity & 0x7f, pitch_quantity >> 7))
+
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    while note_offs:
+        off_tick, pitch, channel, volume = heapq.heappop(note_offs)
+        buffer += encode_variable_length(off_tick - previous_tick)
+        buffer += bytes((0x80 | channel, pitch, volume))
+        previous_tick = off_tick
+
+    buffer += END_OF_TRACK_EVENT
+    yield bytes(buffer)
+
+
+def write_midi_stream(events, output_file, bpm=DEFAULT_BPM, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+    """
+    Writes a stream of events as a single track (format 0) MIDI file, in constant memory.
+    The length of the track is written when the events end, so the file must be seekable.
+
+    :param events: a time ordered, finite iterable of events, for example from 'iter_melody_events'.
+    :param output_file: a seekable file opened for binary writing.
+
+    :return: the number of bytes written.
+
+    """
+
+    start_position = output_file.tell()
+    output_file.write(struct.pack('>4sLHHH', b'MThd', 6, 0, 1, ticks_per_quarternote))
+    output_file.write(b'MTrk\x00\x00\x00\x00')
+
+    track_length = 0
+    for chunk in iter_midi_stream(events, bpm, ticks_per_quarternote=ticks_per_quarternote):
+        output_file.write(chunk)
+        track_length += len(chunk)
+
+    end_position = output_file.tell()
+    output_file.seek(start_position + 18)
+    output_file.write(struct.pack('>L', track_length))
+    output_file.seek(end_position)
+
+    return end_position - start_position
+
+
+def play_midi_file(midi_file_path):
+    """
+    Playing a Midi file
+
+    :param midi_file_path: The path of the MIDI file
+
+    :return: None.
+             Playing the file.
+
+    """
+
+    
+    pass
+
+
+def compose_note_events(scale_type=None, scale_key=None, chords_atmosphere=None,
+                        melody_length=DEFAULT_MELODY_LENGTH, bpm=DEFAULT_BPM, seed=None, rng=None,
+                        melody_engine='loop', note_events=None, chord_aware=False, chord_extension=None,
+                        voice_leading=False, melody_register=None, chords_register=None):
+    """
+    Composes the chords and the melody into compact note events - to transpose, quantize or change the
+    velocities of before encoding them. The options are the same as the options of 'compose_midi_file'.
+
+    :param note_events: the NoteEvents (or SMFWriter) to compose into, a new NoteEvents by default.
+
+    :return: the NoteEvents - the melody is track 0 and the chords are track 1.
+    """
+
+    with measure_stage('setup'):
+        rng = get_random_generator(seed, rng)
+
+        if scale_type is None:
+            scale_type = rng.choice(list(SCALES_DICT.keys()))
+        if scale_key is None:
+            scale_key = rng.choice(CHROMATIC_KEYS)
+        if chords_atmosphere is None:
+            chords_atmosphere = rng.choice(list(ATMOSPHERE_DICT.keys()))
+
+        if note_events is None:
+            note_events = NoteEvents(2)  # 2 tracks - one for the Chords, and one for the Melody.
+
+        melody_track = 0
+        chords_track = 1
+        init_time = 0  # start at the beginning
+
+        note_events.addTrackName(melody_track, init_time, "melody")
+        note_events.addTempo(melody_track, init_time, bpm)
+
+        note_events.addTrackName(chords_track, init_time, "chords")
+        note_events.addTempo(chords_track, init_time, bpm)
+
+    with measure_stage('scale_notes'):
+        scale_notes = get_scale_notes(scale_key, scale_type, rng)
+
+    with measure_stage('chord_progression'):
+        chord_tone_index = generate_chord_progression(melody_length, note_events, chords_track, scale_notes,
+                                                      chords_atmosphere, rng, chord_extension, voice_leading,
+                                                      chords_register, chord_aware)
+
+    with measure_stage('melody'):
+        # Only the options that are used are given, so engines without them still work:
+        melody_options = {}
+        if chord_aware:
+            melody_options['chord_tone_index'] = chord_tone_index
+        if melody_register is not None:
+            melody_options['register'] = melody_register
+        get_melody_engine(melody_engine)(melody_length, note_events, melody_track, scale_notes, rng,
+                                         **melody_options)
+
+    if instrumentation_hook is not None:
+        instrumentation_hook.count('files')
+        if isinstance(rng, CountingRandom):
+            instrumentation_hook.count('rng_draws', rng.draws)
+
+    return note_events
+
+
+def compose_midi_file(scale_type=None, scale_key=None, chords_atmosphere=None, melody_length=DEFAULT_MELODY_LENGTH,
+                      bpm=DEFAULT_BPM, seed=None, rng=None, melody_engine='loop', midi_backend='smf',
+                      chord_aware=False, chord_extension=None, voice_leading=False, melody_register=None,
+                      chords_register=None):
+    """
+    Composes the chords and the melody into a new MIDI file object, without writing it anywhere.
+
+    The options that are None are chosen randomly on every call.
+    Passing the same seed (and the same options) always composes the same MIDI file.
+    melody_engine is a key of MELODY_ENGINES_DICT (or an engine, like a model of 'melody_models'),
+    'bulk' is much faster for long melodies.
+    midi_backend is a key of MIDI_BACKENDS_DICT, both backends write the same bytes.
+    chord_aware melodies play the notes of the chords on the beats (most of the times).
+    chord_extension is a key of CHORD_EXTENSIONS_DICT, like '7th' or 'sus4', to extend the triads of the progression.
+    voice_leading plays every chord in the inversion nearest to the chord before it.
+    melody_register and chords_register are the pitch ranges of the tracks - a key of REGISTERS_DICT or a
+    (lowest pitch, highest pitch) pair, for example (60, 84). by default the notes have the pitches of
+    CHROMATIC_KEYS_PITCH_DICT.
+
+    :return: the MIDI file object, for example an SMFWriter - its 'writeFile' writes it to an open binary file.
+    """
+
+    midi_file = MIDI_BACKENDS_DICT[midi_backend](2)  # 2 tracks - one for the Chords, and one for the Melody.
+
+    # The SMFWriter encodes its own note events, any other MIDI file object gets them added:
+    if isinstance(midi_file, NoteEvents):
+        return compose_note_events(scale_type, scale_key, chords_atmosphere, melody_length, bpm, seed, rng,
+                                   melody_engine, midi_file, chord_aware, chord_extension, voice_leading,
+                                   melody_register, chords_register)
+
+    note_events = compose_note_events(scale_type, scale_key, chords_atmosphere, melody_length, bpm, seed, rng,
+                                      melody_engine, chord_aware=chord_aware, chord_extension=chord_extension,
+                                      voice_leading=voice_leading, melody_register=melody_register,
+                                      chords_register=chords_register)
+    return note_events.write_to(midi_file)
+
+
+def generate_bytes(scale_type=None, scale_key=None, chords_atmosphere=None, melody_length=DEFAULT_MELODY_LENGTH,
+                   bpm=DEFAULT_BPM, seed=None, rng=None, melody_engine='loop', midi_backend='smf',
+                   chord_aware=False, chord_extension=None, voice_leading=False, melody_register=None,
+                   chords_register=None):
+    """
+    Composes a new MIDI file in memory, without touching the filesystem.
+    The options are the same as the options of 'compose_midi_file'.
+
+    :return: the bytes of the MIDI file, ready to be sent as an HTTP response, for example.
+    """
+
+    midi_file = compose_midi_file(scale_type, scale_key, chords_atmosphere, melody_length, bpm, seed, rng,
+                                  melody_engine, midi_backend, chord_aware, chord_extension, voice_leading,
+                                  melody_register, chords_register)
+
+    with measure_stage('write'):
+        if isinstance(midi_file, SMFWriter):
+            midi_bytes = midi_file.to_bytes()
+        else:
+            output_file = BytesIO()
+            midi_file.writeFile(output_file)
+            midi_bytes = output_file.getvalue()
+
+    if instrumentation_hook is not None:
+        instrumentation_hook.count('bytes_written', len(midi_bytes))
+
+    return midi_bytes
+
+
+def write_midi_file(midi_file, output_file):
+    """
+    Writes a MIDI file object to an open binary file, and reports the bytes written to the instrumentation.
+    """
+
+    with measure_stage('write'):
+        if isinstance(midi_file, SMFWriter):
+            midi_bytes = midi_file.to_bytes()
+            output_file.write(midi_bytes)
+            bytes_written = len(midi_bytes)
+        else:
+            midi_file.writeFile(output_file)
+            bytes_written = None
+
+    if instrumentation_hook is not None and bytes_written is not None:
+        instrumentation_hook.count('bytes_written', bytes_written)
+
+
+def main(
+    midi_file_path=None,file_name='',scale_type=None,
+    scale_key=None,chords_atmosphere=None,
+    melody_length=DEFAULT_MELODY_LENGTH,bpm=DEFAULT_BPM,seed=None,rng=None,melody_engine='loop',
+    midi_backend='smf',output=None,chord_aware=False,chord_extension=None,voice_leading=False,
+    melody_register=None,chords_register=None):
+  
+    """
+    Main Function
+
+    The options that are None are chosen randomly on every call, see 'compose_midi_file' for all the options.
+    When output is given - any binary stream, like a BytesIO, a socket file or an HTTP response - the MIDI file
+    is written to it instead of to the disk, and no path is created or checked.
+
+    :return: New Midi File Path (The file has been created by the program), or the output stream if one was given.
+    """
+
+    midi_file = compose_midi_file(scale_type, scale_key, chords_atmosphere, melody_length, bpm, seed, rng,
+                                  melody_engine, midi_backend, chord_aware, chord_extension, voice_leading,
+                                  melody_register, chords_register)
+
+    if output is not None:
+        write_midi_file(midi_file, output)
+        return output
+
+    if midi_file_path is None:
+        midi_file_path = os.getcwd()
+
+    with measure_stage('file_name'):
+        # if the package is used locally
+        if file_name == '': 
+            new_midi_file_path = get_unique_file_name(midi_file_path, 'RandoMMelody', 'mid')
+
+        # if the package is used in server, it ables the server to control the name of the file bein created:
+        else: 
+            new_midi_file_path = os.path.join(midi_file_path,file_name) 
+
+    with open(new_midi_file_path, 'wb') as output_file:
+        write_midi_file(midi_file, output_file)
+        
+    return new_midi_file_path
+
+
+if __name__ == '__main__':
+    import argparse  # Getting the arguments from the user, only the command line needs it
 
-if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=USER_INSTRUCTIONS_TEXT)
     parser.add_argument('-p', "--midi_file_path",  help="Path to save the midi files of the auto-generated music."
                                                          "default path - your current working directory.",
                         default=os.getcwd())
-    parser.add_argument('-k', '--scale_key', help="the key of the scale", default=random.choice(CHROMATIC_KEYS))
+    parser.add_argument('-k', '--scale_key', help="the key of the scale")
     
-    parser.add_argument('-t', '--scale_type', help="the type of the scale",
-                        default=random.choice(list(SCALES_DICT.keys())))
-    parser.add_argument('-a', '--chords_atmosphere', help="the atmosphere of the chord progression",
-                        default=random.choice(list(ATMOSPHERE_DICT.keys())))
+    parser.add_argument('-t', '--scale_type', help="the type of the scale")
+    parser.add_argument('-a', '--chords_atmosphere', help="the atmosphere of the chord progression")
     parser.add_argument('-l', '--melody_length', help="the length of the melody", default=DEFAULT_MELODY_LENGTH)
     parser.add_argument('-b', '--bpm', help="the bpm of the melody", default=DEFAULT_BPM)
+    parser.add_argument('-s', '--seed', type=int, help="a seed, the same seed and options always create the same melody")
+    parser.add_argument('-c', '--chord_aware', action='store_true',
+                        help="play the notes of the chords on the beats of the melody")
+    parser.add_argument('-e', '--chord_extension', choices=list(CHORD_EXTENSIONS_DICT),
+                        help="extend the chords of the progression, for example 7th, 9th or sus4")
+    parser.add_argument('-v', '--voice_leading', action='store_true',
+                        help="play every chord in the inversion nearest to the chord before it")
+    parser.add_argument('-m', '--melody_register', type=parse_register,
+                        help="the pitches of the melody - {registers}, or the lowest and highest pitch, "
+                             "for example 60-84".format(registers=', '.join(REGISTERS_DICT)))
+    parser.add_argument('-r', '--chords_register', type=parse_register,
+                        help="the pitches of the chords - like the melody register")
 
     args = parser.parse_args()
     midi_file_path = args.midi_file_path
@@ -557,5 +2654,8 @@ if __name__ == '__main__':
     chords_atmosphere = args.chords_atmosphere
     melody_length = int(args.melody_length)
     bpm = int(args.bpm)
+    seed = args.seed
 
-    main(midi_file_path,'',scale_type,scale_key,chords_atmosphere,melody_length,bpm)
+    main(midi_file_path,'',scale_type,scale_key,chords_atmosphere,melody_length,bpm,seed,chord_aware=args.chord_aware,
+         chord_extension=args.chord_extension,voice_leading=args.voice_leading,
+         melody_register=args.melody_register,chords_register=args.chords_register)
@@ -0,0 +1,89 @@
+import pytest  # Running the checks for every option
+from concurrent.futures import ThreadPoolExecutor  # Rendering the parts in parallel
+
+from random_melody_module import random_melody_generator
+from random_melody_module import arrangement
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Arrangement Tests
+
+The parts of an arrangement must cover its whole length, stay in their registers, play the voiced chords, and
+give the same file with or without an executor.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+LENGTHS = (4, 16, 18, 19, 33)
+
+
+# Functions:
+
+
+def get_part_notes(midi_bytes, channel):
+    return [note for note in random_melody_generator.read_midi_file(midi_bytes) if note.channel == channel]
+
+
+@pytest.mark.parametrize('melody_length', LENGTHS)
+@pytest.mark.parametrize('chords_atmosphere', ('pop', 'needtodecide'))
+def test_parts_cover_the_length(melody_length, chords_atmosphere):
+    parts = ('chords', 'bass', 'arpeggio')
+    for scale_key in random_melody_generator.CHROMATIC_KEYS:
+        options = dict(scale_type='major', scale_key=scale_key, chords_atmosphere=chords_atmosphere,
+                       melody_length=melody_length, seed=5)
+        midi_bytes = arrangement.compose_arrangement(parts, **options)
+        _, channels, _ = arrangement.plan_arrangement(parts, **options)
+
+        for channel in channels:
+            notes = get_part_notes(midi_bytes, channel)
+            assert max(note.start + note.duration for note in notes) == melody_length
+
+        lowest_pitch, highest_pitch = arrangement.BASS_REGISTER
+        assert all(lowest_pitch <= note.pitch <= highest_pitch for note in get_part_notes(midi_bytes, channels[1]))
+
+
+@pytest.mark.parametrize('scale_type', ('major', 'pentatonic', 'wholetone'))
+@pytest.mark.parametrize('chord_extension', (None, '9th', '13th'))
+@pytest.mark.parametrize('voice_leading', (False, True))
+@pytest.mark.parametrize('chords_register', (None, 'chords'))
+def test_arpeggio_plays_the_voiced_chords(scale_type, chord_extension, voice_leading, chords_register):
+    parts = ('chords', 'arpeggio')
+    options = dict(scale_type=scale_type, scale_key='E', chords_atmosphere='pop', melody_length=64, seed=2,
+                   chord_extension=chord_extension, voice_leading=voice_leading, chords_register=chords_register)
+    midi_bytes = arrangement.compose_arrangement(parts, **options)
+    context, channels, _ = arrangement.plan_arrangement(parts, **options)
+    arpeggio_notes = get_part_notes(midi_bytes, channels[1])
+
+    for chord_time, chord_duration, chord_pitches in arrangement.iter_chords(context, context.chords_voicings):
+        assert len(set(chord_pitches)) == len(chord_pitches)
+        chord_notes = [note for note in arpeggio_notes if chord_time <= note.start < chord_time + chord_duration]
+        # The first notes of every pattern play every pitch of the chord once, an octave up:
+        first_pitches = [note.pitch - 12 * arrangement.ARPEGGIO_OCTAVES_UP
+                         for note in sorted(chord_notes, key=lambda note: note.start)[:len(chord_pitches)]]
+        assert sorted(first_pitches) == sorted(chord_pitches)
+
+
+@pytest.mark.parametrize('melody_register', (None, 'melody', (40, 60)))
+@pytest.mark.parametrize('chord_aware', (False, True))
+def test_counter_melody_register(melody_register, chord_aware):
+    parts = ('counter_melody',)
+    options = dict(melody_length=64, seed=4, melody_register=melody_register, chord_aware=chord_aware)
+    midi_bytes = arrangement.compose_arrangement(parts, **options)
+    _, channels, _ = arrangement.plan_arrangement(parts, **options)
+
+    lowest_pitch, highest_pitch = random_melody_generator.get_register(melody_register)
+    octave_up = 12 * arrangement.COUNTER_MELODY_OCTAVES_UP
+    assert all(lowest_pitch + octave_up <= note.pitch <= highest_pitch + octave_up
+               for note in get_part_notes(midi_bytes, channels[0]))
+
+
+def test_executor():
+    options = dict(chord_aware=True, melody_register='melody', chords_register='chords', melody_length=33, seed=1)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert arrangement.compose_arrangement(executor=executor, **options) == \
+            arrangement.compose_arrangement(**options)
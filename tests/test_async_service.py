@@ -0,0 +1,141 @@
+import time  # Keeping the generations in flight
+import asyncio  # Running the requests
+import threading  # Holding the generations until the test releases them
+import pytest  # Checking the rejected requests
+from concurrent.futures import ThreadPoolExecutor  # Generating in threads
+
+from random_melody_module import random_melody_generator
+from random_melody_module import async_service
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Async Service Tests
+
+Identical seeded requests must share one generation, random requests must not, and the requests beyond
+max_concurrency + max_queue must be rejected right away - until the pending requests are done.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+REQUESTS_COUNT = 10
+GENERATION_TIME = 0.05  # Seconds, so the identical requests come while the generation is in flight
+
+
+# Classes:
+
+
+class CountingGenerator(object):
+    """
+    A generate function that counts its calls, and waits until it is released.
+    """
+
+    def __init__(self, delay=GENERATION_TIME):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.released = threading.Event()
+        self.released.set()
+
+    def __call__(self, **parameters):
+        with self.lock:
+            self.calls += 1
+        self.released.wait()
+        time.sleep(self.delay)
+        return repr(sorted(parameters.items())).encode()
+
+
+# Functions:
+
+
+def run_requests(service, requests):
+    async def gather_requests():
+        return await asyncio.gather(*(service.generate(**parameters) for parameters in requests),
+                                    return_exceptions=True)
+
+    return asyncio.run(gather_requests())
+
+
+@pytest.mark.parametrize('parameters', ({'seed': 7}, {'seed': 7, 'scale_key': 'C'},
+                                        {'seed': 7, 'melody_register': [60, 84]}))
+def test_identical_requests_are_coalesced(parameters):
+    generator = CountingGenerator()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        service = async_service.AsyncMelodyService(executor, generate_function=generator)
+        results = run_requests(service, [dict(parameters) for _ in range(REQUESTS_COUNT)])
+
+    assert generator.calls == 1
+    assert len(set(results)) == 1
+    assert service.stats() == dict(requests=REQUESTS_COUNT, generated=1, coalesced=REQUESTS_COUNT - 1, rejected=0,
+                                   pending=0, in_flight=0)
+
+
+@pytest.mark.parametrize('requests', ([{} for _ in range(REQUESTS_COUNT)],
+                                      [{'seed': seed} for seed in range(REQUESTS_COUNT)]))
+def test_different_requests_are_generated(requests):
+    generator = CountingGenerator()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        service = async_service.AsyncMelodyService(executor, max_queue=REQUESTS_COUNT, generate_function=generator)
+        run_requests(service, requests)
+
+    assert generator.calls == REQUESTS_COUNT
+    assert service.stats()['coalesced'] == 0
+
+
+def test_load_shedding():
+    generator = CountingGenerator(delay=0)
+    generator.released.clear()
+    max_concurrency, max_queue = 2, 3
+
+    async def overload():
+        service = async_service.AsyncMelodyService(executor, max_concurrency, max_queue, generator)
+        accepted = [asyncio.ensure_future(service.generate(seed=seed)) for seed in range(max_concurrency + max_queue)]
+        await asyncio.sleep(0.01)
+
+        # Full - the next request is rejected, without waiting:
+        with pytest.raises(async_service.ServiceOverloadedError):
+            await service.generate(seed=100)
+        # But an identical request shares a generation that is in flight:
+        coalesced = asyncio.ensure_future(service.generate(seed=0))
+        await asyncio.sleep(0.01)
+        assert service.stats()['pending'] == max_concurrency + max_queue
+
+        generator.released.set()
+        results = await asyncio.gather(*accepted)
+        assert await coalesced == results[0]
+        assert await service.generate(seed=100)  # Accepted again once the requests are done
+        return service.stats()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency + max_queue) as executor:
+        stats = asyncio.run(overload())
+
+    assert generator.calls == max_concurrency + max_queue + 1
+    assert stats == dict(requests=max_concurrency + max_queue + 3, generated=max_concurrency + max_queue + 1,
+                         coalesced=1, rejected=1, pending=0, in_flight=0)
+
+
+def test_cancelled_request_keeps_the_generation():
+    generator = CountingGenerator()
+
+    async def cancel_one():
+        service = async_service.AsyncMelodyService(executor, generate_function=generator)
+        cancelled = asyncio.ensure_future(service.generate(seed=3))
+        kept = asyncio.ensure_future(service.generate(seed=3))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        return await kept
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert asyncio.run(cancel_one()) == generator(seed=3)
+    assert generator.calls == 2  # The shared generation, and the expected value
+
+
+def test_default_generation():
+    service = async_service.AsyncMelodyService(max_concurrency=2)
+    results = run_requests(service, [{'seed': seed, 'scale_key': 'E'} for seed in range(3)])
+
+    assert results == [random_melody_generator.generate_bytes(seed=seed, scale_key='E') for seed in range(3)]
@@ -0,0 +1,82 @@
+import io  # Writing the WAV files in memory
+import wave  # Reading the headers of the WAV files
+import pytest  # Parametrizing the tests
+from concurrent.futures import ThreadPoolExecutor  # Rendering the tracks in parallel
+
+from random_melody_module import random_melody_generator
+
+np = pytest.importorskip('numpy')  # The renderer needs the audio extra
+from random_melody_module import audio_renderer  # noqa: E402
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Audio Renderer Tests
+
+Rendering block by block must give the samples of rendering the whole piece at once, with only the notes that
+sound in every block - and the WAV file must have the header and the length of the piece.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+BLOCK_SIZES = (1000, 4096, 65536)
+SAMPLE_RATE = 8000  # Small, so the tests are fast
+MELODY_LENGTH = 33
+
+
+# Functions:
+
+
+def get_audio_notes(seed=3, melody_length=MELODY_LENGTH):
+    note_events = random_melody_generator.compose_note_events(seed=seed, melody_length=melody_length)
+    return audio_renderer.get_audio_notes(note_events, SAMPLE_RATE)
+
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+@pytest.mark.parametrize('workers', (None, 2))
+def test_blocks_match_one_render(block_size, workers):
+    audio_notes = get_audio_notes()
+    total_samples = audio_renderer.get_total_samples(audio_notes)
+
+    if workers is None:
+        blocks = list(audio_renderer.iter_audio_blocks(audio_notes, SAMPLE_RATE, block_size))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            blocks = list(audio_renderer.iter_audio_blocks(audio_notes, SAMPLE_RATE, block_size, executor))
+
+    assert all(len(block) == block_size for block in blocks[:-1])
+    np.testing.assert_allclose(np.concatenate(blocks),
+                               audio_renderer.render_block(audio_notes, 0, total_samples, SAMPLE_RATE), atol=1e-12)
+
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+def test_blocks_index_the_sounding_notes(block_size):
+    audio_notes = get_audio_notes(melody_length=128)
+    total_samples = audio_renderer.get_total_samples(audio_notes)
+    blocks_notes, blocks_offsets = audio_renderer.index_blocks_notes(audio_notes, total_samples, block_size)
+
+    for block_index, block_start in enumerate(range(0, total_samples, block_size)):
+        sounding = np.flatnonzero((audio_notes.starts < block_start + block_size) &
+                                  (audio_notes.stops > block_start))
+        assert list(blocks_notes[blocks_offsets[block_index]:blocks_offsets[block_index + 1]]) == list(sounding)
+
+
+def test_wav_header_and_length():
+    note_events = random_melody_generator.compose_note_events(seed=3, melody_length=MELODY_LENGTH, bpm=90)
+    output = io.BytesIO()
+    samples_count = audio_renderer.write_wav(note_events, output, SAMPLE_RATE, block_size=1000)
+
+    # The release of the last note sounds after the end of the melody:
+    assert samples_count == round((MELODY_LENGTH * 60.0 / 90 + audio_renderer.RELEASE_TIME) * SAMPLE_RATE)
+
+    output.seek(0)
+    with wave.open(output, 'rb') as wav_file:
+        assert wav_file.getnchannels() == 1
+        assert wav_file.getsampwidth() == audio_renderer.SAMPLE_WIDTH
+        assert wav_file.getframerate() == SAMPLE_RATE
+        assert wav_file.getnframes() == samples_count
+        assert len(wav_file.readframes(samples_count + 1)) == samples_count * audio_renderer.SAMPLE_WIDTH
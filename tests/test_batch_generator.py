@@ -0,0 +1,105 @@
+import os  # Reading the written files
+import pytest  # Parametrizing the tests
+
+from random_melody_module import random_melody_generator
+from random_melody_module import batch_generator
+from random_melody_module import output_sinks
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Batch Generator Tests
+
+Every spec of a batch must be rendered once, to the file of its seed - in the order of the specs with a single
+worker, in any order with a pool. The specs are read lazily, a few per worker at a time, and the files can be
+packed into a sink.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+SPECS_COUNT = 12
+WORKERS = 2
+
+
+# Functions:
+
+
+def get_specs(count=SPECS_COUNT):
+    return [{'seed': seed, 'melody_length': 8 + seed % 3} for seed in range(count)]
+
+
+def get_spec_bytes(spec):
+    return random_melody_generator.generate_bytes(**{key: value for key, value in spec.items() if key != 'file_name'})
+
+
+def test_single_worker_keeps_the_order(tmp_path):
+    results = list(batch_generator.generate_batch(get_specs(), str(tmp_path), workers=1))
+
+    assert [result.index for result in results] == list(range(SPECS_COUNT))
+    for result in results:
+        assert os.path.basename(result.path) == 'RandoMMelody_{index}.mid'.format(index=result.index)
+        with open(result.path, 'rb') as midi_file:
+            assert midi_file.read() == get_spec_bytes(result.spec)
+
+
+@pytest.mark.parametrize('shard_size', (None, 5))
+def test_pool_renders_every_spec(tmp_path, shard_size):
+    results = list(batch_generator.generate_batch(get_specs(), str(tmp_path), workers=WORKERS,
+                                                  shard_size=shard_size))
+
+    assert sorted(result.index for result in results) == list(range(SPECS_COUNT))
+    for result in results:
+        assert os.path.relpath(result.path, str(tmp_path)) == \
+            batch_generator.get_index_file_name('RandoMMelody', result.index, shard_size)
+        with open(result.path, 'rb') as midi_file:
+            assert midi_file.read() == get_spec_bytes(result.spec)
+
+
+def test_pending_specs_are_bounded(tmp_path):
+    read_specs = []
+
+    def iter_specs():
+        for spec in get_specs(100):
+            read_specs.append(spec)
+            yield spec
+
+    batch = batch_generator.generate_batch(iter_specs(), str(tmp_path), workers=WORKERS)
+    next(batch)
+    # The specs in flight, and the spec that waits for a free worker:
+    assert len(read_specs) <= WORKERS * batch_generator.PENDING_TASKS_PER_WORKER + 1
+
+    assert len(list(batch)) == 99 and len(read_specs) == 100
+
+
+def test_unique_names(tmp_path):
+    first_paths = [result.path for result in batch_generator.generate_batch(get_specs(3), str(tmp_path), workers=1,
+                                                                            unique_names=True)]
+    second_paths = [result.path for result in batch_generator.generate_batch(get_specs(3), str(tmp_path),
+                                                                             workers=WORKERS, unique_names=True)]
+
+    assert len(set(first_paths + second_paths)) == 6
+    midi_file_names = [file_name for file_name in os.listdir(str(tmp_path)) if not file_name.startswith('.')]
+    assert sorted(midi_file_names) == sorted(os.path.basename(path) for path in first_paths + second_paths)
+
+
+@pytest.mark.parametrize('file_name', ('melodies.zip', 'melodies.shard'))
+@pytest.mark.parametrize('workers', (1, WORKERS))
+def test_sink_output(tmp_path, file_name, workers):
+    path = str(tmp_path / file_name)
+    with output_sinks.get_output_sink(path) as output_sink:
+        results = list(batch_generator.generate_batch(get_specs(), workers=workers, output_sink=output_sink))
+
+    assert sorted(os.listdir(str(tmp_path))) in ([file_name], [file_name, file_name + output_sinks.SHARD_INDEX_EXT])
+    with output_sinks.open_sink_reader(path) as sink_reader:
+        assert sorted(sink_reader.names()) == sorted(result.path for result in results)
+        for result in results:
+            assert bytes(sink_reader[result.path]) == get_spec_bytes(result.spec)
+
+
+def test_unknown_spec_keys(tmp_path):
+    with pytest.raises(ValueError):
+        list(batch_generator.generate_batch([{'seed': 1, 'tempo': 90}], str(tmp_path), workers=1))
@@ -0,0 +1,52 @@
+import pytest  # Parametrizing the tests
+
+from random_melody_module import random_melody_generator, fingerprint_index
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Fingerprint Index Tests
+
+A melody is a duplicate only of a melody with the same intervals - the melodies of fewer than 2 notes have none,
+so they are never duplicates.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+SHORT_MELODIES = [(), ((60, 0, 1),), ((62, 0, 2),), ((72, 1, 0.5),)]  # (pitch, start, duration) of every note
+
+
+# Functions:
+
+
+def get_note_events(notes):
+    note_events = random_melody_generator.NoteEvents()
+    for pitch, start, duration in notes:
+        note_events.addNote(0, 0, pitch, start, duration, 100)
+    return note_events
+
+
+@pytest.mark.parametrize('notes', SHORT_MELODIES)
+def test_short_melodies_are_never_duplicates(notes):
+    with fingerprint_index.FingerprintIndex() as index:
+        for other_notes in SHORT_MELODIES:
+            index.check_and_add(index.fingerprint(get_note_events(other_notes)))
+
+        duplicate_check, _ = index.check_and_add(index.fingerprint(get_note_events(notes)))
+
+        assert duplicate_check == fingerprint_index.NOT_DUPLICATE
+        assert len(index) == len(SHORT_MELODIES) + 1
+
+
+def test_transposed_melody_is_a_duplicate():
+    notes = ((60, 0, 1), (64, 1, 1), (67, 2, 2))
+    with fingerprint_index.FingerprintIndex() as index:
+        _, melody_id = index.check_and_add(index.fingerprint(get_note_events(notes)))
+        duplicate_check, _ = index.check_and_add(index.fingerprint(get_note_events(
+            [(pitch + 5, start, duration) for pitch, start, duration in notes])))
+
+        assert duplicate_check == fingerprint_index.DuplicateCheck('exact', melody_id, 1.0)
@@ -0,0 +1,83 @@
+import pytest  # Running the comparisons for every option
+
+from random_melody_module import random_melody_generator
+from random_melody_module.melody_cache import MelodyCache
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Melody Cache Tests
+
+A MelodyCache must return exactly the bytes of 'random_melody_generator.generate_bytes' for every option it
+takes - on a miss, on a hit, and when the melody is spliced with a cached chords track.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+SEEDS = range(10)
+
+
+# Functions:
+
+
+def assert_same_bytes(cache, **options):
+    """
+    Generates the same file with and without the cache, twice from the cache - a miss and a hit.
+    """
+
+    expected_bytes = random_melody_generator.generate_bytes(**options)
+    assert cache.generate_bytes(**options) == expected_bytes, "The cache differs for {options}".format(
+        options=options)
+    assert cache.generate_bytes(**options) == expected_bytes, "The cache hit differs for {options}".format(
+        options=options)
+
+
+@pytest.mark.parametrize('melody_engine', sorted(random_melody_generator.MELODY_ENGINES_DICT))
+@pytest.mark.parametrize('chord_aware', (False, True))
+def test_chord_aware(melody_engine, chord_aware):
+    cache = MelodyCache()
+    for seed in SEEDS:
+        assert_same_bytes(cache, melody_engine=melody_engine, chord_aware=chord_aware, seed=seed)
+        # The chords track of the same scale and atmosphere is shared - and spliced to other melodies:
+        assert_same_bytes(cache, scale_type='major', scale_key='C', chords_atmosphere='pop',
+                          melody_engine=melody_engine, chord_aware=chord_aware, seed=seed)
+
+    assert cache.stats()['chords_hits'] > 0
+
+
+@pytest.mark.parametrize('chord_extension', [None] + sorted(random_melody_generator.CHORD_EXTENSIONS_DICT))
+@pytest.mark.parametrize('voice_leading', (False, True))
+def test_chord_options(chord_extension, voice_leading):
+    cache = MelodyCache()
+    for seed in SEEDS:
+        for chord_aware in (False, True):
+            assert_same_bytes(cache, scale_type='dorian', scale_key='E', chords_atmosphere='sad',
+                              chord_aware=chord_aware, chord_extension=chord_extension, voice_leading=voice_leading,
+                              seed=seed)
+
+
+@pytest.mark.parametrize('register', sorted(random_melody_generator.REGISTERS_DICT) + [(110, 127)])
+def test_registers(register):
+    cache = MelodyCache()
+    for seed in SEEDS:
+        assert_same_bytes(cache, melody_register=register, chords_register=register, chord_extension='9th',
+                          chord_aware=True, seed=seed)
+        assert_same_bytes(cache, scale_type='major', scale_key='C', chords_atmosphere='pop', chords_register=register,
+                          seed=seed)
+
+
+def test_register_key():
+    cache = MelodyCache()
+    named_bytes = cache.generate_bytes(melody_register='melody', chords_register='chords', seed=4)
+    assert cache.generate_bytes(melody_register=(60, 84), chords_register=(48, 72), seed=4) == named_bytes
+    assert cache.stats()['hits'] == 1
+
+
+def test_chord_aware_key():
+    cache = MelodyCache()
+    chord_aware_bytes = cache.generate_bytes(scale_type='major', scale_key='C', chord_aware=True, seed=3)
+    assert cache.generate_bytes(scale_type='major', scale_key='C', chord_aware=False, seed=3) != chord_aware_bytes
@@ -0,0 +1,116 @@
+import random  # The random generators of the melodies
+import logging  # Checking the skipped files are reported
+import pytest  # Parametrizing the tests
+
+from random_melody_module import random_melody_generator
+from random_melody_module import melody_models
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Melody Models Tests
+
+A Markov model fitted to MIDI files must count their transitions, give the same melody after it is saved and
+loaded, and the same melody for the same seed.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+FITTED_FILES_COUNT = 4
+MELODY_LENGTH = 32
+
+
+# Functions:
+
+
+def write_midi_files(directory, count=FITTED_FILES_COUNT):
+    for seed in range(count):
+        midi_bytes = random_melody_generator.generate_bytes(scale_type='major', scale_key='C', seed=seed,
+                                                            melody_length=MELODY_LENGTH)
+        (directory / 'melody_{seed}.mid'.format(seed=seed)).write_bytes(midi_bytes)
+
+
+def get_melody(model, seed, scale_notes=('C', 'D', 'E', 'F', 'G', 'A', 'B')):
+    return list(model.iter_melody(list(scale_notes), MELODY_LENGTH, random.Random(seed)))
+
+
+def test_melody_model_is_abstract():
+    with pytest.raises(TypeError):
+        melody_models.MelodyModel()
+
+
+@pytest.mark.parametrize('order', melody_models.MARKOV_ORDERS)
+def test_fit(tmp_path, order):
+    write_midi_files(tmp_path)
+    model = melody_models.fit_markov_model(str(tmp_path), order, scale_types=['major', 'ionian', 'minor'])
+
+    major_counts = model.degree_counts['major']
+    assert len(major_counts) == 7 ** order and all(len(row) == 7 for row in major_counts)
+    assert sum(map(sum, major_counts)) > 0
+    assert 'ionian' not in model.degree_counts  # The same intervals as the major scale, counted once
+    assert sum(map(sum, model.rhythm_counts)) > 0
+
+    # The fitted rows moved away from the defaults:
+    assert model.get_degree_table(['C', 'D', 'E', 'F', 'G', 'A', 'B']) != \
+        melody_models.get_default_degree_table(7, order)
+
+
+def test_fit_skips_bad_files(tmp_path, caplog):
+    write_midi_files(tmp_path, 1)
+    (tmp_path / 'broken.mid').write_bytes(b'not a midi file')
+
+    with caplog.at_level(logging.WARNING, logger=melody_models.__name__):
+        model = melody_models.fit_markov_model(str(tmp_path))
+
+    assert 'broken.mid' in caplog.text
+    assert sum(map(sum, model.degree_counts['major'])) > 0
+
+
+@pytest.mark.parametrize('order', melody_models.MARKOV_ORDERS)
+def test_save_and_load(tmp_path, order):
+    write_midi_files(tmp_path)
+    model = melody_models.fit_markov_model(str(tmp_path), order)
+    model_path = str(tmp_path / 'model.json')
+    model.save(model_path)
+    loaded_model = melody_models.MarkovMelodyModel.load(model_path)
+
+    assert loaded_model.to_dict() == model.to_dict()
+    for seed in range(5):
+        assert get_melody(loaded_model, seed) == get_melody(model, seed)
+
+
+def test_load_rejects_other_files(tmp_path):
+    model_path = tmp_path / 'model.json'
+    model_path.write_text('{"version": 0}')
+    with pytest.raises(ValueError):
+        melody_models.MarkovMelodyModel.load(str(model_path))
+
+
+@pytest.mark.parametrize('model', [melody_models.MarkovMelodyModel(1), melody_models.MarkovMelodyModel(2),
+                                   melody_models.UniformMelodyModel()])
+def test_same_seed_same_melody(model):
+    melodies = [get_melody(model, seed) for seed in range(10)]
+    assert melodies == [get_melody(model, seed) for seed in range(10)]
+    assert len({tuple(melody) for melody in melodies}) > 1
+
+    options = dict(scale_type='major', scale_key='A', chords_atmosphere='pop', melody_length=MELODY_LENGTH,
+                   melody_engine=model)
+    assert random_melody_generator.generate_bytes(seed=7, **options) == \
+        random_melody_generator.generate_bytes(seed=7, **options)
+
+
+def test_scales_outside_the_table_are_not_kept():
+    model = melody_models.MarkovMelodyModel(2)
+    degree_tables_count = len(model.degree_tables)
+
+    for scale_notes in (('C', 'D', 'E'), ('C', 'D#', 'F#', 'A'), ('D', 'E', 'F#', 'A')):
+        melody = get_melody(model, 3, scale_notes)
+        assert {pitch % 12 for _, _, _, pitch, _, _ in melody} <= \
+            {random_melody_generator.NOTES_PITCH_CLASSES_DICT[note] for note in scale_notes}
+
+    assert len(model.degree_tables) == degree_tables_count
+    assert model.get_degree_table(['C', 'D', 'E']) is melody_models.get_default_degree_table(3, 2)
@@ -0,0 +1,102 @@
+import pytest  # Disabling the metrics after every test
+from urllib.error import HTTPError  # Checking the unknown paths
+from urllib.request import urlopen  # Scraping the served metrics
+
+from random_melody_module import random_melody_generator
+from random_melody_module import metrics
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Metrics Tests
+
+The metrics must count every generated file, note and written byte, time every stage of the generation, render
+them in the Prometheus text format - and must not change the generated files, or count while they are disabled.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+FILES_COUNT = 3
+GENERATION_STAGES = ('setup', 'scale_notes', 'chord_progression', 'melody', 'write')
+
+
+# Functions:
+
+
+@pytest.fixture
+def enabled_metrics():
+    enabled_metrics = metrics.enable_metrics()
+    yield enabled_metrics
+    metrics.disable_metrics()
+
+
+def parse_samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+
+    return samples
+
+
+@pytest.mark.parametrize('midi_backend', ('smf', 'midiutil'))
+def test_generation_is_counted(enabled_metrics, midi_backend):
+    if midi_backend == 'midiutil':
+        pytest.importorskip('midiutil')
+    midis = [random_melody_generator.generate_bytes(seed=seed, midi_backend=midi_backend)
+             for seed in range(FILES_COUNT)]
+
+    stats = enabled_metrics.stats()
+    assert stats['files'] == FILES_COUNT
+    assert stats['bytes_written'] == sum(len(midi) for midi in midis)
+    assert stats['notes'] > 0 and stats['rng_draws'] > 0
+    for stage in GENERATION_STAGES:
+        assert stats['stages'][stage][0] == FILES_COUNT
+
+    metrics.disable_metrics()
+    # The instrumentation doesn't change the generation:
+    assert midis == [random_melody_generator.generate_bytes(seed=seed, midi_backend=midi_backend)
+                     for seed in range(FILES_COUNT)]
+    assert enabled_metrics.stats()['files'] == FILES_COUNT
+
+
+def test_render():
+    rendered_metrics = metrics.PrometheusMetrics(buckets=(1.0, 0.1))
+    rendered_metrics.count('notes', 5)
+    for seconds in (0.05, 0.1, 0.5, 2.0):
+        rendered_metrics.stage_finished('melody', seconds)
+
+    text = rendered_metrics.render()
+    samples = parse_samples(text)
+
+    assert '# TYPE random_melody_notes_total counter' in text
+    assert '# TYPE random_melody_stage_seconds histogram' in text
+    assert samples['random_melody_notes_total'] == 5
+    assert samples['random_melody_files_total'] == 0
+    assert samples['random_melody_stage_seconds_bucket{stage="melody",le="0.1"}'] == 2  # The bounds are inclusive
+    assert samples['random_melody_stage_seconds_bucket{stage="melody",le="1.0"}'] == 3
+    assert samples['random_melody_stage_seconds_bucket{stage="melody",le="+Inf"}'] == 4
+    assert samples['random_melody_stage_seconds_count{stage="melody"}'] == 4
+    assert samples['random_melody_stage_seconds_sum{stage="melody"}'] == pytest.approx(2.65)
+    assert rendered_metrics.stats()['stages'] == {'melody': (4, pytest.approx(2.65))}
+
+
+def test_serve_metrics(enabled_metrics):
+    random_melody_generator.generate_bytes(seed=1)
+    server = metrics.serve_metrics(enabled_metrics, port=0)
+    url = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    try:
+        with urlopen(url + '/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert parse_samples(response.read().decode())['random_melody_files_total'] == 1
+        with pytest.raises(HTTPError) as error:
+            urlopen(url + '/other')
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,85 @@
+import os  # Checking the claimed files
+import pytest  # Parametrizing the tests
+from concurrent.futures import ProcessPoolExecutor  # Claiming names in worker processes
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Output Allocator Tests
+
+Every claimed name must be new, and the high-water mark must be saved by the worker processes too - they end
+without running atexit. Every layout of the files has its own mark, and the single files of 'main' leave none.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+NAMES_PER_TASK = 5  # Less than HIGH_WATER_MARK_INTERVAL, so only the end of the worker saves the mark
+TASKS_COUNT = 8
+
+
+# Functions:
+
+
+def claim_names(directory):
+    return [random_melody_generator.get_output_allocator(directory).allocate() for _ in range(NAMES_PER_TASK)]
+
+
+@pytest.mark.parametrize('parent_allocator', (False, True))
+def test_worker_processes_save_the_mark(tmp_path, parent_allocator):
+    directory = str(tmp_path / 'midis')
+    os.mkdir(directory)
+    if parent_allocator:  # Forked into the workers with the allocators of this process
+        random_melody_generator.get_output_allocator(str(tmp_path)).allocate()
+    # A single worker never skips a taken name, so only its end saves the mark:
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        paths = [path for task_paths in executor.map(claim_names, [directory] * TASKS_COUNT) for path in task_paths]
+
+    assert len(set(paths)) == len(paths) == NAMES_PER_TASK * TASKS_COUNT
+    allocator = random_melody_generator.OutputAllocator(directory)
+    assert allocator.read_high_water_mark() == NAMES_PER_TASK * TASKS_COUNT + 1
+    new_path = allocator.allocate()
+    assert new_path not in paths and os.path.exists(new_path)
+
+
+def test_high_water_mark_path(tmp_path):
+    directory = tmp_path / 'midis'
+    directory.mkdir()
+    high_water_mark_path = str(tmp_path / 'next')
+    allocator = random_melody_generator.OutputAllocator(str(directory), high_water_mark_path=high_water_mark_path,
+                                                        save_interval=1)
+    paths = [allocator.allocate() for _ in range(3)]
+
+    assert sorted(os.listdir(str(directory))) == sorted(os.path.basename(path) for path in paths)
+    assert random_melody_generator.OutputAllocator(str(directory), high_water_mark_path=high_water_mark_path) \
+        .read_high_water_mark() == 4
+
+
+def test_shard_layouts_have_their_own_marks(tmp_path):
+    directory = str(tmp_path)
+    flat_allocator = random_melody_generator.OutputAllocator(directory, save_interval=1)
+    sharded_allocator = random_melody_generator.OutputAllocator(directory, shard_size=2, save_interval=1)
+    assert flat_allocator.high_water_mark_path != sharded_allocator.high_water_mark_path
+
+    flat_paths = [flat_allocator.allocate() for _ in range(3)]
+    sharded_paths = [sharded_allocator.allocate() for _ in range(5)]
+
+    assert [os.path.basename(path) for path in flat_paths] == \
+        ['RandoMMelody.mid', 'RandoMMelody_2.mid', 'RandoMMelody_3.mid']
+    assert os.path.relpath(sharded_paths[-1], directory) == os.path.join('000002', 'RandoMMelody_5.mid')
+    assert random_melody_generator.OutputAllocator(directory).read_high_water_mark() == 4
+    assert random_melody_generator.OutputAllocator(directory, shard_size=2).read_high_water_mark() == 6
+
+
+def test_single_files_leave_no_mark(tmp_path):
+    directory = str(tmp_path)
+    paths = [random_melody_generator.get_unique_file_name(directory, 'RandoMMelody', 'mid') for _ in range(3)]
+    random_melody_generator.close_output_allocators()
+
+    assert sorted(os.listdir(directory)) == sorted(os.path.basename(path) for path in paths)
+    assert len(set(paths)) == len(paths)
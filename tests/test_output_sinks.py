@@ -0,0 +1,93 @@
+import pytest  # Parametrizing the tests
+
+from random_melody_module import output_sinks
+from random_melody_module import batch_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Output Sinks Tests
+
+A packed file never has two files of the same name - the unique names are numbered after the files it has
+already, even when it is opened again, and writing (or claiming) a name twice is refused - before a batch
+composes its melodies.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+PACKED_FILE_NAMES = ['melodies.zip', 'melodies.shard']
+NAMES_COUNT = 3
+
+
+# Functions:
+
+
+def write_unique_names(path, count):
+    with output_sinks.get_output_sink(path) as output_sink:
+        names = [output_sink.get_unique_name() for _ in range(count)]  # Claimed before they are written
+        for name in names:
+            output_sink.write(name, name.encode('utf-8'))
+    return names
+
+
+@pytest.mark.parametrize('file_name', PACKED_FILE_NAMES)
+def test_unique_names_after_reopening(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    with output_sinks.get_output_sink(path) as output_sink:
+        output_sink.write('RandoMMelody_2.mid', b'custom')
+
+    names = write_unique_names(path, NAMES_COUNT) + write_unique_names(path, NAMES_COUNT)
+
+    with output_sinks.open_sink_reader(path) as sink_reader:
+        assert sorted(sink_reader.names()) == sorted(names + ['RandoMMelody_2.mid'])
+        assert bytes(sink_reader['RandoMMelody_2.mid']) == b'custom'
+    assert len(set(names)) == len(names) == 2 * NAMES_COUNT
+
+
+@pytest.mark.parametrize('file_name', PACKED_FILE_NAMES)
+def test_duplicate_name_is_refused(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    write_unique_names(path, NAMES_COUNT)
+
+    with output_sinks.get_output_sink(path) as output_sink:
+        with pytest.raises(output_sinks.DuplicateNameError):
+            output_sink.write('RandoMMelody.mid', b'duplicate')
+        with pytest.raises(output_sinks.DuplicateNameError):
+            output_sink.claim_name('RandoMMelody.mid')
+        output_sink.write(output_sink.claim_name('RandoMMelody_new.mid'), b'new')
+        with pytest.raises(output_sinks.DuplicateNameError):
+            output_sink.write('RandoMMelody_new.mid', b'duplicate')
+
+    with output_sinks.open_sink_reader(path) as sink_reader:
+        assert len(sink_reader) == NAMES_COUNT + 1
+        assert bytes(sink_reader['RandoMMelody.mid']) == b'RandoMMelody.mid'
+
+
+@pytest.mark.parametrize('file_name', PACKED_FILE_NAMES)
+def test_batch_names_are_checked_before_composing(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    with output_sinks.get_output_sink(path) as output_sink:
+        list(batch_generator.generate_batch([{'seed': seed} for seed in range(NAMES_COUNT)], workers=1,
+                                            output_sink=output_sink))
+
+    composed_specs = []
+
+    def iter_specs():
+        for seed in range(NAMES_COUNT):
+            composed_specs.append(seed)
+            yield {'seed': seed}
+
+    with output_sinks.get_output_sink(path) as output_sink:
+        with pytest.raises(output_sinks.DuplicateNameError):
+            list(batch_generator.generate_batch(iter_specs(), workers=1, output_sink=output_sink))
+        # Only the first spec was read, and nothing was written:
+        assert composed_specs == [0]
+        assert len(output_sink.names) == NAMES_COUNT
+
+        results = list(batch_generator.generate_batch(iter_specs(), workers=1, unique_names=True,
+                                                      output_sink=output_sink))
+        assert len(output_sink.names) == 2 * NAMES_COUNT == len({result.path for result in results}) * 2
@@ -0,0 +1,62 @@
+import pytest  # Running the checks for every option
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Register Tests
+
+Every chord of every extension must be played inside its register - and so inside the MIDI pitches 0 - 127 -
+however high the register is.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+REGISTERS = sorted(random_melody_generator.REGISTERS_DICT) + [(110, 127), (0, 11), (116, 127)]
+
+
+# Functions:
+
+
+def iter_scales_chords(chord_extension):
+    for scale_type in random_melody_generator.SCALES_DICT:
+        for scale_key in random_melody_generator.CHROMATIC_KEYS:
+            scale_notes = random_melody_generator.get_scale_notes(scale_key, scale_type)
+            for chord_notes in random_melody_generator.get_scale_chords(scale_notes, chord_extension):
+                yield chord_notes
+
+
+@pytest.mark.parametrize('register', REGISTERS)
+@pytest.mark.parametrize('chord_extension', sorted(random_melody_generator.CHORD_EXTENSIONS_DICT))
+def test_chord_pitches(register, chord_extension):
+    lowest_pitch, highest_pitch = random_melody_generator.get_register(register)
+    for chord_notes in iter_scales_chords(chord_extension):
+        pitches = random_melody_generator.get_chord_pitches(chord_notes, register)
+        assert all(lowest_pitch <= pitch <= highest_pitch for pitch in pitches), (chord_notes, register, pitches)
+        assert len(set(pitches)) == len(pitches)
+        # Every note of the chord is played, from its root:
+        assert {pitch % 12 for pitch in pitches} == \
+            {random_melody_generator.NOTES_PITCH_CLASSES_DICT[note] for note in chord_notes}
+        assert pitches[0] % 12 == random_melody_generator.NOTES_PITCH_CLASSES_DICT[chord_notes[0]]
+
+
+@pytest.mark.parametrize('register', REGISTERS)
+@pytest.mark.parametrize('chord_extension', sorted(random_melody_generator.CHORD_EXTENSIONS_DICT))
+def test_composed_chords(register, chord_extension):
+    lowest_pitch, highest_pitch = random_melody_generator.get_register(register)
+    for seed in range(5):
+        note_events = random_melody_generator.compose_note_events(melody_length=16, seed=seed,
+                                                                  chord_extension=chord_extension,
+                                                                  chords_register=register)
+        chords_pitches = [note_events.pitches[index] for index in note_events.get_note_indexes(track=1)]
+        assert all(lowest_pitch <= pitch <= highest_pitch for pitch in chords_pitches)
+
+
+def test_narrow_voicing_register():
+    with pytest.raises(ValueError):
+        random_melody_generator.get_chords_voicings([['C', 'E', 'G', 'B', 'D', 'F', 'A']], (110, 127))
@@ -0,0 +1,68 @@
+import io  # Writing the MIDI files of 'main' to memory
+import random  # The global random state, and the random generators of the generations
+import pytest  # Parametrizing the tests
+from concurrent.futures import ThreadPoolExecutor  # Generating at the same time
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Seeds Tests
+
+The same seed must always give the same file - in every engine and backend, through every entry point, and
+however many generations run at the same time - and a generation must never touch the global 'random' module.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+SEEDS = range(8)
+ENGINES = sorted(random_melody_generator.MELODY_ENGINES_DICT)
+BACKENDS = sorted(random_melody_generator.MIDI_BACKENDS_DICT)
+
+
+# Functions:
+
+
+@pytest.mark.parametrize('melody_engine', ENGINES)
+@pytest.mark.parametrize('midi_backend', BACKENDS)
+def test_same_seed_same_file(melody_engine, midi_backend):
+    options = dict(melody_engine=melody_engine, midi_backend=midi_backend, melody_length=32)
+    files = [random_melody_generator.generate_bytes(seed=seed, **options) for seed in SEEDS]
+
+    assert files == [random_melody_generator.generate_bytes(seed=seed, **options) for seed in SEEDS]
+    assert files == [random_melody_generator.generate_bytes(rng=random.Random(seed), **options) for seed in SEEDS]
+    assert len(set(files)) == len(files)
+
+
+@pytest.mark.parametrize('melody_engine', ENGINES)
+def test_entry_points_agree(melody_engine):
+    for seed in SEEDS:
+        output = random_melody_generator.main(output=io.BytesIO(), seed=seed, melody_engine=melody_engine)
+        assert output.getvalue() == random_melody_generator.generate_bytes(seed=seed, melody_engine=melody_engine)
+
+
+@pytest.mark.parametrize('melody_engine', ENGINES)
+def test_global_random_is_untouched(melody_engine):
+    random.seed(1234)
+    expected_state = random.getstate()
+
+    random_melody_generator.generate_bytes(seed=3, melody_engine=melody_engine)
+    random_melody_generator.generate_bytes(melody_engine=melody_engine)  # Without a seed, too
+
+    assert random.getstate() == expected_state
+
+
+def test_concurrent_generations():
+    expected_files = [random_melody_generator.generate_bytes(seed=seed, melody_engine=ENGINES[seed % len(ENGINES)])
+                      for seed in SEEDS]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        files = list(executor.map(lambda seed: random_melody_generator.generate_bytes(
+            seed=seed, melody_engine=ENGINES[seed % len(ENGINES)]), list(SEEDS) * 4))
+
+    assert files == expected_files * 4
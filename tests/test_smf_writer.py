@@ -0,0 +1,110 @@
+import pytest  # Running the comparisons for every option
+from io import BytesIO  # Writing the MIDI file objects to memory
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        SMF Writer Tests
+
+The 'smf' backend must write exactly the same bytes as the 'midiutil' backend, for every option of the
+generation - every request that changes what is written to the file adds its options here.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+LENGTHS = (4, 16, 33, 128, 1000)
+SEEDS = range(10)
+
+
+# Functions:
+
+
+def assert_same_bytes(**options):
+    """
+    Composes the same file with both backends, and checks that the bytes are equal.
+    """
+
+    smf_bytes = random_melody_generator.generate_bytes(midi_backend='smf', **options)
+    midiutil_bytes = random_melody_generator.generate_bytes(midi_backend='midiutil', **options)
+    assert smf_bytes == midiutil_bytes, "The backends differ for {options}".format(options=options)
+
+
+def get_file_bytes(midi_file):
+    output_file = BytesIO()
+    midi_file.writeFile(output_file)
+    return output_file.getvalue()
+
+
+@pytest.mark.parametrize('scale_type', sorted(random_melody_generator.SCALES_DICT))
+def test_scales(scale_type):
+    for scale_key in random_melody_generator.CHROMATIC_KEYS:
+        assert_same_bytes(scale_type=scale_type, scale_key=scale_key, seed=1)
+
+
+@pytest.mark.parametrize('chords_atmosphere', sorted(random_melody_generator.ATMOSPHERE_DICT))
+def test_atmospheres(chords_atmosphere):
+    for seed in SEEDS:
+        assert_same_bytes(chords_atmosphere=chords_atmosphere, seed=seed)
+
+
+@pytest.mark.parametrize('melody_length', LENGTHS)
+@pytest.mark.parametrize('melody_engine', sorted(random_melody_generator.MELODY_ENGINES_DICT))
+def test_lengths_and_engines(melody_length, melody_engine):
+    for seed in SEEDS:
+        assert_same_bytes(melody_length=melody_length, melody_engine=melody_engine, seed=seed)
+
+
+@pytest.mark.parametrize('melody_engine', sorted(random_melody_generator.MELODY_ENGINES_DICT))
+def test_chord_aware(melody_engine):
+    for melody_length in LENGTHS:
+        for seed in SEEDS:
+            assert_same_bytes(melody_length=melody_length, melody_engine=melody_engine, chord_aware=True, seed=seed)
+
+
+@pytest.mark.parametrize('chord_extension', sorted(random_melody_generator.CHORD_EXTENSIONS_DICT))
+@pytest.mark.parametrize('voice_leading', (False, True))
+def test_chord_options(chord_extension, voice_leading):
+    for chords_atmosphere in random_melody_generator.ATMOSPHERE_DICT:
+        for seed in SEEDS:
+            assert_same_bytes(chords_atmosphere=chords_atmosphere, chord_extension=chord_extension,
+                              voice_leading=voice_leading, seed=seed)
+
+
+@pytest.mark.parametrize('register', sorted(random_melody_generator.REGISTERS_DICT) + [(110, 127)])
+def test_registers(register):
+    for chord_extension in (None, '7th', '13th'):
+        for seed in SEEDS:
+            assert_same_bytes(melody_register=register, chords_register=register, chord_extension=chord_extension,
+                              chord_aware=True, seed=seed)
+
+
+@pytest.mark.parametrize('bpm', (60, 120, 187))
+def test_bpm(bpm):
+    for seed in SEEDS:
+        assert_same_bytes(bpm=bpm, seed=seed)
+
+
+def test_random_options():
+    for seed in range(200):
+        assert_same_bytes(seed=seed)  # The scale, the key and the atmosphere are drawn from the seed
+
+
+@pytest.mark.parametrize('melody_engine', sorted(random_melody_generator.MELODY_ENGINES_DICT))
+def test_note_events(melody_engine):
+    for seed in SEEDS:
+        note_events = random_melody_generator.compose_note_events(melody_length=128, melody_engine=melody_engine,
+                                                                  seed=seed)
+        note_events.transpose(3, track=0)  # Reads the columns in the middle of the composition
+        note_events.addNote(0, 0, 60, 128, 1, 100)  # A pending note, after the columns were read
+        note_events.add_notes(1, 1, [(128, 4, 48, 100), (128, 4, 52, 100)])
+
+        smf_writer = note_events.write_to(random_melody_generator.SMFWriter(2))
+        midi_file = note_events.write_to(random_melody_generator.MIDI_BACKENDS_DICT['midiutil'](2))
+        assert len(smf_writer) == len(note_events)
+        assert get_file_bytes(smf_writer) == get_file_bytes(midi_file)
@@ -0,0 +1,77 @@
+import sys  # Running the module in new interpreters
+import inspect  # Checking the defaults of the options
+import subprocess  # Importing and running the module in new interpreters
+import pytest  # Parametrizing the tests
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Startup Tests
+
+Importing the generator (in every worker process, for example) must stay fast: argparse, midiutil and threading
+are imported only where they are used, the theory tables are built on the first generation, and nothing random
+is chosen on import - the options that are not given are chosen on every call, by the functions and by the
+command line alike.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+LAZY_MODULES = ('argparse', 'midiutil', 'threading')
+RANDOM_OPTIONS = ('scale_type', 'scale_key', 'chords_atmosphere')
+IMPORT_CHECK_CODE = '''
+import sys
+import random
+random.seed(0)
+random_state = random.getstate()
+from random_melody_module import random_melody_generator
+print(','.join(module for module in {lazy_modules!r} if module in sys.modules))
+print(random_melody_generator.theory_tables is None, random.getstate() == random_state)
+'''
+
+
+# Functions:
+
+
+def run_python(*args, **kwargs):
+    return subprocess.run((sys.executable,) + args, check=True, stdout=subprocess.PIPE, universal_newlines=True,
+                          **kwargs).stdout
+
+
+def test_import_is_lazy():
+    imported_modules, tables_state = run_python('-c', IMPORT_CHECK_CODE.format(lazy_modules=LAZY_MODULES)) \
+        .splitlines()
+
+    assert imported_modules == ''
+    assert tables_state == 'True True'  # No tables built, and no random draws on import
+
+
+def test_theory_tables_are_built_once():
+    random_melody_generator.generate_bytes(seed=0)
+    theory_tables = random_melody_generator.get_theory_tables()
+
+    assert random_melody_generator.get_theory_tables() is theory_tables
+    assert tuple(dict(table) for table in theory_tables) == random_melody_generator.build_theory_tables()
+
+
+@pytest.mark.parametrize('function', (random_melody_generator.main, random_melody_generator.compose_midi_file,
+                                      random_melody_generator.generate_bytes))
+def test_random_options_are_chosen_per_call(function):
+    parameters = inspect.signature(function).parameters
+    assert all(parameters[option].default is None for option in RANDOM_OPTIONS)
+
+
+def test_command_line_chooses_per_run(tmp_path):
+    midis = []
+    for run in range(2):
+        directory = tmp_path / str(run)
+        directory.mkdir()
+        run_python(random_melody_generator.__file__, '-p', str(directory), '-s', '5')
+        midis.append((directory / 'RandoMMelody.mid').read_bytes())
+
+    assert midis[0] == midis[1] == random_melody_generator.generate_bytes(seed=5)
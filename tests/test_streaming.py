@@ -0,0 +1,107 @@
+import io  # Writing the streams to memory
+import pytest  # Parametrizing the tests
+from itertools import islice  # Taking the start of the endless streams
+
+from random_melody_module import random_melody_generator
+
+__author__ = 'Dvir Alafi'
+
+"""
+
+        Streaming Tests
+
+The lazy streams must yield the events of the composed files - the notes and the pitch bends, merged in time
+order - and the MIDI stream must encode them, whether it ends or not.
+
+    python -m pytest tests
+
+"""
+
+# Constants:
+
+LENGTHS = (4, 16, 32, 128)  # Multiples of the 4 chords, so the progression doesn't repeat
+SEEDS = range(5)
+STREAM_OPTIONS = ({}, {'chord_aware': True}, {'chord_extension': '7th', 'voice_leading': True},
+                  {'melody_register': 'melody', 'chords_register': 'chords'})
+
+
+# Functions:
+
+
+def get_stream_notes(events):
+    return sorted((event[0], event[2], event[3], event[4]) for event in events
+                  if event[1] == random_melody_generator.NOTE_EVENT)
+
+
+def get_stream_bends(events):
+    return sorted((event[0], event[2], event[3]) for event in events
+                  if event[1] == random_melody_generator.PITCH_BEND_EVENT)
+
+
+@pytest.mark.parametrize('melody_length', LENGTHS)
+@pytest.mark.parametrize('options', STREAM_OPTIONS)
+def test_stream_matches_the_composed_file(melody_length, options):
+    for seed in SEEDS:
+        events = list(random_melody_generator.iter_melody_events(
+            'major', 'D', 'pop', melody_length, melody_length // 4, seed=seed, **options))
+        note_events = random_melody_generator.compose_note_events('major', 'D', 'pop', melody_length, seed=seed,
+                                                                  **options)
+
+        composed_notes = sorted((note.start, note.channel, note.pitch, note.duration) for note in note_events)
+        stream_notes = get_stream_notes(events)
+
+        assert [event[0] for event in events] == sorted(event[0] for event in events)
+        # A triplet can run past the end of the melody, where the progression of the stream repeats - so a chord
+        # aware note there can get another pitch:
+        assert [note for note in stream_notes if note[0] < melody_length] == \
+            [note for note in composed_notes if note[0] < melody_length]
+        assert [(start, channel, duration) for start, channel, _, duration in stream_notes] == \
+            [(start, channel, duration) for start, channel, _, duration in composed_notes]
+        assert get_stream_bends(events) == sorted((bend.time, bend.channel, bend.value)
+                                                  for bend in note_events.pitch_bends())
+
+
+@pytest.mark.parametrize('melody_length', LENGTHS)
+def test_melody_stream_matches_the_engine(melody_length):
+    scale_notes = random_melody_generator.get_scale_notes('A', 'minor')
+    for seed in SEEDS:
+        note_events = random_melody_generator.NoteEvents()
+        random_melody_generator.generate_random_melody(melody_length, note_events, 0, scale_notes,
+                                                       random_melody_generator.get_random_generator(seed))
+        events = random_melody_generator.iter_random_melody(scale_notes, melody_length,
+                                                            random_melody_generator.get_random_generator(seed))
+
+        assert get_stream_notes(events) == sorted((note.start, note.channel, note.pitch, note.duration)
+                                                  for note in note_events)
+
+
+def test_endless_stream():
+    chord_duration = 2
+    events = list(islice(random_melody_generator.iter_melody_events(chord_duration=chord_duration, seed=1), 5000))
+
+    assert [event[0] for event in events] == sorted(event[0] for event in events)
+    chords = {}  # time -> the pitches of the chord
+    for event in events:
+        if event[1] == random_melody_generator.NOTE_EVENT and event[2] == 1:
+            chords.setdefault(event[0], []).append(event[3])
+    chords_times = sorted(chords)[:-1]  # The last chord may be cut by islice
+    assert chords_times == list(range(0, chord_duration * len(chords_times), chord_duration))
+    # The progression of 4 chords repeats:
+    assert all(chords[time] == chords[time % (4 * chord_duration)] for time in chords_times)
+
+
+@pytest.mark.parametrize('chunk_size', (1, 64, random_melody_generator.STREAM_CHUNK_SIZE))
+def test_midi_stream(chunk_size):
+    options = dict(scale_type='major', scale_key='D', chords_atmosphere='pop', melody_length=32, seed=2)
+    track_data = b''.join(random_melody_generator.iter_midi_stream(
+        random_melody_generator.iter_melody_events(chord_duration=8, **options), chunk_size=chunk_size))
+    midi_file = io.BytesIO()
+    written_bytes = random_melody_generator.write_midi_stream(
+        random_melody_generator.iter_melody_events(chord_duration=8, **options), midi_file)
+
+    assert midi_file.getvalue().endswith(track_data) and written_bytes == len(midi_file.getvalue())
+
+    note_events = random_melody_generator.read_midi_file(midi_file.getvalue())
+    composed_note_events = random_melody_generator.compose_note_events(**options)
+    assert sorted((note.start, note.channel, note.pitch, note.duration) for note in note_events) == \
+        sorted((note.start, note.channel, note.pitch, note.duration) for note in composed_note_events)